@@ -0,0 +1,302 @@
+"""Локальный сервер с протоколом Redis (RESP2/RESP3) для тестов и нагрузочных запусков с STATE_BACKEND=redis.
+
+Хранит данные в памяти и поддерживает только команды, которые использует приложение:
+строки и множества со временем жизни, MGET, SCAN и транзакции WATCH/MULTI/EXEC.
+
+    python -m bench.fake_redis --port 6390
+"""
+from typing import Dict, List, Optional, Set, Union
+import argparse
+import fnmatch
+import asyncio
+import time
+
+Value = Union[bytes, Set[bytes]]
+
+
+class _Error(Exception):
+    pass
+
+
+class FakeRedis:
+    """Данные сервера; команды выполняются в одном event loop и потому атомарны"""
+
+    def __init__(self):
+        self._data: Dict[bytes, Value] = {}
+        self._expires: Dict[bytes, float] = {}
+        self._versions: Dict[bytes, int] = {}
+
+    def _touch(self, key: bytes) -> None:
+        self._versions[key] = self._versions.get(key, 0) + 1
+
+    def _lookup(self, key: bytes) -> Optional[Value]:
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._remove(key)
+        return self._data.get(key)
+
+    def _remove(self, key: bytes) -> bool:
+        self._expires.pop(key, None)
+        if self._data.pop(key, None) is None:
+            return False
+        self._touch(key)
+        return True
+
+    def version(self, key: bytes) -> int:
+        self._lookup(key)
+        return self._versions.get(key, 0)
+
+    def _string(self, key: bytes) -> Optional[bytes]:
+        value = self._lookup(key)
+        if value is not None and not isinstance(value, bytes):
+            raise _Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def execute(self, args: List[bytes]):
+        command = args[0].upper().decode()
+        handler = getattr(self, f"cmd_{command.lower()}", None)
+        if handler is None:
+            raise _Error(f"ERR unknown command '{command}'")
+        return handler(*args[1:])
+
+    # --- команды ---
+
+    def cmd_ping(self, *args):
+        return args[0] if args else "PONG"
+
+    def cmd_echo(self, message):
+        return message
+
+    def cmd_client(self, *args):
+        return "OK"
+
+    def cmd_select(self, db):
+        return "OK"
+
+    def cmd_get(self, key):
+        return self._string(key)
+
+    def cmd_mget(self, *keys):
+        return [self._lookup(key) if isinstance(self._lookup(key), bytes) else None for key in keys]
+
+    def cmd_set(self, key, value, *options):
+        ttl = None
+        only_new = only_existing = False
+        options = [option.upper() for option in options]
+        index = 0
+        while index < len(options):
+            option = options[index]
+            if option in (b"EX", b"PX"):
+                ttl = float(options[index + 1]) / (1 if option == b"EX" else 1000)
+                index += 1
+            elif option == b"NX":
+                only_new = True
+            elif option == b"XX":
+                only_existing = True
+            else:
+                raise _Error("ERR syntax error")
+            index += 1
+        exists = self._lookup(key) is not None
+        if (only_new and exists) or (only_existing and not exists):
+            return None
+        self._data[key] = value
+        self._expires.pop(key, None)
+        if ttl is not None:
+            self._expires[key] = time.monotonic() + ttl
+        self._touch(key)
+        return "OK"
+
+    def cmd_del(self, *keys):
+        return sum(self._remove(key) for key in keys)
+
+    def cmd_exists(self, *keys):
+        return sum(self._lookup(key) is not None for key in keys)
+
+    def cmd_pexpire(self, key, milliseconds):
+        if self._lookup(key) is None:
+            return 0
+        self._expires[key] = time.monotonic() + int(milliseconds) / 1000
+        self._touch(key)
+        return 1
+
+    def cmd_expire(self, key, seconds):
+        return self.cmd_pexpire(key, int(seconds) * 1000)
+
+    def cmd_pttl(self, key):
+        if self._lookup(key) is None:
+            return -2
+        expires = self._expires.get(key)
+        return -1 if expires is None else int((expires - time.monotonic()) * 1000)
+
+    def cmd_sadd(self, key, *members):
+        value = self._lookup(key)
+        if value is None:
+            value = self._data[key] = set()
+        elif not isinstance(value, set):
+            raise _Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+        added = len(set(members) - value)
+        value.update(members)
+        self._touch(key)
+        return added
+
+    def cmd_smembers(self, key):
+        value = self._lookup(key)
+        if value is not None and not isinstance(value, set):
+            raise _Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return sorted(value or ())
+
+    def cmd_keys(self, pattern):
+        return [key for key in list(self._data) if self._lookup(key) is not None
+                and fnmatch.fnmatchcase(key.decode("utf-8", "replace"), pattern.decode())]
+
+    def cmd_scan(self, cursor, *options):
+        pattern = b"*"
+        for index in range(0, len(options) - 1, 2):
+            if options[index].upper() == b"MATCH":
+                pattern = options[index + 1]
+        return [b"0", self.cmd_keys(pattern)]
+
+    def cmd_flushdb(self, *args):
+        for key in list(self._data):
+            self._remove(key)
+        return "OK"
+
+    cmd_flushall = cmd_flushdb
+
+
+_NULL_ARRAY = object()
+
+
+def _encode(value, protocol: int = 2) -> bytes:
+    if value is None or value is _NULL_ARRAY:
+        if protocol == 3:
+            return b"_\r\n"
+        return b"$-1\r\n" if value is None else b"*-1\r\n"
+    if isinstance(value, _Error):
+        return b"-" + str(value).encode() + b"\r\n"
+    if isinstance(value, str):
+        return b"+" + value.encode() + b"\r\n"
+    if isinstance(value, bool) or isinstance(value, int):
+        return b":" + str(int(value)).encode() + b"\r\n"
+    if isinstance(value, bytes):
+        return b"$" + str(len(value)).encode() + b"\r\n" + value + b"\r\n"
+    if isinstance(value, list):
+        return b"*" + str(len(value)).encode() + b"\r\n" + b"".join(_encode(item, protocol) for item in value)
+    if isinstance(value, dict):
+        return b"%" + str(len(value)).encode() + b"\r\n" + b"".join(
+            _encode(key, protocol) + _encode(item, protocol) for key, item in value.items()
+        )
+    raise TypeError(type(value))
+
+
+async def _read_command(reader: asyncio.StreamReader) -> Optional[List[bytes]]:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        return line.strip().split()
+    args = []
+    for _ in range(int(line[1:])):
+        header = await reader.readline()
+        size = int(header[1:])
+        args.append((await reader.readexactly(size + 2))[:-2])
+    return args
+
+
+class _Connection:
+    """Состояние соединения: отслеживаемые ключи и очередь команд транзакции"""
+
+    def __init__(self, server: FakeRedis):
+        self.server = server
+        self.watched: Dict[bytes, int] = {}
+        self.queue: Optional[List[List[bytes]]] = None
+        self.protocol = 2
+
+    def handle(self, args: List[bytes]):
+        command = args[0].upper()
+        if command == b"HELLO":
+            if len(args) > 1:
+                if args[1] not in (b"2", b"3"):
+                    return _Error("NOPROTO unsupported protocol version")
+                self.protocol = int(args[1])
+            return {b"server": b"redis", b"version": b"7.0.0", b"proto": self.protocol, b"mode": b"standalone"}
+        if command == b"MULTI":
+            if self.queue is not None:
+                return _Error("ERR MULTI calls can not be nested")
+            self.queue = []
+            return "OK"
+        if command == b"DISCARD":
+            self.queue = None
+            self.watched = {}
+            return "OK"
+        if command == b"EXEC":
+            if self.queue is None:
+                return _Error("ERR EXEC without MULTI")
+            queue, self.queue = self.queue, None
+            changed = any(self.server.version(key) != version for key, version in self.watched.items())
+            self.watched = {}
+            if changed:
+                return _NULL_ARRAY
+            return [self._run(args) for args in queue]
+        if command == b"WATCH":
+            for key in args[1:]:
+                self.watched[key] = self.server.version(key)
+            return "OK"
+        if command == b"UNWATCH":
+            self.watched = {}
+            return "OK"
+        if self.queue is not None:
+            self.queue.append(args)
+            return "QUEUED"
+        return self._run(args)
+
+    def _run(self, args: List[bytes]):
+        try:
+            return self.server.execute(args)
+        except _Error as err:
+            return err
+        except (ValueError, TypeError, IndexError):
+            return _Error("ERR wrong number or type of arguments")
+
+
+async def start_fake_redis(host: str = "127.0.0.1", port: int = 0,
+                           server: Optional[FakeRedis] = None) -> asyncio.AbstractServer:
+    """Запускает сервер в текущем event loop; порт — server.sockets[0].getsockname()[1]"""
+    data = server or FakeRedis()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connection = _Connection(data)
+        try:
+            while True:
+                args = await _read_command(reader)
+                if args is None:
+                    break
+                if not args:
+                    continue
+                result = connection.handle(args)
+                writer.write(_encode(result, connection.protocol))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Сервер с протоколом Redis в памяти")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args(argv)
+
+    async def serve() -> None:
+        server = await start_fake_redis(args.host, args.port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
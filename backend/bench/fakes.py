@@ -0,0 +1,183 @@
+"""Локальные заглушки Gemini и health-diet.ru для нагрузочного тестирования.
+
+Запуск отдельно (обычно запускается из bench.run):
+
+    python -m bench.fakes --gemini-port 9001 --health-port 9002 --gemini-latency 800
+"""
+from fastapi import FastAPI, Response, Form
+from fastapi.responses import StreamingResponse
+from dataclasses import dataclass
+from typing import List, Optional
+import argparse
+import asyncio
+import hashlib
+import random
+import math
+import json
+
+SUCCESS_ANSWER = {
+    "status": "success",
+    "food_items": {
+        "Овсяная каша": {
+            "proteins": 12.5, "fats": 6.1, "carbohydrates": 54.0, "water": 120.0, "weight": 250, "benefit_score": 4.5
+        },
+        "Банан": {
+            "proteins": 1.5, "fats": 0.3, "carbohydrates": 22.8, "water": 74.0, "weight": 120, "benefit_score": 4.0
+        }
+    }
+}
+
+# обрезанный ответ, который не разбирается как JSON
+MALFORMED_ANSWER = '```json\n{"status": "success", "food_items": {"Овсяная каша": {"proteins": 12.5, "fats":'
+
+
+@dataclass
+class Latency:
+    """Логнормальное распределение задержки: медиана и разброс (sigma)"""
+    median_ms: float = 0.0
+    sigma: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        """Задержка в секундах"""
+        if self.median_ms <= 0:
+            return 0.0
+        return self.median_ms * math.exp(self.sigma * rng.gauss(0.0, 1.0)) / 1000
+
+
+def gemini_response(text: str) -> dict:
+    """Тело ответа generateContent с одним вариантом"""
+    return {
+        "candidates": [{
+            "content": {"role": "model", "parts": [{"text": text}]},
+            "finishReason": "STOP",
+            "index": 0
+        }],
+        "usageMetadata": {"promptTokenCount": 300, "candidatesTokenCount": 80, "totalTokenCount": 380}
+    }
+
+
+def split_answer(text: str, parts: int) -> List[str]:
+    """Делит текст ответа на части потоковой генерации"""
+    size = max(1, math.ceil(len(text) / parts))
+    return [text[index:index + size] for index in range(0, len(text), size)]
+
+
+def create_gemini_app(latency: Latency = Latency(), quota_rate: float = 0.0, malformed_rate: float = 0.0,
+                      seed: Optional[int] = None, stream_parts: int = 4) -> FastAPI:
+    """Заглушка Gemini generateContent и streamGenerateContent: задержка, ответы 429 и битый JSON с заданной долей.
+
+    В потоковом режиме задержка распределяется между stream_parts частями ответа.
+    """
+    app = FastAPI()
+    rng = random.Random(seed)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    @app.post("/{version}/models/{model_action}")
+    async def generate_content(version: str, model_action: str):
+        model, _, action = model_action.partition(":")
+        if action not in ("generateContent", "streamGenerateContent"):
+            return Response(status_code=404)
+        delay = latency.sample(rng)
+        stream = action == "streamGenerateContent"
+        if not stream:
+            await asyncio.sleep(delay)
+        if rng.random() < quota_rate:
+            return Response(
+                json.dumps({"error": {"code": 429, "message": f"Quota exceeded for {model}",
+                                      "status": "RESOURCE_EXHAUSTED"}}),
+                status_code=429,
+                media_type="application/json"
+            )
+        text = MALFORMED_ANSWER if rng.random() < malformed_rate else json.dumps(SUCCESS_ANSWER, ensure_ascii=False)
+        if not stream:
+            return gemini_response(text)
+
+        parts = split_answer(text, stream_parts)
+
+        async def events():
+            for part in parts:
+                await asyncio.sleep(delay / len(parts))
+                yield f"data: {json.dumps(gemini_response(part), ensure_ascii=False)}\r\n\r\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def fake_foods(query: str, count: int = 5) -> List[dict]:
+    """Детерминированный список продуктов: несколько записей с названием запроса и одна посторонняя"""
+    seed = int.from_bytes(hashlib.sha256(query.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    foods = []
+    for _ in range(count):
+        proteins, fats, carbohydrates = (round(rng.uniform(0, 30), 1) for _ in range(3))
+        calories = round(proteins * 4 + fats * 9 + carbohydrates * 4)
+        foods.append({"name": query, "info": f"{calories} ккал, Б {proteins}, Ж {fats}, У {carbohydrates}"})
+    foods.append({"name": f"{query} с добавками", "info": "100 ккал, Б 1.0, Ж 1.0, У 20.0"})
+    return foods
+
+
+def create_health_diet_app(latency: Latency = Latency(), not_found_rate: float = 0.0,
+                           seed: Optional[int] = None) -> FastAPI:
+    """Заглушка health-diet.ru FoodSearch"""
+    app = FastAPI()
+    rng = random.Random(seed)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    @app.post("/api3/Food/FoodSearch")
+    async def food_search(query: str = Form("")):
+        await asyncio.sleep(latency.sample(rng))
+        foods = [] if rng.random() < not_found_rate else fake_foods(query)
+        return {"result": {"foods": foods}}
+
+    return app
+
+
+async def serve(gemini_app: FastAPI, gemini_port: int, health_app: FastAPI, health_port: int) -> None:
+    """Запускает обе заглушки в одном event loop"""
+    import uvicorn
+
+    servers = [
+        uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+        for app, port in ((gemini_app, gemini_port), (health_app, health_port))
+    ]
+    await asyncio.gather(*(server.serve() for server in servers))
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group("заглушки")
+    group.add_argument("--gemini-latency", type=float, default=800.0, help="медиана задержки Gemini, мс")
+    group.add_argument("--gemini-latency-sigma", type=float, default=0.4, help="разброс задержки Gemini (lognormal)")
+    group.add_argument("--gemini-quota-rate", type=float, default=0.0, help="доля ответов 429")
+    group.add_argument("--gemini-malformed-rate", type=float, default=0.0, help="доля ответов с битым JSON")
+    group.add_argument("--search-latency", type=float, default=150.0, help="медиана задержки health-diet, мс")
+    group.add_argument("--search-latency-sigma", type=float, default=0.3)
+    group.add_argument("--search-not-found-rate", type=float, default=0.0, help="доля пустых ответов поиска")
+    group.add_argument("--seed", type=int, default=None)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Заглушки Gemini и health-diet.ru")
+    parser.add_argument("--gemini-port", type=int, required=True)
+    parser.add_argument("--health-port", type=int, required=True)
+    add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    gemini_app = create_gemini_app(
+        Latency(args.gemini_latency, args.gemini_latency_sigma),
+        args.gemini_quota_rate, args.gemini_malformed_rate, args.seed
+    )
+    health_app = create_health_diet_app(
+        Latency(args.search_latency, args.search_latency_sigma), args.search_not_found_rate, args.seed
+    )
+    asyncio.run(serve(gemini_app, args.gemini_port, health_app, args.health_port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+"""Нагрузочное тестирование /analyze/ и /search/ на локальных заглушках Gemini и health-diet.ru.
+
+Запускает заглушки и приложение в отдельных процессах, нагружает эндпоинты
+заданным числом параллельных клиентов и сохраняет пропускную способность,
+перцентили задержки и долю ошибок в JSON для сравнения между коммитами:
+
+    python -m bench.run --concurrency 32 --duration 30 --output bench-results.json
+    python -m bench.run --gemini-quota-rate 0.2 --compare bench-results.json
+    python -m bench.run --workers 4 --state redis --cache
+"""
+from datetime import datetime, timezone
+from typing import List, Optional, Callable, Awaitable, Tuple, Dict
+from pathlib import Path
+from io import BytesIO
+from PIL import Image
+import subprocess
+import tempfile
+import argparse
+import platform
+import asyncio
+import socket
+import json
+import time
+import sys
+import os
+
+import httpx
+
+from bench.fakes import add_arguments as add_fake_arguments
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+IMAGE_DIR = BACKEND_DIR / "src" / "image"
+
+SEARCH_QUERIES = [
+    "яблоко", "банан", "гречка", "овсянка", "куриная грудка", "творог", "рис", "картофель",
+    "свинина", "говядина", "молоко", "кефир", "сыр", "хлеб", "яйцо", "морковь"
+]
+
+# исход запроса: HTTP-статус, для ответа 200 — ещё и статус из тела
+Sample = Tuple[float, str]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def load_images(directory: Path = IMAGE_DIR) -> List[Tuple[str, bytes, str]]:
+    """Примеры изображений; форматы, которые не принимает /analyze/, перекодируются в JPEG"""
+    images = []
+    for path in sorted(directory.iterdir()):
+        suffix = path.suffix.lower()
+        if suffix in (".jpg", ".jpeg"):
+            images.append((path.name, path.read_bytes(), "image/jpeg"))
+        elif suffix == ".png":
+            images.append((path.name, path.read_bytes(), "image/png"))
+        elif suffix == ".webp":
+            images.append((path.name, path.read_bytes(), "image/webp"))
+        elif suffix in (".bmp", ".gif"):
+            buf = BytesIO()
+            with Image.open(path) as image:
+                image.convert("RGB").save(buf, format="JPEG", quality=90)
+            images.append((path.stem + ".jpg", buf.getvalue(), "image/jpeg"))
+    return images
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль q (0..100) отсортированного списка с линейной интерполяцией"""
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(samples: List[Sample], elapsed: float) -> dict:
+    """Пропускная способность, задержки (мс) и доля ошибок"""
+    latencies = sorted(latency * 1000 for latency, _ in samples)
+    outcomes: Dict[str, int] = {}
+    for _, outcome in samples:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    errors = sum(count for outcome, count in outcomes.items() if not is_success(outcome))
+    return {
+        "requests": len(samples),
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed > 0 else 0.0,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies), 2) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "max": round(latencies[-1], 2) if latencies else 0.0,
+        },
+        "outcomes": dict(sorted(outcomes.items())),
+    }
+
+
+def is_success(outcome: str) -> bool:
+    return outcome in ("200:success", "200:not_found", "200:danger")
+
+
+def outcome_of(response: httpx.Response) -> str:
+    if response.status_code != 200:
+        return str(response.status_code)
+    try:
+        return f"200:{response.json().get('status')}"
+    except ValueError:
+        return "200:invalid"
+
+
+RequestFactory = Callable[[httpx.AsyncClient, int, int], Awaitable[httpx.Response]]
+
+
+def analyze_request(images: List[Tuple[str, bytes, str]]) -> RequestFactory:
+    async def send(client: httpx.AsyncClient, worker: int, number: int) -> httpx.Response:
+        name, data, mime = images[number % len(images)]
+        return await client.post(
+            "/analyze/", files={"file": (name, data, mime)}, headers={"X-Device-Id": f"bench-{worker}"}
+        )
+    return send
+
+
+def search_request(unique: bool) -> RequestFactory:
+    async def send(client: httpx.AsyncClient, worker: int, number: int) -> httpx.Response:
+        query = SEARCH_QUERIES[number % len(SEARCH_QUERIES)]
+        if unique:
+            # уникальный запрос проходит мимо кешей до заглушки health-diet.ru
+            query = f"{query} {number}"
+        return await client.get("/search/", params={"food_name": query}, headers={"X-Device-Id": f"bench-{worker}"})
+    return send
+
+
+async def run_load(base_url: str, send: RequestFactory, concurrency: int, duration: float,
+                   total: Optional[int] = None, warmup: int = 0) -> dict:
+    """Замкнутый цикл: concurrency клиентов шлют запросы, пока не истечёт время или не будет отправлено total"""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120.0) as client:
+        for number in range(warmup):
+            await send(client, 0, number)
+
+        samples: List[Sample] = []
+        counter = iter(range(warmup, sys.maxsize))
+        started = time.perf_counter()
+        deadline = started + duration
+
+        async def worker(index: int) -> None:
+            while time.perf_counter() < deadline:
+                number = next(counter)
+                if total is not None and number - warmup >= total:
+                    return
+                request_started = time.perf_counter()
+                try:
+                    outcome = outcome_of(await send(client, index, number))
+                except httpx.HTTPError as err:
+                    outcome = f"exception:{type(err).__name__}"
+                samples.append((time.perf_counter() - request_started, outcome))
+
+        await asyncio.gather(*(worker(index) for index in range(concurrency)))
+        return summarize(samples, time.perf_counter() - started)
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Процесс завершился с кодом {process.returncode}: {url}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Сервер не ответил за {timeout:.0f} с: {url}")
+
+
+def wait_port(port: int, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    """Ждёт, пока процесс начнёт принимать TCP-соединения"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Процесс завершился с кодом {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1.0).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Порт {port} не открылся за {timeout:.0f} с")
+
+
+def app_environment(args: argparse.Namespace, gemini_port: int, health_port: int, workdir: str,
+                    redis_port: Optional[int] = None) -> Dict[str, str]:
+    """Окружение приложения: внешние сервисы — заглушки, ограничения частоты сняты"""
+    env = dict(os.environ)
+    env.update({
+        "GEMINI_BASE_URL": f"http://127.0.0.1:{gemini_port}",
+        "HEALTH_DIET_URL": f"http://127.0.0.1:{health_port}/api3/Food/FoodSearch",
+        "NUTRITION_DB_PATH": os.path.join(workdir, "nutrition.db"),
+        "RATE_LIMIT_RATE": "1000000",
+        "RATE_LIMIT_BURST": "1000000",
+        # все клиенты нагрузки приходят с одного адреса и различаются по X-Device-Id
+        "TRUST_CLIENT_ID": "true",
+        "LOG_FILE": "",
+        "LOG_LEVEL": "WARNING",
+        "STATE_BACKEND": args.state,
+        "STATE_SQLITE_PATH": os.path.join(workdir, "state.db"),
+    })
+    if redis_port is not None:
+        env["STATE_REDIS_URL"] = f"redis://127.0.0.1:{redis_port}/0"
+    if not args.cache:
+        # без кешей каждый запрос проходит весь путь до заглушек
+        env.update({
+            "RESULT_CACHE_TTL": "0",
+            "SEARCH_CACHE_TTL": "0",
+            "SEARCH_CACHE_STALE_TTL": "0",
+            "SEARCH_CACHE_NEGATIVE_TTL": "0",
+        })
+    for item in args.app_env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    return env
+
+
+def git_revision() -> dict:
+    def git(*command: str) -> str:
+        return subprocess.run(
+            ["git", *command], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+
+    try:
+        return {"commit": git("rev-parse", "HEAD"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def compare(current: dict, previous: dict) -> str:
+    """Таблица изменений пропускной способности и перцентилей относительно прошлого запуска"""
+    lines = [f"{'endpoint':<10} {'metric':<16} {'before':>10} {'after':>10} {'change':>8}"]
+    for endpoint, result in current["results"].items():
+        before = previous.get("results", {}).get(endpoint)
+        if before is None:
+            continue
+        rows = [("throughput_rps", before["throughput_rps"], result["throughput_rps"]),
+                ("error_rate", before["error_rate"], result["error_rate"])]
+        rows += [(f"latency_{key}_ms", before["latency_ms"][key], result["latency_ms"][key])
+                 for key in ("p50", "p95", "p99")]
+        for metric, old, new in rows:
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "-"
+            lines.append(f"{endpoint:<10} {metric:<16} {old:>10} {new:>10} {change:>8}")
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочное тестирование Food Analysis API")
+    parser.add_argument("--endpoints", nargs="+", choices=("analyze", "search"), default=["analyze", "search"])
+    parser.add_argument("--concurrency", type=int, default=16, help="параллельных клиентов")
+    parser.add_argument("--duration", type=float, default=20.0, help="длительность на эндпоинт, секунды")
+    parser.add_argument("--requests", type=int, default=None, help="ограничение числа запросов на эндпоинт")
+    parser.add_argument("--warmup", type=int, default=5, help="запросов прогрева, не входят в результат")
+    parser.add_argument("--workers", type=int, default=1, help="процессов uvicorn приложения")
+    parser.add_argument("--cache", action="store_true", help="не отключать кеши результатов")
+    parser.add_argument("--state", choices=("memory", "sqlite", "redis"), default="memory",
+                        help="общее состояние воркеров; redis — локальный сервер из bench.fake_redis")
+    parser.add_argument("--app-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="дополнительные переменные окружения приложения")
+    parser.add_argument("--output", default="bench-results.json")
+    parser.add_argument("--compare", default=None, help="JSON прошлого запуска для сравнения")
+    add_fake_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def fake_arguments(args: argparse.Namespace) -> List[str]:
+    result = [
+        "--gemini-latency", str(args.gemini_latency), "--gemini-latency-sigma", str(args.gemini_latency_sigma),
+        "--gemini-quota-rate", str(args.gemini_quota_rate), "--gemini-malformed-rate", str(args.gemini_malformed_rate),
+        "--search-latency", str(args.search_latency), "--search-latency-sigma", str(args.search_latency_sigma),
+        "--search-not-found-rate", str(args.search_not_found_rate),
+    ]
+    if args.seed is not None:
+        result += ["--seed", str(args.seed)]
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> dict:
+    args = parse_args(argv)
+    gemini_port, health_port, app_port = free_port(), free_port(), free_port()
+    redis_port = free_port() if args.state == "redis" else None
+    processes: List[subprocess.Popen] = []
+
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            fakes = subprocess.Popen(
+                [sys.executable, "-m", "bench.fakes", "--gemini-port", str(gemini_port),
+                 "--health-port", str(health_port), *fake_arguments(args)],
+                cwd=BACKEND_DIR
+            )
+            processes.append(fakes)
+            wait_ready(f"http://127.0.0.1:{gemini_port}/health", fakes)
+            wait_ready(f"http://127.0.0.1:{health_port}/health", fakes)
+            if redis_port is not None:
+                redis = subprocess.Popen(
+                    [sys.executable, "-m", "bench.fake_redis", "--port", str(redis_port)], cwd=BACKEND_DIR
+                )
+                processes.append(redis)
+                wait_port(redis_port, redis)
+
+            app = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "src.api.api:app", "--host", "127.0.0.1", "--port", str(app_port),
+                 "--workers", str(args.workers), "--no-access-log", "--log-level", "warning"],
+                cwd=BACKEND_DIR, env=app_environment(args, gemini_port, health_port, workdir, redis_port)
+            )
+            processes.append(app)
+            base_url = f"http://127.0.0.1:{app_port}"
+            wait_ready(f"{base_url}/ready", app)
+
+            requests = {
+                "analyze": analyze_request(load_images()),
+                "search": search_request(unique=not args.cache),
+            }
+            results = {}
+            for endpoint in args.endpoints:
+                results[endpoint] = asyncio.run(run_load(
+                    base_url, requests[endpoint], args.concurrency, args.duration, args.requests, args.warmup
+                ))
+                print(f"{endpoint}: {json.dumps(results[endpoint], ensure_ascii=False)}")
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    config = {key: value for key, value in vars(args).items() if key not in ("output", "compare")}
+    report = {
+        "meta": {
+            **git_revision(),
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": config,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            print(compare(report, json.load(file)))
+    return report
+
+
+if __name__ == "__main__":
+    main()
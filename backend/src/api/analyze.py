@@ -1,180 +1,565 @@
-from google.genai import Client, types
-from typing import Union, Literal
-from statistics import median
+from pydantic import BaseModel, ValidationError
+from typing import Union, Literal, Optional, Dict, List, Tuple, AsyncIterator, TYPE_CHECKING
 from PIL import Image
-import requests
+import asyncio
+import httpx
 import logging
 import json
+import time
 
-from src.env import API_KEY, is_production, work_models
+from src.api.config import (
+    GEMINI_MAX_CONCURRENCY, HEALTH_DIET_URL, ANALYZE_TIMEOUT, SEARCH_MAX_ALTERNATIVES, SEARCH_DEADLINE
+)
+from src.api.deadline import Deadline
+from src.api.model_router import model_router, classify_error
+from src.api.clients import get_http_client, get_gemini_client
+from src.api.nutrition_db import nutrition_index, parse_food_info, median_nutrients
+from src.api.cache import normalize_query
+from src.api.matching import NameMatcher
+from src.api.suggest import suggest_index
+from src.api.preprocess import PreparedImage, size_error
+from src.api.metrics import STAGE_SECONDS, GEMINI_REQUEST_SECONDS, UPSTREAM_RATE_LIMITED, IN_FLIGHT
+from src.api.schemas import FoodItem, ErrorResponse, food_response_adapter
+from src.env import API_KEY, is_production
+
+if TYPE_CHECKING:
+    from google.genai import types
 
 logger = logging.getLogger("api.analyze")
-current_model_index = 0
+
+# Промпт и настройки генерации одинаковы для всех запросов
+PROMPT = """Ты — эксперт по диетологии. Проанализируй фото и верни ТОЛЬКО JSON. Сравнивай с данными из USDA, Роспотребнадзор, Open Food Facts.
+
+            СТРУКТУРА JSON:
+            1. Еда найдена: {"status": "success", "food_items": {"название": {"proteins": float, "fats": float, "carbohydrates": float, "water": float, "weight": int, "benefit_score": float}}}
+            2. Не еда: {"status": "not_found", "message": "Причина"}
+            3. Опасно (яд/испорчено): {"status": "danger", "message": "Почему опасно", "food_items": {...}}
+
+            ПРАВИЛА:
+            - Ответ ТОЛЬКО в формате JSON без markdown и комментариев.
+            - Язык: РУССКИЙ.
+            - БЖУ: только ДРОБНЫЕ числа (граммы например: 12.5 или 5.0).
+            - Вес: только ЦЕЛЫЕ числа (граммы) на основе визуальной оценки порции.
+            - Benefit_score: от 1.0 до 5.0 Если status=danger, score всегда 0.0.
+            - Составные блюда (суп, салат) — одним объектом.
+            - Все данные считать для уже готового блюда.
+            - Вес оценивай визуально по размеру порции на фото."""
+
+_generate_config: Optional["types.GenerateContentConfig"] = None
+
+
+def get_generate_config() -> "types.GenerateContentConfig":
+    """Настройки генерации; создаются при первом обращении вместе с импортом google.genai"""
+    global _generate_config
+    if _generate_config is None:
+        from google.genai import types
+        _generate_config = types.GenerateContentConfig(
+            temperature=0.1,
+            top_p=0.95,
+            top_k=1,
+            response_mime_type="application/json",
+            # tools=[
+            #     types.Tool(google_search=types.GoogleSearch())
+            # ]
+        )
+    return _generate_config
+
+# глобальное ограничение одновременных запросов к Gemini
+_gemini_semaphore: Optional[asyncio.Semaphore] = None
+_gemini_semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _get_gemini_semaphore() -> asyncio.Semaphore:
+    """Возвращает семафор запросов к Gemini, привязанный к текущему event loop"""
+    global _gemini_semaphore, _gemini_semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _gemini_semaphore is None or _gemini_semaphore_loop is not loop:
+        _gemini_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+        _gemini_semaphore_loop = loop
+    return _gemini_semaphore
 
 
-async def analyze_food_json(name: str) -> Union[Literal[False], dict]:
-    """Проверяет данные с помощью https://health-diet.ru"""
+async def fetch_foods(name: str, deadline: Deadline) -> list:
+    """Запрашивает список продуктов у https://health-diet.ru; запрос отменяется по истечении срока.
+
+    Ошибка источника (ответ не 200 или некорректные данные) поднимает httpx.HTTPError,
+    а не означает "не найдено": такой результат не должен попасть в кеш.
+    """
     params = {
         'query': f'{name}',
         'nutrientDataSourceFilter[]': 'other'
     }
-    url = 'https://health-diet.ru/api3/Food/FoodSearch'
-    response = requests.post(
-        url,
-        data=params,
-        timeout=10
-    )
+    with IN_FLIGHT.track("search_upstream"), STAGE_SECONDS.time("search", "upstream"):
+        response = await deadline.run(get_http_client().post(HEALTH_DIET_URL, data=params))
+    if response.status_code == 429:
+        UPSTREAM_RATE_LIMITED.inc("health-diet", "")
+    if response.status_code != 200:
+        raise httpx.HTTPStatusError(
+            f"health-diet.ru responded with {response.status_code}", request=response.request, response=response
+        )
+    try:
+        return list(response.json().get('result', {}).get('foods', []))
+    except Exception as err:
+        logger.error("Ошибка поиска: %s", err)
+        raise httpx.DecodingError(f"Invalid health-diet.ru response: {err}", request=response.request) from err
+
+
+FoodGroups = Dict[str, Tuple[str, List[dict]]]  # набор слов -> (название, КБЖУ записей)
+
 
-    if response.status_code == 200:
-        data = response.json()
+def group_foods(foods: list) -> FoodGroups:
+    """Группирует продукты источника по набору слов названия; записи с некорректным info пропускаются"""
+    groups: FoodGroups = {}
+    for food in foods:
+        if not isinstance(food, dict):
+            continue
         try:
-            foods = data.get('result', {}).get('foods', [])
-            calories_list = []
-            proteins_list = []
-            fats_list = []
-            carbs_list = []
-
-            for food in foods:
-                food_name = food.get("name", "")
-                if set(name.lower().split()) == set(food_name.lower().split()):
-                    food_cal = food.get("info", "").split(', ')
-                    nutrients = {"calories": 0.0, "proteins": 0.0, "fats": 0.0, "carbohydrates": 0.0}
-                    for f_c in food_cal:
-                        parts = f_c.split()
-                        if not parts:
-                            continue
-                        if f_c.endswith('ккал'):
-                            nutrients["calories"] = float(parts[0])
-                        elif parts[0] == 'Б':
-                            nutrients["proteins"] = float(parts[1])
-                        elif parts[0] == 'Ж':
-                            nutrients["fats"] = float(parts[1])
-                        elif parts[0] == 'У':
-                            nutrients["carbohydrates"] = float(parts[1])
-
-                    calories_list.append(nutrients["calories"])
-                    proteins_list.append(nutrients["proteins"])
-                    fats_list.append(nutrients["fats"])
-                    carbs_list.append(nutrients["carbohydrates"])
-
-            if not calories_list:
-                return False
-
-            return {
-                "calories": round(median(calories_list), 2),
-                "proteins": round(median(proteins_list), 2),
-                "fats": round(median(fats_list), 2),
-                "carbohydrates": round(median(carbs_list), 2),
-                "weight": 100.0
-            }
-
-        except Exception as err:
-            logger.error(f"Ошибка поиска: {err}")
-            return False
+            sample = parse_food_info(food.get("info", ""))
+        except (ValueError, IndexError):
+            continue
+        food_name = food.get("name", "")
+        key = normalize_query(food_name)
+        if key:
+            groups.setdefault(key, (food_name, []))[1].append(sample)
+    return groups
+
+
+def match_foods(name: str, groups: FoodGroups) -> Optional[dict]:
+    """Медианные КБЖУ продукта, лучше всего совпадающего с запросом, и альтернативы.
+
+    Группа, совпадающая с запросом точно, выбирается всегда, иначе — лучшая по нечёткому
+    сопоставлению. Если название отличается от запроса, в результат добавляются
+    matched_name и score, остальные подходящие группы возвращаются в alternatives.
+    """
+    key = normalize_query(name)
+    matches = NameMatcher(groups).rank(name, limit=SEARCH_MAX_ALTERNATIVES + 1)
+    if key in groups:
+        best_key, score = key, 1.0
+        matches = [match for match in matches if match.name != key]
+    elif matches:
+        (best_key, score), matches = matches[0], matches[1:]
     else:
-        return False
+        return None
 
+    result = median_nutrients(groups[best_key][1])
+    if best_key != key:
+        result["matched_name"] = groups[best_key][0]
+        result["score"] = score
+    if matches:
+        result["alternatives"] = [
+            {"food_name": groups[match.name][0], "score": match.score,
+             "nutrition": median_nutrients(groups[match.name][1])}
+            for match in matches[:SEARCH_MAX_ALTERNATIVES]
+        ]
+    return result
 
-async def analyze_food_image(image: Image.Image, api_key: str = API_KEY, test_answer: str = "") -> dict:
-    """Анализирует изображение еды через Gemini API"""
-    global current_model_index
 
-    width, height = image.size
+def _local_lookup(name: str) -> Optional[dict]:
+    """Точное совпадение в локальном индексе, иначе близкое название"""
+    return nutrition_index.lookup(name) or nutrition_index.match(name)
 
-    if width > 2500 or height > 2500:
-        return {
-            "status": "error",
-            "message": "Изображение слишком длинное или слишком широкое"
-        }
-    elif width < 100 or height < 100:
-        return {
-            "status": "error",
-            "message": "Изображение слишком короткое или слишком узкое"
-        }
+
+async def analyze_food_json(name: str, deadline: Optional[Deadline] = None) -> Union[Literal[False], dict]:
+    """Ищет данные в локальном индексе, при промахе — с помощью https://health-diet.ru.
+
+    По истечении срока deadline (по умолчанию SEARCH_DEADLINE) поднимается asyncio.TimeoutError,
+    при ошибке источника — httpx.HTTPError.
+    """
+    if deadline is None:
+        deadline = Deadline(SEARCH_DEADLINE)
+    with STAGE_SECONDS.time("search", "index"):
+        local = await asyncio.to_thread(_local_lookup, name)
+    if local is not None:
+        return local
+
+    foods = await fetch_foods(name, deadline)
 
     try:
-        client = Client(api_key=api_key)
+        with STAGE_SECONDS.time("search", "parse"):
+            groups = group_foods(foods)
+            result = match_foods(name, groups)
     except Exception as err:
-        logger.error(f"Ошибка инициализации клиента: {err}")
-        return {
-            "status": "error",
-            "message": "Ошибка сервиса распознавания фото"
-        }
+        logger.error("Ошибка поиска: %s", err)
+        return False
 
-    prompt = """Ты — эксперт по диетологии. Проанализируй фото и верни ТОЛЬКО JSON. Сравнивай с данными из USDA, Роспотребнадзор, Open Food Facts.
+    # ответ источника пополняет локальный индекс
+    try:
+        await asyncio.to_thread(
+            nutrition_index.add_foods,
+            [(food.get("name", ""), food.get("info", "")) for food in foods if isinstance(food, dict)]
+        )
+    except Exception as err:
+        logger.error("Ошибка записи в локальный индекс: %s", err)
+    # и подсказки поиска; обновление индекса подсказок тоже не занимает event loop
+    await asyncio.to_thread(
+        suggest_index.add_many, [(food_name, median_nutrients(samples)) for food_name, samples in groups.values()]
+    )
 
-            СТРУКТУРА JSON:
-            1. Еда найдена: {"status": "success", "food_items": {"название": {"proteins": float, "fats": float, "carbohydrates": float, "water": float, "weight": int, "benefit_score": float}}}
-            2. Не еда: {"status": "not_found", "message": "Причина"}
-            3. Опасно (яд/испорчено): {"status": "danger", "message": "Почему опасно", "food_items": {...}}
+    return result if result is not None else False
 
-            ПРАВИЛА:
-            - Ответ ТОЛЬКО в формате JSON без markdown и комментариев.
-            - Язык: РУССКИЙ.
-            - БЖУ: только ДРОБНЫЕ числа (граммы например: 12.5 или 5.0).
-            - Вес: только ЦЕЛЫЕ числа (граммы) на основе визуальной оценки порции.
-            - Benefit_score: от 1.0 до 5.0 Если status=danger, score всегда 0.0.
-            - Составные блюда (суп, салат) — одним объектом.
-            - Все данные считать для уже готового блюда.
-            - Вес оценивай визуально по размеру порции на фото."""
 
-    config = types.GenerateContentConfig(
-        temperature=0.1,
-        top_p=0.95,
-        top_k=1,
-        response_mime_type="application/json",
-        # tools=[
-        #     types.Tool(google_search=types.GoogleSearch())
-        # ]
+class ModelsUnavailable(Exception):
+    """Ни одна модель не вернула ответ"""
 
-    )
+    def __init__(self, kind: str):
+        super().__init__(kind)
+        self.kind = kind
+
+
+class InvalidRequest(Exception):
+    """Gemini отклонил запрос как неверный (400): повтор на другой модели не поможет"""
+
+
+_ERROR_MESSAGES = {
+    "quota": "Ограничение лимита",
+    "invalid": "Неверные аргументы",
+}
+
+
+async def _record_failure(model: str, kind: str, started: float) -> None:
+    """Учитывает ошибку модели в роутере и метриках"""
+    if model_router.record_failure(model, kind, time.monotonic() - started):
+        await model_router.push(model)
+    GEMINI_REQUEST_SECONDS.observe(model, kind, value=time.monotonic() - started)
+    if kind == "quota":
+        UPSTREAM_RATE_LIMITED.inc("gemini", model)
+
+
+async def _record_timeout(model: str, started: float, deadline: Deadline) -> None:
+    """Учитывает истечение срока: ошибкой модели оно считается, только если срок
+    ограничен пределом ANALYZE_TIMEOUT, а не коротким сроком запроса клиента"""
+    if deadline.capped:
+        await _record_failure(model, "timeout", started)
+    else:
+        GEMINI_REQUEST_SECONDS.observe(model, "cancelled", value=time.monotonic() - started)
+
+
+async def _record_success(model: str, started: float) -> None:
+    if model_router.record_success(model, time.monotonic() - started):
+        await model_router.push(model)
+    GEMINI_REQUEST_SECONDS.observe(model, "success", value=time.monotonic() - started)
+
+
+def _unavailable(last_kind: Optional[str]) -> ModelsUnavailable:
+    if last_kind is None:
+        last_kind = "quota" if model_router.quota_exhausted() else "unavailable"
+    return ModelsUnavailable(last_kind)
+
+
+async def _generate(client, contents: list, deadline: Deadline) -> str:
+    """Запрашивает ответ у доступных моделей по очереди, пока не кончится время.
+
+    Ошибка одной модели (лимит, сбой) учитывается роутером, и тот же запрос повторяется
+    на следующей модели. Неверный запрос (400) сразу прерывает перебор: InvalidRequest.
+    """
+    last_kind = None
+    await model_router.pull()
+    for model in model_router.candidates():
+        async with _get_gemini_semaphore():
+            remaining = deadline.remaining()
+            if remaining <= 0:
+                break
+            if not model_router.acquire(model):
+                continue
+            started = time.monotonic()
+            try:
+                with IN_FLIGHT.track("gemini"):
+                    response = await asyncio.wait_for(
+                        client.aio.models.generate_content(model=model, contents=contents, config=get_generate_config()),
+                        timeout=remaining
+                    )
+            except asyncio.TimeoutError:
+                await _record_timeout(model, started, deadline)
+                last_kind = "timeout"
+                break
+            except Exception as err:
+                kind = classify_error(err)
+                logger.warning("Ошибка модели %s (%s): %s", model, kind, err)
+                await _record_failure(model, kind, started)
+                if kind == "invalid":
+                    raise InvalidRequest(str(err)) from err
+                last_kind = kind
+                continue
+            finally:
+                model_router.release(model)
+        await _record_success(model, started)
+        return response.text
+
+    raise _unavailable(last_kind)
+
+
+async def _generate_stream(client, contents: list, deadline: Deadline) -> AsyncIterator[str]:
+    """Потоковый вариант _generate: части текста отдаются по мере генерации.
+
+    Следующая модель пробуется, только пока текущая не прислала ни одной части;
+    ошибка после этого прерывает ответ.
+    """
+    last_kind = None
+    await model_router.pull()
+    for model in model_router.candidates():
+        async with _get_gemini_semaphore():
+            remaining = deadline.remaining()
+            if remaining <= 0:
+                break
+            if not model_router.acquire(model):
+                continue
+            started = time.monotonic()
+            received = False
+            try:
+                with IN_FLIGHT.track("gemini"):
+                    stream = await asyncio.wait_for(
+                        client.aio.models.generate_content_stream(model=model, contents=contents, config=get_generate_config()),
+                        timeout=remaining
+                    )
+                    while True:
+                        try:
+                            chunk = await deadline.run(anext(stream))
+                        except StopAsyncIteration:
+                            break
+                        if chunk.text:
+                            received = True
+                            yield chunk.text
+            except asyncio.TimeoutError:
+                await _record_timeout(model, started, deadline)
+                last_kind = "timeout"
+                break
+            except Exception as err:
+                kind = classify_error(err)
+                logger.warning("Ошибка модели %s (%s): %s", model, kind, err)
+                await _record_failure(model, kind, started)
+                if kind == "invalid":
+                    raise InvalidRequest(str(err)) from err
+                if received:
+                    raise
+                last_kind = kind
+                continue
+            finally:
+                model_router.release(model)
+        await _record_success(model, started)
+        return
+
+    raise _unavailable(last_kind)
+
+
+def _extract_json(text: str) -> str:
+    """Вырезает JSON-объект из ответа модели: markdown-ограждения и текст вокруг отбрасываются"""
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end < start:
+        return text
+    return text[start:end + 1]
+
+
+def _salvage(text: str) -> Optional[BaseModel]:
+    """Спасает ответ с частично некорректными продуктами: неверные записи food_items отбрасываются"""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+
+    items = data.get("food_items")
+    if isinstance(items, dict):
+        valid = {}
+        for name, item in items.items():
+            try:
+                valid[name] = FoodItem.model_validate(item)
+            except ValidationError:
+                continue
+        if not valid:
+            return None
+        if len(valid) < len(items):
+            logger.warning("Отброшено продуктов с некорректными данными: %d из %d", len(items) - len(valid), len(items))
+        data["food_items"] = valid
+
+    try:
+        return food_response_adapter.validate_python(data)
+    except ValidationError:
+        return None
+
+
+class FoodItemStream:
+    """Пошаговый разбор JSON ответа модели по мере генерации.
+
+    feed() принимает очередную часть текста и возвращает продукты food_items, объект
+    которых уже закрыт. Разбор продолжается с места остановки; строки и экранирование
+    учитываются, поэтому скобки и кавычки в названиях не сбивают глубину.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string = ""  # последняя закрытая строка (ключ перед значением)
+        self._items_depth: Optional[int] = None  # глубина объекта food_items, пока он открыт
+        self._items_done = False
+        self._entry_start: Optional[int] = None  # начало ключа текущего продукта
+
+    def feed(self, chunk: str) -> List[Tuple[str, FoodItem]]:
+        self.text += chunk
+        text = self.text
+        found = []
+        for position in range(self._position, len(text)):
+            char = text[position]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start:position + 1]
+                continue
+            if char == '"':
+                self._in_string = True
+                self._string_start = position
+                if self._depth == self._items_depth and self._entry_start is None:
+                    self._entry_start = position
+            elif char == ",":
+                if self._depth == self._items_depth:
+                    self._entry_start = None
+            elif char == "{":
+                if self._depth == 1 and not self._items_done and self._last_string == '"food_items"':
+                    self._items_depth = 2
+                self._depth += 1
+            elif char == "}":
+                if self._items_depth is not None:
+                    if self._depth == self._items_depth + 1 and self._entry_start is not None:
+                        found.extend(self._parse_entry(text[self._entry_start:position + 1]))
+                        self._entry_start = None
+                    elif self._depth == self._items_depth:
+                        self._items_depth = None
+                        self._items_done = True
+                self._depth -= 1
+        self._position = len(text)
+        return found
+
+    @staticmethod
+    def _parse_entry(fragment: str) -> List[Tuple[str, FoodItem]]:
+        """Разбирает фрагмент '"название": {...}'; некорректные продукты пропускаются"""
+        try:
+            entries = json.loads("{" + fragment + "}")
+        except ValueError:
+            return []
+        result = []
+        for name, item in entries.items():
+            try:
+                result.append((name, FoodItem.model_validate(item)))
+            except ValidationError:
+                continue
+        return result
+
+
+def parse_food_response(text: str) -> BaseModel:
+    """Разбирает текст модели сразу в модель ответа.
+
+    Обычно JSON проверяется за один проход без промежуточного словаря; если ответ
+    не проходит проверку целиком, сохраняются корректные продукты.
+    """
+    fragment = _extract_json(text)
+    try:
+        return food_response_adapter.validate_json(fragment)
+    except ValidationError:
+        pass
+
+    result = _salvage(fragment)
+    if result is None:
+        logger.error("Ошибка обработки JSON")
+        return ErrorResponse(message="Ошибка формирования ответа")
+    return result
+
+
+def _check_size(image: Union[Image.Image, PreparedImage]) -> Optional[ErrorResponse]:
+    error = size_error(*image.size)
+    return ErrorResponse(message=error) if error is not None else None
+
+
+def _model_contents(image: Union[Image.Image, PreparedImage]) -> list:
+    return [PROMPT, image.to_part() if isinstance(image, PreparedImage) else image]
+
+
+def _gemini_deadline(deadline: Optional[Deadline], timeout: float) -> Deadline:
+    """Срок на все попытки запроса к Gemini: не дольше timeout и не позже срока запроса"""
+    return deadline.limit(timeout) if deadline is not None else Deadline(timeout, capped=True)
+
+
+async def analyze_food_image(image: Union[Image.Image, PreparedImage], api_key: str = API_KEY, test_answer: str = "",
+                             timeout: float = ANALYZE_TIMEOUT, deadline: Optional[Deadline] = None) -> BaseModel:
+    """Анализирует изображение еды через Gemini API и возвращает проверенную модель ответа"""
+    deadline = _gemini_deadline(deadline, timeout)
+    error = _check_size(image)
+    if error is not None:
+        return error
+
+    try:
+        client = get_gemini_client(api_key)
+    except Exception as err:
+        logger.error("Ошибка инициализации клиента: %s", err)
+        return ErrorResponse(message="Ошибка сервиса распознавания фото")
 
     try:
         if test_answer and not is_production:
             text = test_answer
         else:
-            model = work_models[current_model_index % len(work_models)]
-            response = client.models.generate_content(
-                model=model,
-                contents=[prompt, image],
-                config=config
-            )
-            text = response.text
-        text = text.strip()
-        if text.startswith('```json'):
-            text = text[7:]
-        if text.endswith('```'):
-            text = text[:-3]
+            text = await _generate(client, _model_contents(image), deadline)
+
+        with STAGE_SECONDS.time("analyze", "parse"):
+            return parse_food_response(text)
+
+    except InvalidRequest as err:
+        logger.warning("Запрос отклонён как неверный: %s", err)
+        return ErrorResponse(message=_ERROR_MESSAGES["invalid"])
+
+    except ModelsUnavailable as err:
+        logger.error("Ошибка при анализе: все модели недоступны (%s)", err.kind)
+        return ErrorResponse(message=_ERROR_MESSAGES.get(err.kind, "Ошибка при анализе изображения"))
+
+    except Exception as err:
+        logger.error("Ошибка при анализе: %s", err)
+        return ErrorResponse(message="Ошибка при анализе изображения")
 
-        try:
-            data = json.loads(text)
-            return data
 
-        except json.JSONDecodeError:
-            logger.error(f"Ошибка обработки JSON")
-            return {
-                "status": "error",
-                "message": "Ошибка формирования ответа"
-            }
+async def analyze_food_image_stream(image: Union[Image.Image, PreparedImage], api_key: str = API_KEY,
+                                    timeout: float = ANALYZE_TIMEOUT, deadline: Optional[Deadline] = None
+                                    ) -> AsyncIterator[Union[Tuple[str, FoodItem], BaseModel]]:
+    """Потоковый анализ изображения: пары (название, FoodItem) отдаются, как только модель
+    закончила продукт, последней — проверенная модель всего ответа, как у analyze_food_image.
+    """
+    deadline = _gemini_deadline(deadline, timeout)
+    error = _check_size(image)
+    if error is not None:
+        yield error
+        return
 
+    try:
+        client = get_gemini_client(api_key)
     except Exception as err:
-        logger.error(f"Ошибка при анализе: {err}")
-
-        if '429' in str(err) and 'RESOURCE_EXHAUSTED' in str(err):
-            current_model_index += 1
-            return {
-                "status": "error",
-                "message": "Ограничение лимита"
-            }
-
-        elif '400' in str(err) and 'INVALID_ARGUMENT' in str(err):
-            current_model_index += 1
-            return {
-                "status": "error",
-                "message": "Неверные аргументы"
-            }
-
-        return {
-            "status": "error",
-            "message": "Ошибка при анализе изображения"
-        }
+        logger.error("Ошибка инициализации клиента: %s", err)
+        yield ErrorResponse(message="Ошибка сервиса распознавания фото")
+        return
+
+    parser = FoodItemStream()
+    try:
+        async for chunk in _generate_stream(client, _model_contents(image), deadline):
+            for item in parser.feed(chunk):
+                yield item
+    except InvalidRequest as err:
+        logger.warning("Запрос отклонён как неверный: %s", err)
+        yield ErrorResponse(message=_ERROR_MESSAGES["invalid"])
+        return
+    except ModelsUnavailable as err:
+        logger.error("Ошибка при анализе: все модели недоступны (%s)", err.kind)
+        yield ErrorResponse(message=_ERROR_MESSAGES.get(err.kind, "Ошибка при анализе изображения"))
+        return
+    except Exception as err:
+        logger.error("Ошибка при анализе: %s", err)
+        yield ErrorResponse(message="Ошибка при анализе изображения")
+        return
+
+    with STAGE_SECONDS.time("analyze", "parse"):
+        result = parse_food_response(parser.text)
+    yield result
@@ -1,137 +1,604 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Query
-from logging.handlers import RotatingFileHandler
-from cachetools import TTLCache
-from PIL import Image
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Query, Header, Depends
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from pydantic import BaseModel
+from typing import Optional, List, Union
+from contextlib import asynccontextmanager
 import asyncio
+import httpx
 import logging
+import json
+import random
+import math
 import time
-import sys
-import io
+import uuid
+import re
 
-from src.api.analyze import analyze_food_image, analyze_food_json
-from src.env import is_production
+from src.api.analyze import analyze_food_image, analyze_food_image_stream, analyze_food_json
+from src.api.cache import image_result_cache, search_cache, content_hash, normalize_query
+from src.api.model_router import model_router
+from src.api.jobs import analyze_jobs
+from src.api.metrics import (
+    REGISTRY, STAGE_SECONDS, ANALYZE_RESULTS, SEARCH_RESULTS, IN_FLIGHT, HTTP_REQUEST_SECONDS, DEADLINE_BUDGET_USED,
+    DEADLINE_EXCEEDED
+)
+from src.api.limits import rate_limiter, analyze_scheduler, client_key, QueueFull
+from src.api.uploads import UploadLimitMiddleware, read_upload
+from src.api.preprocess import run_preprocess, start_preprocess_pool, stop_preprocess_pool, ImageSizeError
+from src.api.clients import start_http_client, close_http_client, close_gemini_clients
+from src.api.startup import startup_profile, warm_up
+from src.api.state import create_state_backend
+from src.api.deadline import Deadline
+from src.api.nutrition_db import nutrition_index
+from src.api.suggest import suggest_index, load_suggestions, MAX_SUGGESTIONS
+from src.api.config import (
+    MAX_UPLOAD_SIZE, BATCH_MAX_FILES, ADMIN_TOKEN, JOB_EVENTS_KEEPALIVE, LOG_ACCESS_SAMPLE_RATE, REQUEST_ID_HEADER,
+    WORKERS, STATE_BACKEND, SEARCH_BATCH_CONCURRENCY, ANALYZE_DEADLINE, SEARCH_DEADLINE, REQUEST_TIMEOUT_HEADER
+)
+from src.api.logs import setup_logging, request_id_var
+from src.api.responses import FastJSONResponse
+from src.env import API_KEY, is_production
 from src.api.schemas import *
 
-# данные последнего использования
-_client_locks = TTLCache(maxsize=1000, ttl=60)
-_client_locks_lock = asyncio.Lock()
-
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        RotatingFileHandler("../api.log", maxBytes=5 * 1024 * 1024, backupCount=3)
-    ]
-)
+setup_logging()
 logger = logging.getLogger("api")
 
+# компоненты, состояние которых воркеры разделяют через STATE_BACKEND
+_SHARED_STATE = (rate_limiter, model_router, image_result_cache, search_cache, analyze_jobs)
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    """Открывает общие клиенты при старте и закрывает при остановке.
+
+    Клиенты Gemini, соединения и пул предобработки прогреваются в фоне: воркер сразу
+    отвечает на /health, а /ready — после прогрева.
+    """
+    startup_profile.reset()
+    # процессорное время до старта приложения: интерпретатор и импорт модулей
+    startup_profile.record("boot", time.process_time() * 1000)
+    state_backend = create_state_backend()
+    for component in _SHARED_STATE:
+        component.backend = state_backend
+    await start_http_client()
+    start_preprocess_pool()
+    analyze_jobs.start()
+    warming = asyncio.create_task(warm_up([API_KEY]))
+    suggest_loading = asyncio.create_task(asyncio.to_thread(_load_suggestions))
+    try:
+        yield
+    finally:
+        warming.cancel()
+        suggest_loading.cancel()
+        await analyze_jobs.stop()
+        stop_preprocess_pool()
+        await close_gemini_clients()
+        await close_http_client()
+        for component in _SHARED_STATE:
+            component.backend = None
+        if state_backend is not None:
+            await state_backend.close()
+
+
+def _load_suggestions() -> None:
+    """Заполняет подсказки названиями из локального индекса; запускается в фоне при старте"""
+    try:
+        added = load_suggestions(suggest_index, nutrition_index.names())
+        logger.info("Loaded %d food names for suggestions", added)
+    except Exception as err:
+        logger.error("Ошибка загрузки подсказок: %s", err)
+
+
 app = FastAPI(
     title="Food Analysis API",
     description="API для анализа изображений еды и определения пищевой ценности",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse
 )
+app.add_middleware(UploadLimitMiddleware, limits={
+    "/analyze/": MAX_UPLOAD_SIZE,
+    "/analyze/stream": MAX_UPLOAD_SIZE,
+    "/analyze/batch": MAX_UPLOAD_SIZE * BATCH_MAX_FILES,
+    "/analyze/jobs": MAX_UPLOAD_SIZE
+})
 
 
-@app.post("/analyze/", response_model=FoodResponse)
-async def analyze_food(
-        request: Request,
-        file: UploadFile = File(..., description="Изображение еды для анализа")
-):
-    """Анализирует изображение еды и возвращает результат."""
-    max_file_size: int = 10 * 1024 * 1024  # 10Мб
-    client_ip = request.client.host if request.client else "unknown"
-    async with _client_locks_lock:
-        if client_ip not in _client_locks:
-            _client_locks[client_ip] = asyncio.Lock()
-        lock = _client_locks[client_ip]
-
-    async with lock:
-        # Чтение файла
-        contents = await file.read()
-
-        # Проверка типа файла
-        allowed_types = {"image/jpeg", "image/png"}
-        if file.content_type not in allowed_types:
+async def _check_rate_limit(key: str, tokens: float = 1.0) -> None:
+    """Отклоняет запрос с 429, если клиент превысил лимит частоты"""
+    retry_after = await rate_limiter.aacquire(key, tokens)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Слишком много запросов",
+            headers={"Retry-After": str(math.ceil(retry_after))}
+        )
+
+
+def _build_response(result: Union[BaseModel, dict]):
+    """Возвращает модель ответа по результату анализа или HTTP-ошибку.
+
+    analyze_food_image уже возвращает проверенную модель; словарь проверяется
+    один раз: вариант ответа выбирается по status без перебора.
+    """
+    logger.debug("Analysis result: %s", result)
+
+    if isinstance(result, dict):
+        status = result.get('status')
+        if status == 'error':
             raise HTTPException(
                 status_code=400,
-                detail="Поддерживаются только JPEG и PNG"
+                detail=result.get('message')
             )
-
-        if len(contents) > max_file_size:
+        elif status not in ('success', 'not_found', 'danger'):
+            # Некорректный статус от Gemini API
             raise HTTPException(
-                status_code=400,
-                detail=f"Размер файла превышает {max_file_size // (1024 * 1024)}MB"
+                status_code=500,
+                detail=f"Некорректный статус от сервиса анализа"
             )
+        result = food_response_adapter.validate_python(result)
+
+    if isinstance(result, ErrorResponse):
+        raise HTTPException(
+            status_code=400,
+            detail=result.message
+        )
+    return result
+
 
-        # Открытие изображения
+def _request_deadline(request: Request, budget: float) -> Deadline:
+    """Срок запроса: budget или меньший бюджет из заголовка клиента"""
+    return Deadline.from_header(request.headers.get(REQUEST_TIMEOUT_HEADER), budget)
+
+
+def _observe_stages(endpoint: str, timings: dict, deadline: Optional[Deadline] = None) -> None:
+    """Переносит замеры этапов (мс) в гистограммы метрик, вместе с долей бюджета запроса"""
+    for stage, value in timings.items():
+        STAGE_SECONDS.observe(endpoint, stage, value=value / 1000)
+        if deadline is not None and deadline.budget > 0:
+            DEADLINE_BUDGET_USED.observe(endpoint, stage, value=value / 1000 / deadline.budget)
+
+
+async def _analyze_contents(contents: bytes, key: str, timings: dict, deadline: Deadline, limited: bool = True):
+    """Анализ прочитанного изображения: кеш, предобработка, очередь к Gemini.
+
+    limited=False — ждать слота без лимитов очереди (см. FairScheduler.slot).
+    Возвращает (модель ответа, попадание в кеш: "exact", "similar" или None).
+    """
+    with IN_FLIGHT.track("analyze"):
         try:
-            image = Image.open(io.BytesIO(contents))
-            if image.mode in ('RGBA', 'LA', 'P'):
-                image = image.convert('RGB')
+            model, cache_hit = await _analyze_stages(contents, key, timings, deadline, limited)
+        except HTTPException as err:
+            ANALYZE_RESULTS.inc(_ANALYZE_ERROR_STATUSES.get(err.status_code, "error"))
+            raise
+        finally:
+            _observe_stages("analyze", timings, deadline)
+    ANALYZE_RESULTS.inc(model.status.value)
+    return model, cache_hit
+
+
+# статус метрики для ошибок, прервавших анализ
+_ANALYZE_ERROR_STATUSES = {408: "timeout", 429: "rejected", 500: "invalid"}
+
+
+async def _lookup_cached(contents: bytes, timings: dict):
+    """Поиск готового результата в кеше; при промахе по точному совпадению изображение предобрабатывается
+    и ищется похожее по dHash (если файл не отправлен как есть).
+
+    Возвращает (sha256, подготовленное изображение или None, результат или None, попадание в кеш).
+    """
+    # Поиск в кеше по точному совпадению файла, без декодирования
+    sha256 = content_hash(contents)
+    result, cache_hit = await image_result_cache.lookup(sha256)
+    prepared = None
+    if result is None:
+        # Файл в пределах ограничений отправляется как есть, иначе декодируется и уменьшается вне event loop
+        try:
+            prepared = await run_preprocess(contents)
+        except ImageSizeError as err:
+            raise HTTPException(status_code=400, detail=str(err))
         except Exception:
             raise HTTPException(
                 status_code=400,
                 detail="Невозможно обработать изображение"
             )
+        timings.update(prepared.timings)
+        if prepared.dhash is not None:
+            result, cache_hit = await image_result_cache.lookup(sha256, prepared.dhash)
+    return sha256, prepared, result, cache_hit
+
+
+async def _finish_analysis(result, sha256: str, prepared, cache_hit, timings: dict):
+    """Проверяет результат анализа и сохраняет его в кеш, если он получен не из кеша"""
+    started = time.perf_counter()
+    try:
+        model = _build_response(result)
+    finally:
+        timings["validate"] = (time.perf_counter() - started) * 1000
+    if cache_hit is None:
+        await image_result_cache.store(sha256, prepared.dhash if prepared is not None else None, result)
+    return model
+
+
+def _deadline_exceeded(deadline: Deadline) -> HTTPException:
+    logger.error("Food analysis exceeded deadline of %.1f seconds", deadline.budget)
+    DEADLINE_EXCEEDED.inc("analyze")
+    return HTTPException(
+        status_code=408,
+        detail="Анализ изображения превысил лимит времени"
+    )
+
+
+def _timed_out(result, deadline: Deadline) -> bool:
+    """Ошибка анализа из-за истёкшего срока запроса: запрос к модели прерван вместе с запросом"""
+    if isinstance(result, dict):
+        return result.get("status") == "error" and deadline.expired
+    return isinstance(result, ErrorResponse) and deadline.expired
+
+
+def _queue_full(err: QueueFull) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Сервис перегружен, повторите запрос позже",
+        headers={"Retry-After": str(math.ceil(err.retry_after))}
+    )
+
+
+async def _analyze_stages(contents: bytes, key: str, timings: dict, deadline: Deadline, limited: bool = True):
+    sha256, prepared, result, cache_hit = await _lookup_cached(contents, timings)
+    if result is None:
+        # Анализ изображения в общей очереди запросов к Gemini; ожидание очереди и запросы
+        # к модели отменяются, когда истекает срок запроса
+        started = time.perf_counter()
+
+        async def analyze():
+            nonlocal started
+            async with analyze_scheduler.slot(key, limited=limited):
+                timings["queue"] = (time.perf_counter() - started) * 1000
+                started = time.perf_counter()
+                return await analyze_food_image(prepared, deadline=deadline)
 
-        # Анализ изображения
         try:
-            result = await asyncio.wait_for(analyze_food_image(image), timeout=45.0)
+            result = await deadline.run(analyze())
+        except QueueFull as err:
+            raise _queue_full(err)
         except asyncio.TimeoutError:
-            logger.error("Food analysis timed out after 45 seconds")
-            raise HTTPException(
-                status_code=408,
-                detail="Анализ изображения превысил лимит времени"
-            )
-        finally:
-            image.close()
-        status = result.get('status')
-        logger.debug(f"Analysis result: {result}")
-
-        if status == 'success':
-            return FoodSuccessResponse(**result)
-        elif status == 'not_found':
-            return NotFoundResponse(**result)
-        elif status == 'danger':
-            return DangerResponse(**result)
-        elif status == 'error':
-            raise HTTPException(
-                status_code=400,
-                detail=result.get('message')
-            )
-        else:
-            # Некорректный статус от Gemini API
-            raise HTTPException(
-                status_code=500,
-                detail=f"Некорректный статус от сервиса анализа"
-            )
+            raise _deadline_exceeded(deadline)
+        timings["analyze"] = (time.perf_counter() - started) * 1000
+        if _timed_out(result, deadline):
+            # запрос к модели прерван по тому же сроку раньше, чем внешнее ожидание
+            raise _deadline_exceeded(deadline)
 
+    return await _finish_analysis(result, sha256, prepared, cache_hit, timings), cache_hit
 
-@app.get("/search/", response_model=FoodAPIResponseSearch)
-async def get_nutrition_info(
-        food_name: str = Query(..., min_length=1, max_length=100, description="Название продукта")
+
+async def _analyze_stream_stages(contents: bytes, key: str, timings: dict, deadline: Deadline):
+    """Этапы анализа для /analyze/stream: пары ("item", (название, FoodItem)) по мере генерации,
+    затем ("result", модель ответа)"""
+    sha256, prepared, result, cache_hit = await _lookup_cached(contents, timings)
+    if result is None:
+        started = time.perf_counter()
+        try:
+            # ожидание слота ограничено сроком запроса, как и на /analyze/
+            async with analyze_scheduler.slot(key, timeout=deadline.remaining()):
+                timings["queue"] = (time.perf_counter() - started) * 1000
+                started = time.perf_counter()
+                async for part in analyze_food_image_stream(prepared, deadline=deadline):
+                    if isinstance(part, tuple):
+                        timings.setdefault("first_item", (time.perf_counter() - started) * 1000)
+                        yield "item", part
+                    else:
+                        result = part
+        except QueueFull as err:
+            raise _queue_full(err)
+        except asyncio.TimeoutError:
+            raise _deadline_exceeded(deadline)
+        timings["analyze"] = (time.perf_counter() - started) * 1000
+        if _timed_out(result, deadline):
+            raise _deadline_exceeded(deadline)
+
+    yield "result", await _finish_analysis(result, sha256, prepared, cache_hit, timings)
+
+
+def _sse(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+def _server_timing(timings: dict, deadline: Optional[Deadline] = None) -> str:
+    """Заголовок Server-Timing: этапы и, если задан срок, бюджет запроса (budget)"""
+    parts = [f"{name};dur={value:.1f}" for name, value in timings.items()]
+    if deadline is not None:
+        parts.append(f"budget;dur={deadline.budget * 1000:.1f}")
+    return ", ".join(parts)
+
+
+@app.post("/analyze/", response_model=FoodResponse)
+async def analyze_food(
+        request: Request,
+        file: UploadFile = File(..., description="Изображение еды для анализа")
 ):
+    """Анализирует изображение еды и возвращает результат."""
+    max_file_size: int = MAX_UPLOAD_SIZE
+    deadline = _request_deadline(request, ANALYZE_DEADLINE)
+    key = client_key(request)
+    await _check_rate_limit(key)
+
+    timings = {}
+    # Чтение файла с проверкой типа, сигнатуры и размера
+    started = time.perf_counter()
+    contents = await read_upload(file, max_file_size)
+    timings["read"] = (time.perf_counter() - started) * 1000
+
+    model, cache_hit = await _analyze_contents(contents, key, timings, deadline)
+    # модель уже проверена: ответ сериализуется без повторной валидации по response_model
+    return FastJSONResponse(model, headers={
+        "X-Cache": {"exact": "HIT", "similar": "HIT-SIMILAR"}.get(cache_hit, "MISS"),
+        "Server-Timing": _server_timing(timings, deadline)
+    })
+
+
+@app.post("/analyze/stream")
+async def analyze_food_stream(
+        request: Request,
+        file: UploadFile = File(..., description="Изображение еды для анализа")
+):
+    """Анализирует изображение и отдаёт результат потоком событий (text/event-stream).
+
+    События: item — продукт, как только модель закончила его описание
+    ({"name": ..., "item": {...}}); result — итоговый проверенный ответ, как у /analyze/;
+    error — ошибка анализа ({"status_code": ..., "message": ...}). Результат из кеша
+    приходит сразу событием result.
     """
-    Возвращает пищевую ценность продукта на 100 г.
+    deadline = _request_deadline(request, ANALYZE_DEADLINE)
+    key = client_key(request)
+    await _check_rate_limit(key)
+    timings = {}
+    started = time.perf_counter()
+    contents = await read_upload(file, MAX_UPLOAD_SIZE)
+    timings["read"] = (time.perf_counter() - started) * 1000
+
+    async def events():
+        with IN_FLIGHT.track("analyze"):
+            try:
+                async for kind, value in _analyze_stream_stages(contents, key, timings, deadline):
+                    if kind == "item":
+                        name, item = value
+                        data = {"name": name, "item": item.model_dump(mode="json")}
+                        yield _sse("item", json.dumps(data, ensure_ascii=False))
+                    else:
+                        ANALYZE_RESULTS.inc(value.status.value)
+                        yield _sse("result", value.model_dump_json())
+            except HTTPException as err:
+                ANALYZE_RESULTS.inc(_ANALYZE_ERROR_STATUSES.get(err.status_code, "error"))
+                data = {"status_code": err.status_code, "message": err.detail}
+                yield _sse("error", json.dumps(data, ensure_ascii=False))
+            finally:
+                _observe_stages("analyze", timings, deadline)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/analyze/batch", response_model=FoodBatchResponse)
+async def analyze_food_batch(
+        request: Request,
+        files: List[UploadFile] = File(..., description="Изображения еды для анализа")
+):
+    """Анализирует несколько изображений за один запрос.
+
+    Изображения обрабатываются параллельно; ошибка одного изображения не мешает остальным
+    и возвращается на его месте в списке результатов со статусом error.
+    """
+    if len(files) > BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Не более {BATCH_MAX_FILES} изображений за запрос"
+        )
+    deadline = _request_deadline(request, ANALYZE_DEADLINE)
+    key = client_key(request)
+    await _check_rate_limit(key, min(len(files), rate_limiter.burst))
+
+    async def analyze_one(file: UploadFile):
+        try:
+            started = time.perf_counter()
+            contents = await read_upload(file, MAX_UPLOAD_SIZE)
+            timings = {"read": (time.perf_counter() - started) * 1000}
+            # размер пакета ограничен BATCH_MAX_FILES и лимитом частоты, поэтому изображения
+            # принятого пакета ждут слота без лимитов очереди
+            model, _ = await _analyze_contents(contents, key, timings, deadline, limited=False)
+            return model
+        except HTTPException as err:
+            return ErrorResponse(message=str(err.detail))
+        except Exception as err:
+            logger.error("Batch item failed: %r", err)
+            return ErrorResponse(message="Ошибка при анализе изображения")
+
+    results = await asyncio.gather(*(analyze_one(file) for file in files))
+    return FastJSONResponse(FoodBatchResponse(results=list(results)))
+
+
+def _job_response(job) -> dict:
+    return {"job_id": job.id, "status": job.status, "result": job.result}
+
+
+@app.post("/analyze/jobs", response_model=JobResponse, status_code=202)
+async def submit_analyze_job(
+        request: Request,
+        file: UploadFile = File(..., description="Изображение еды для анализа")
+):
+    """Ставит анализ изображения в очередь и сразу возвращает идентификатор задачи.
+
+    Результат доступен через GET /analyze/jobs/{job_id} или поток событий
+    GET /analyze/jobs/{job_id}/events.
     """
+    key = client_key(request)
+    await _check_rate_limit(key)
+    contents = await read_upload(file, MAX_UPLOAD_SIZE)
+
+    async def run() -> dict:
+        try:
+            # срок отсчитывается с начала выполнения задачи, а не с постановки в очередь;
+            # число задач ограничено JobQueue, поэтому слот анализа они ждут без лимитов очереди
+            model, _ = await _analyze_contents(contents, key, {}, Deadline(ANALYZE_DEADLINE), limited=False)
+            return model.model_dump(mode="json")
+        except HTTPException as err:
+            return ErrorResponse(message=str(err.detail)).model_dump(mode="json")
+
+    try:
+        job = analyze_jobs.submit(run, size=len(contents))
+    except QueueFull as err:
+        raise HTTPException(
+            status_code=429,
+            detail="Сервис перегружен, повторите запрос позже",
+            headers={"Retry-After": str(math.ceil(err.retry_after))}
+        )
+    return _job_response(job)
+
+
+async def _get_job(job_id: str):
+    job = await analyze_jobs.find(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
+
+
+@app.get("/analyze/jobs/{job_id}", response_model=JobResponse)
+async def get_analyze_job(job_id: str):
+    """Состояние и результат фоновой задачи анализа"""
+    return _job_response(await _get_job(job_id))
+
+
+@app.get("/analyze/jobs/{job_id}/events")
+async def analyze_job_events(job_id: str):
+    """Поток server-sent events: текущее состояние задачи, затем результат"""
+    job = await _get_job(job_id)
+
+    async def events():
+        yield f"event: status\ndata: {json.dumps({'job_id': job.id, 'status': job.status})}\n\n"
+        while not await analyze_jobs.wait(job, JOB_EVENTS_KEEPALIVE):
+            yield ": keep-alive\n\n"
+        yield f"event: result\ndata: {json.dumps(_job_response(job), ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def _search_response(food_name: str, result: dict) -> FoodResponseSearch:
+    """Ответ /search/ по результату поиска: КБЖУ, найденное название и альтернативы"""
+    return FoodResponseSearch(
+        food_name=food_name,
+        nutrition=NutritionSearch(**result),
+        matched_name=result.get("matched_name"),
+        score=result.get("score", 1.0),
+        alternatives=result.get("alternatives", [])
+    )
+
+
+async def _search_one(food_name: str, fetch, deadline: Deadline) -> FoodAPIResponseSearch:
+    """Поиск одного продукта через кеш; fetch(name) запрашивает источник при промахе"""
     # обработка поиска
     try:
-        result = await asyncio.wait_for(analyze_food_json(food_name), timeout=15.0)
+        with IN_FLIGHT.track("search"):
+            result = await deadline.run(search_cache.get_or_fetch(food_name, fetch))
     except asyncio.TimeoutError:
-        logger.error("Food searching timed out after 15 seconds")
+        logger.error("Food searching exceeded deadline of %.1f seconds", deadline.budget)
+        DEADLINE_EXCEEDED.inc("search")
+        SEARCH_RESULTS.inc("error")
+        return ErrorFoundResponseSearch()
+    except httpx.HTTPError as err:
+        # ошибка источника по одному названию не прерывает пакетный запрос
+        logger.error("Food searching upstream error: %r", err)
+        SEARCH_RESULTS.inc("error")
         return ErrorFoundResponseSearch()
+    finally:
+        if deadline.budget > 0:
+            DEADLINE_BUDGET_USED.observe("search", "total", value=deadline.elapsed() / deadline.budget)
 
     # возврат результата
     if result:
-        return FoodResponseSearch(
-            food_name=food_name,
-            nutrition=NutritionSearch(**result)
-        )
+        SEARCH_RESULTS.inc("success")
+        response = _search_response(food_name, result)
+        # успешные поиски поднимают название в подсказках; варианты запроса с тем же
+        # набором слов индекс сводит к уже известной записи
+        suggest_index.record_hit(response.matched_name or food_name, response.nutrition.model_dump())
+        return response
     else:
+        SEARCH_RESULTS.inc("not_found")
         return NotFoundResponseSearch()
 
 
+@app.get("/search/", response_model=FoodAPIResponseSearch)
+async def get_nutrition_info(
+        request: Request,
+        food_name: str = Query(..., min_length=1, max_length=100, description="Название продукта")
+):
+    """
+    Возвращает пищевую ценность продукта на 100 г.
+    """
+    deadline = _request_deadline(request, SEARCH_DEADLINE)
+
+    async def fetch(name: str):
+        # общий для одинаковых запросов поиск идёт со своим сроком: срок клиента
+        # ограничивает только его ожидание в _search_one
+        return await analyze_food_json(name, Deadline(SEARCH_DEADLINE))
+
+    return FastJSONResponse(await _search_one(food_name, fetch, deadline))
+
+
+@app.post("/search/batch", response_model=SearchBatchResponse)
+async def get_nutrition_info_batch(request: Request, body: SearchBatchRequest):
+    """Пищевая ценность нескольких продуктов за один запрос.
+
+    Названия с одинаковым набором слов ищутся один раз, найденные в кеше отдаются сразу,
+    остальные запрашиваются у источника параллельно, не более SEARCH_BATCH_CONCURRENCY
+    одновременно. Результаты возвращаются в порядке названий запроса.
+    """
+    deadline = _request_deadline(request, SEARCH_DEADLINE)
+    semaphore = asyncio.Semaphore(SEARCH_BATCH_CONCURRENCY)
+
+    async def fetch(name: str):
+        async with semaphore:
+            return await analyze_food_json(name, Deadline(SEARCH_DEADLINE))
+
+    unique = {}  # набор слов -> задача поиска для первого из одинаковых названий
+    for food_name in body.food_names:
+        key = normalize_query(food_name)
+        if key not in unique:
+            unique[key] = asyncio.ensure_future(_search_one(food_name, fetch, deadline))
+    await asyncio.gather(*unique.values())
+
+    results = []
+    for food_name in body.food_names:
+        response = unique[normalize_query(food_name)].result()
+        if isinstance(response, FoodResponseSearch) and response.food_name != food_name:
+            response = response.model_copy(update={"food_name": food_name})
+        results.append(response)
+    return FastJSONResponse(SearchBatchResponse(results=results))
+
+
+@app.get("/search/suggest", response_model=SuggestResponse)
+async def suggest_food_names(
+        prefix: str = Query(..., min_length=1, max_length=100, description="Начало названия продукта"),
+        limit: int = Query(10, ge=1, le=MAX_SUGGESTIONS, description="Число подсказок")
+):
+    """
+    Подсказки названий продуктов по мере ввода: сначала популярные, затем короткие.
+    """
+    suggestions = suggest_index.suggest(prefix, limit)
+    return FastJSONResponse(
+        SuggestResponse(
+            prefix=prefix,
+            suggestions=[SuggestItem(food_name=item.name, nutrition=item.nutrition) for item in suggestions]
+        ),
+        headers={"Cache-Control": "max-age=60"}
+    )
+
+
 @app.get("/")
 async def root():
     """Информация о API"""
@@ -147,36 +614,94 @@ async def health_check():
     return {"status": "healthy", "service": "food-detect"}
 
 
+@app.get("/ready")
+async def readiness_check():
+    """Готовность к приёму запросов: 503, пока воркер не прогрет"""
+    report = startup_profile.report()
+    if not report["ready"]:
+        return FastJSONResponse({"status": "starting", "startup": report}, status_code=503)
+    return {"status": "ready", "startup": report}
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Проверка токена служебных эндпоинтов"""
+    if ADMIN_TOKEN and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Доступ запрещён")
+
+
+@app.get("/admin/models", dependencies=[Depends(require_admin)])
+async def models_state():
+    """Состояние моделей Gemini и очереди анализа"""
+    return {
+        "models": model_router.snapshot(),
+        "analyze_queue": analyze_scheduler.stats(),
+        "jobs": analyze_jobs.stats()
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+async def metrics():
+    """Метрики процесса в текстовом формате Prometheus"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _route_name(request: Request) -> str:
+    """Шаблон пути маршрута: метки метрик не должны зависеть от параметров запроса"""
+    route = request.scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
+# принимаем идентификатор запроса от клиента или прокси, только если он похож на идентификатор
+_REQUEST_ID_RE = re.compile(r"^[\w.:-]{1,128}$")
+
+
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
-    """Логирование HTTP-запросов и ответов"""
+    """Логирование HTTP-запросов: одна запись на запрос с идентификатором запроса.
+
+    Успешные ответы попадают в лог с долей LOG_ACCESS_SAMPLE_RATE, ошибки — всегда.
+    """
+    request_id = request.headers.get(REQUEST_ID_HEADER, "")
+    if not _REQUEST_ID_RE.match(request_id):
+        request_id = uuid.uuid4().hex
+    token = request_id_var.set(request_id)
     # Получаем IP-адрес клиента
     client_host = request.client.host if request.client else "unknown"
-    start_time = time.time()
-    logger.info(f"Incoming request | Method: {request.method} | URL: {request.url.path} | Client: {client_host}")
+    fields = {"method": request.method, "path": request.url.path, "client": client_host}
+    start_time = time.perf_counter()
+    logger.debug("Incoming request", extra=fields)
 
     try:
         response = await call_next(request)
-        process_time = (time.time() - start_time) * 1000
-        logger.info(
-            f"Outgoing response | Status: {response.status_code} | "
-            f"Method: {request.method} | URL: {request.url.path} | "
-            f"Duration: {process_time:.2f}ms | Client: {client_host}"
+        process_time = (time.perf_counter() - start_time) * 1000
+        HTTP_REQUEST_SECONDS.observe(
+            request.method, _route_name(request), str(response.status_code), value=process_time / 1000
         )
+        response.headers[REQUEST_ID_HEADER] = request_id
+        if response.status_code >= 400 or random.random() < LOG_ACCESS_SAMPLE_RATE:
+            logger.log(
+                logging.WARNING if response.status_code >= 500 else logging.INFO,
+                "Outgoing response",
+                extra={**fields, "status": response.status_code, "duration_ms": round(process_time, 2)}
+            )
         return response
     except Exception as e:
-        process_time = (time.time() - start_time) * 1000
+        process_time = (time.perf_counter() - start_time) * 1000
         logger.error(
-            f"Request failed | Method: {request.method} | URL: {request.url.path} | "
-            f"Client: {client_host} | Duration: {process_time:.2f}ms | Error: {e}"
+            "Request failed: %s", e,
+            extra={**fields, "duration_ms": round(process_time, 2)}
         )
         raise
+    finally:
+        request_id_var.reset(token)
 
 
 if __name__ == "__main__":
     import uvicorn
 
     if is_production:
-        uvicorn.run("api:app", host="0.0.0.0", port=8000, log_level="warning", reload=False)
+        if WORKERS > 1 and STATE_BACKEND == "memory":
+            logger.warning("WORKERS=%d with STATE_BACKEND=memory: limits, caches and jobs are per process", WORKERS)
+        uvicorn.run("api:app", host="0.0.0.0", port=8000, log_level="warning", reload=False, workers=WORKERS)
     else:
         uvicorn.run("api:app", host="127.0.0.1", port=8000, reload=True)
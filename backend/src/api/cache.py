@@ -0,0 +1,292 @@
+from typing import Optional, Tuple, Union, Literal, Callable, Awaitable, Dict
+from cachetools import TTLCache
+from pydantic import BaseModel
+from PIL import Image
+import threading
+import hashlib
+import asyncio
+import logging
+import json
+import time
+
+from src.api.state import StateBackend, safe, iter_bands
+from src.api.schemas import food_response_adapter
+from src.api.config import (
+    RESULT_CACHE_SIZE, RESULT_CACHE_TTL, RESULT_CACHE_MAX_DISTANCE,
+    SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, SEARCH_CACHE_STALE_TTL, SEARCH_CACHE_NEGATIVE_TTL
+)
+from src.api.metrics import STAGE_SECONDS, SEARCH_CACHE_LOOKUPS
+
+logger = logging.getLogger("api.cache")
+
+SearchResult = Union[Literal[False], dict]
+ImageResult = Union[BaseModel, dict]  # проверенная модель ответа /analyze/
+
+# размер уменьшенного изображения для dHash: 9x8 даёт 64 бита
+_DHASH_SIZE = 8
+
+
+def content_hash(contents: bytes) -> str:
+    """SHA-256 содержимого файла"""
+    return hashlib.sha256(contents).hexdigest()
+
+
+def perceptual_hash(image: Image.Image) -> int:
+    """64-битный разностный хеш (dHash) изображения.
+
+    Похожие снимки (повторная съёмка, пересжатие) дают хеши с малым расстоянием Хэмминга.
+    """
+    small = image.convert("L").resize((_DHASH_SIZE + 1, _DHASH_SIZE), Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(_DHASH_SIZE):
+        offset = row * (_DHASH_SIZE + 1)
+        for col in range(_DHASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming_distance(first: int, second: int) -> int:
+    """Количество различающихся бит"""
+    return (first ^ second).bit_count()
+
+
+class ImageResultCache:
+    """Кеш результатов анализа по точному и перцептивному хешу изображения.
+
+    Ограничен по размеру и времени жизни, вытесняются давно не использованные записи.
+    С общим хранилищем (backend) lookup/store дополнительно используют записи других
+    воркеров: похожие снимки находятся по частям dHash, совпадающим целиком.
+    """
+
+    def __init__(self, maxsize: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL,
+                 max_distance: int = RESULT_CACHE_MAX_DISTANCE):
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self._entries: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)  # sha256 -> (dhash, результат)
+        self._lock = threading.Lock()
+        self.backend: Optional[StateBackend] = None
+
+    def get(self, sha256: str, dhash: Optional[int] = None) -> Tuple[Optional[ImageResult], Optional[str]]:
+        """Ищет результат: сначала по точному хешу, затем по ближайшему dHash.
+
+        Возвращает пару (результат, тип попадания: "exact" или "similar").
+        """
+        with self._lock:
+            entry = self._entries.get(sha256)
+            if entry is not None:
+                return entry[1], "exact"
+            if dhash is None or self.max_distance < 0:
+                return None, None
+
+            best_key, best_distance = None, self.max_distance + 1
+            for key, (other_hash, _) in list(self._entries.items()):
+                if other_hash is None:  # файл отправлен в анализ без декодирования
+                    continue
+                distance = hamming_distance(dhash, other_hash)
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+                    if distance == 0:
+                        break
+            if best_key is None:
+                return None, None
+            # обращение по ключу обновляет позицию записи в LRU
+            return self._entries[best_key][1], "similar"
+
+    def set(self, sha256: str, dhash: Optional[int], result: ImageResult) -> None:
+        """Сохраняет результат анализа"""
+        with self._lock:
+            self._entries[sha256] = (dhash, result)
+
+    def _band_keys(self, dhash: int):
+        # при расстоянии не больше max_distance хотя бы одна из max_distance + 1 частей совпадает
+        return [f"imgband:{index}:{value:x}" for index, value in iter_bands(dhash, self.max_distance + 1)]
+
+    async def lookup(self, sha256: str, dhash: Optional[int] = None) -> Tuple[Optional[ImageResult], Optional[str]]:
+        """То же, что get, но при промахе ищет и в общем хранилище"""
+        result, hit = self.get(sha256, dhash)
+        if result is not None or self.backend is None:
+            return result, hit
+
+        candidates = [sha256]
+        if dhash is not None and self.max_distance >= 0:
+            members = await safe(self.backend.members_many(self._band_keys(dhash)), [], "image cache")
+            candidates += sorted(set().union(*members) - {sha256})
+        records = await safe(self.backend.get_many([f"img:{key}" for key in candidates]), [], "image cache")
+
+        best, best_distance = None, self.max_distance + 1
+        for key, raw in zip(candidates, records):
+            if raw is None:
+                continue
+            record = json.loads(raw)
+            if key == sha256:
+                best, best_distance = (key, record), -1
+                break
+            distance = hamming_distance(dhash, record["d"])
+            if distance < best_distance:
+                best, best_distance = (key, record), distance
+        if best is None:
+            return None, None
+        key, record = best
+        try:
+            result = food_response_adapter.validate_python(record["r"])
+        except ValueError as err:
+            logger.warning("Invalid shared cache entry %s: %r", key, err)
+            return None, None
+        self.set(key, record["d"], result)
+        return result, "exact" if key == sha256 else "similar"
+
+    async def store(self, sha256: str, dhash: Optional[int], result: ImageResult) -> None:
+        """То же, что set, и публикация результата для других воркеров"""
+        self.set(sha256, dhash, result)
+        if self.backend is None or self.ttl <= 0:
+            return
+        data = result.model_dump(mode="json") if isinstance(result, BaseModel) else result
+        payload = json.dumps({"d": dhash, "r": data}, ensure_ascii=False).encode("utf-8")
+        writes = [self.backend.set(f"img:{sha256}", payload, self.ttl)]
+        if dhash is not None and self.max_distance >= 0:
+            writes += [self.backend.add_member(key, sha256, self.ttl) for key in self._band_keys(dhash)]
+        await safe(asyncio.gather(*writes), what="image cache")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+def normalize_query(name: str) -> str:
+    """Ключ поискового запроса: набор слов без учёта регистра и порядка"""
+    return " ".join(sorted(set(name.lower().split())))
+
+
+class SearchCache:
+    """Кеш результатов /search/ с объединением одинаковых запросов.
+
+    Свежая запись отдаётся сразу, устаревшая — тоже сразу, но с обновлением в фоне.
+    Результат "не найдено" (False) хранится меньше. Одновременные запросы с одинаковым
+    ключом ждут один общий запрос к источнику. С общим хранилищем (backend) результат,
+    полученный одним воркером, используют и остальные.
+    """
+
+    def __init__(self, maxsize: int = SEARCH_CACHE_SIZE, ttl: float = SEARCH_CACHE_TTL,
+                 stale_ttl: float = SEARCH_CACHE_STALE_TTL, negative_ttl: float = SEARCH_CACHE_NEGATIVE_TTL):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        # ключ -> (свежо до, годно до, результат); после "свежо до" запись отдаётся с обновлением
+        self._entries: TTLCache = TTLCache(maxsize=maxsize, ttl=max(ttl, negative_ttl) + stale_ttl)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.backend: Optional[StateBackend] = None
+
+    def _store(self, key: str, result: SearchResult) -> None:
+        fresh_until = time.monotonic() + (self.ttl if result else self.negative_ttl)
+        self._entries[key] = (fresh_until, fresh_until + self.stale_ttl, result)
+
+    def _lookup(self, key: str) -> Optional[Tuple[float, SearchResult]]:
+        """Возвращает (свежо до, результат) или None, если записи нет или она истекла"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        fresh_until, stale_until, result = entry
+        if time.monotonic() >= stale_until:
+            self._entries.pop(key, None)
+            return None
+        return fresh_until, result
+
+    async def _lookup_shared(self, key: str) -> Optional[Tuple[float, SearchResult]]:
+        """Ищет запись другого воркера и сохраняет её локально"""
+        raw = await safe(self.backend.get(f"search:{key}"), None, "search cache")
+        if raw is None:
+            return None
+        record = json.loads(raw)
+        # в хранилище время по часам (time.time), локально — time.monotonic
+        offset = time.monotonic() - time.time()
+        fresh_until, stale_until = record["fresh"] + offset, record["stale"] + offset
+        if time.monotonic() >= stale_until:
+            return None
+        self._entries[key] = (fresh_until, stale_until, record["r"])
+        return fresh_until, record["r"]
+
+    async def _publish(self, key: str, result: SearchResult) -> None:
+        entry = self._entries.get(key)
+        if self.backend is None or entry is None:
+            return
+        fresh_until, stale_until, _ = entry
+        offset = time.time() - time.monotonic()
+        payload = json.dumps(
+            {"fresh": fresh_until + offset, "stale": stale_until + offset, "r": result}, ensure_ascii=False
+        ).encode("utf-8")
+        ttl = stale_until - time.monotonic()
+        if ttl > 0:
+            await safe(self.backend.set(f"search:{key}", payload, ttl), what="search cache")
+
+    def _fetch(self, key: str, name: str, fetch: Callable[[str], Awaitable[SearchResult]]) -> asyncio.Task:
+        """Запускает запрос к источнику или возвращает уже выполняющийся.
+
+        Запрос общий для всех ожидающих, поэтому fetch не должен зависеть от срока
+        одного из них: каждый ограничивает сроком только своё ожидание.
+        """
+        task = self._inflight.get(key)
+        if task is not None and not task.done():
+            return task
+
+        async def run() -> SearchResult:
+            try:
+                result = await fetch(name)
+                self._store(key, result)
+                await self._publish(key, result)
+                return result
+            finally:
+                self._inflight.pop(key, None)
+
+        task = asyncio.create_task(run())
+        task.add_done_callback(self._fetch_done)
+        self._inflight[key] = task
+        return task
+
+    @staticmethod
+    def _fetch_done(task: asyncio.Task) -> None:
+        """Забирает исключение запроса, даже если его результат уже никто не ждёт"""
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("Search upstream request failed: %r", task.exception())
+
+    def peek(self, name: str) -> Tuple[Optional[SearchResult], bool]:
+        """Возвращает (результат, свежий ли он) без обращения к источнику"""
+        entry = self._lookup(normalize_query(name))
+        if entry is None:
+            return None, False
+        fresh_until, result = entry
+        return result, time.monotonic() < fresh_until
+
+    async def get_or_fetch(self, name: str, fetch: Callable[[str], Awaitable[SearchResult]]) -> SearchResult:
+        """Возвращает результат поиска из кеша или через fetch(name)"""
+        with STAGE_SECONDS.time("search", "cache_lookup"):
+            key = normalize_query(name)
+            entry = self._lookup(key)
+            if entry is None and self.backend is not None:
+                entry = await self._lookup_shared(key)
+        if entry is not None:
+            fresh_until, result = entry
+            if time.monotonic() >= fresh_until:
+                SEARCH_CACHE_LOOKUPS.inc("stale")
+                if key not in self._inflight:
+                    self._fetch(key, name, fetch)
+            else:
+                SEARCH_CACHE_LOOKUPS.inc("fresh")
+            return result
+        SEARCH_CACHE_LOOKUPS.inc("miss")
+        # shield: отмена одного ожидающего не отменяет общий запрос
+        return await asyncio.shield(self._fetch(key, name, fetch))
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+image_result_cache = ImageResultCache()
+search_cache = SearchCache()
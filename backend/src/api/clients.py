@@ -0,0 +1,119 @@
+from typing import Optional, Dict, Tuple, Iterable, TYPE_CHECKING
+import asyncio
+import logging
+import httpx
+
+from src.api.config import (
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY,
+    HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT, HTTP_WRITE_TIMEOUT, HTTP_POOL_TIMEOUT, GEMINI_BASE_URL
+)
+
+if TYPE_CHECKING:
+    from google.genai import Client
+
+logger = logging.getLogger("api.clients")
+
+_http_client: Optional[httpx.AsyncClient] = None
+_http_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+# клиенты Gemini по API-ключу вместе с event loop, в котором открыт их пул соединений
+_gemini_clients: Dict[str, Tuple["Client", Optional[asyncio.AbstractEventLoop]]] = {}
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """Создаёт HTTP-клиент с пулом keep-alive соединений"""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(
+            connect=HTTP_CONNECT_TIMEOUT,
+            read=HTTP_READ_TIMEOUT,
+            write=HTTP_WRITE_TIMEOUT,
+            pool=HTTP_POOL_TIMEOUT
+        )
+    )
+
+
+async def start_http_client() -> httpx.AsyncClient:
+    """Открывает общий HTTP-клиент на время жизни приложения"""
+    global _http_client, _http_client_loop
+    await close_http_client()
+    _http_client = create_http_client()
+    _http_client_loop = asyncio.get_running_loop()
+    logger.info("HTTP client started")
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Закрывает общий HTTP-клиент и его соединения"""
+    global _http_client, _http_client_loop
+    if _http_client is not None:
+        await _http_client.aclose()
+        logger.info("HTTP client closed")
+    _http_client = None
+    _http_client_loop = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Возвращает общий HTTP-клиент.
+
+    Если приложение запущено без lifespan (тесты, скрипты), клиент создаётся
+    при первом обращении для текущего event loop.
+    """
+    global _http_client, _http_client_loop
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client.is_closed or _http_client_loop is not loop:
+        _http_client = create_http_client()
+        _http_client_loop = loop
+    return _http_client
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def get_gemini_client(api_key: str) -> "Client":
+    """Возвращает клиент Gemini для API-ключа, создавая его при первом обращении.
+
+    Клиент переиспользуется между запросами вместе с пулом HTTP-соединений.
+    При некорректном ключе исключение Client пробрасывается вызывающему.
+    """
+    loop = _running_loop()
+    cached = _gemini_clients.get(api_key)
+    if cached is not None and (cached[1] is None or cached[1] is loop):
+        return cached[0]
+    # google.genai импортируется около секунды, поэтому загружается при создании первого клиента
+    from google.genai import Client, types
+    if GEMINI_BASE_URL:
+        client = Client(api_key=api_key, http_options=types.HttpOptions(base_url=GEMINI_BASE_URL))
+    else:
+        client = Client(api_key=api_key)
+    _gemini_clients[api_key] = (client, loop)
+    return client
+
+
+async def start_gemini_clients(api_keys: Iterable[str]) -> None:
+    """Создаёт клиентов Gemini при старте приложения"""
+    for api_key in api_keys:
+        try:
+            get_gemini_client(api_key)
+        except Exception as err:
+            logger.error("Gemini client init failed: %s", err)
+
+
+async def close_gemini_clients() -> None:
+    """Закрывает клиентов Gemini и их соединения"""
+    clients = list(_gemini_clients.values())
+    _gemini_clients.clear()
+    for client, _ in clients:
+        try:
+            await client.aio.aclose()
+            client.close()
+        except Exception as err:
+            logger.warning("Gemini client close failed: %s", err)
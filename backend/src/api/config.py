@@ -0,0 +1,123 @@
+import os
+
+# Ограничения обращений к Gemini
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "32"))  # одновременных запросов на процесс
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "")  # пустая строка — адрес Google по умолчанию
+
+# HTTP-клиент для health-diet.ru
+HEALTH_DIET_URL = os.getenv("HEALTH_DIET_URL", "https://health-diet.ru/api3/Food/FoodSearch")
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "200"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "50"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))  # секунды
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+HTTP_WRITE_TIMEOUT = float(os.getenv("HTTP_WRITE_TIMEOUT", "5"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "5"))  # ожидание свободного соединения
+
+# Кеш результатов /analyze/
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "1024"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "3600"))  # секунды
+RESULT_CACHE_MAX_DISTANCE = int(os.getenv("RESULT_CACHE_MAX_DISTANCE", "4"))  # расстояние Хэмминга dHash
+
+# Кеш /search/
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "10000"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "21600"))  # свежая запись, секунды
+SEARCH_CACHE_STALE_TTL = float(os.getenv("SEARCH_CACHE_STALE_TTL", "86400"))  # отдаётся с фоновым обновлением
+SEARCH_CACHE_NEGATIVE_TTL = float(os.getenv("SEARCH_CACHE_NEGATIVE_TTL", "600"))  # для "не найдено"
+
+# Локальный индекс пищевой ценности
+NUTRITION_DB_PATH = os.getenv(
+    "NUTRITION_DB_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "nutrition.db")
+)
+
+# Предобработка изображений перед отправкой в Gemini
+PREPROCESS_WORKERS = int(os.getenv("PREPROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))  # 0 — пул потоков
+IMAGE_MAX_EDGE = int(os.getenv("IMAGE_MAX_EDGE", "1024"))  # пикселей по длинной стороне
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG")  # JPEG или WEBP
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "85"))
+# файл не больше этого размера и не больше IMAGE_MAX_EDGE отправляется как есть, без декодирования; 0 — всегда пересжимать.
+# Без декодирования нет dHash: такие файлы находятся в кеше только по точному совпадению
+IMAGE_PASSTHROUGH_MAX_SIZE = int(os.getenv("IMAGE_PASSTHROUGH_MAX_SIZE", str(2 * 1024 * 1024)))
+
+# Загрузка файлов
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(10 * 1024 * 1024)))  # байт на изображение
+MULTIPART_OVERHEAD = 64 * 1024  # запас на заголовки multipart в теле запроса
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Ограничение частоты и очередь /analyze/
+RATE_LIMIT_RATE = float(os.getenv("RATE_LIMIT_RATE", "0.5"))  # запросов в секунду на клиента
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "10"))  # запас запросов подряд
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "100000"))
+CLIENT_ID_HEADER = os.getenv("CLIENT_ID_HEADER", "X-Device-Id")
+# ключ лимитов по CLIENT_ID_HEADER только за своим шлюзом, который проверяет устройство; иначе по IP
+TRUST_CLIENT_ID = os.getenv("TRUST_CLIENT_ID", "false").lower() in ("1", "true", "yes")
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() in ("1", "true", "yes")
+# число своих прокси перед сервисом: адрес клиента — столько-то адресов с конца X-Forwarded-For
+FORWARDED_FOR_HOPS = int(os.getenv("FORWARDED_FOR_HOPS", "1"))
+ANALYZE_MAX_CONCURRENCY = int(os.getenv("ANALYZE_MAX_CONCURRENCY", str(GEMINI_MAX_CONCURRENCY)))
+ANALYZE_MAX_QUEUE = int(os.getenv("ANALYZE_MAX_QUEUE", "256"))  # ожидающих анализа всего
+ANALYZE_MAX_QUEUE_PER_CLIENT = int(os.getenv("ANALYZE_MAX_QUEUE_PER_CLIENT", "4"))
+
+# Маршрутизация по моделям Gemini
+ANALYZE_TIMEOUT = float(os.getenv("ANALYZE_TIMEOUT", "40"))  # бюджет на все попытки, секунды
+MODEL_FAILURE_THRESHOLD = int(os.getenv("MODEL_FAILURE_THRESHOLD", "3"))  # ошибок подряд до размыкания
+MODEL_CIRCUIT_OPEN_SECONDS = float(os.getenv("MODEL_CIRCUIT_OPEN_SECONDS", "30"))
+MODEL_QUOTA_COOLDOWN = float(os.getenv("MODEL_QUOTA_COOLDOWN", "60"))  # пауза после 429
+MODEL_EWMA_ALPHA = float(os.getenv("MODEL_EWMA_ALPHA", "0.2"))
+MODEL_ERROR_RATE_THRESHOLD = float(os.getenv("MODEL_ERROR_RATE_THRESHOLD", "0.5"))  # выше — модель в конце очереди
+
+# Служебные эндпоинты: пустой токен — без проверки
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Пакетный анализ
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "10"))
+
+# Фоновые задачи анализа
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+JOB_MAX_QUEUE = int(os.getenv("JOB_MAX_QUEUE", "1000"))
+# загруженные файлы задач в очереди и в работе хранятся в памяти; предел их общего размера, байт
+JOB_MAX_QUEUE_BYTES = int(os.getenv("JOB_MAX_QUEUE_BYTES", str(256 * 1024 * 1024)))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", "600"))  # хранение готового результата, секунды
+JOB_EVENTS_KEEPALIVE = float(os.getenv("JOB_EVENTS_KEEPALIVE", "15"))  # секунды между keep-alive в SSE
+
+# Логирование
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILE = os.getenv("LOG_FILE", "../api.log")  # пустая строка — только stdout
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # json — строки JSON, text — читаемый текст
+LOG_ACCESS_SAMPLE_RATE = float(os.getenv("LOG_ACCESS_SAMPLE_RATE", "1.0"))  # доля логируемых успешных запросов
+REQUEST_ID_HEADER = os.getenv("REQUEST_ID_HEADER", "X-Request-ID")
+
+# Общее состояние воркеров: memory — в памяти процесса, sqlite — файл на одном хосте, redis — общий сервер
+WORKERS = int(os.getenv("WORKERS", "1"))  # процессов uvicorn в production
+STATE_BACKEND = os.getenv("STATE_BACKEND", "memory")
+STATE_SQLITE_PATH = os.getenv(
+    "STATE_SQLITE_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "state.db")
+)
+STATE_REDIS_URL = os.getenv("STATE_REDIS_URL", "redis://localhost:6379/0")  # нужен пакет redis
+STATE_KEY_PREFIX = os.getenv("STATE_KEY_PREFIX", "food-api:")
+STATE_SYNC_INTERVAL = float(os.getenv("STATE_SYNC_INTERVAL", "1.0"))  # обновление состояния моделей, секунды
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))  # опрос задачи другого воркера, секунды
+
+# Нечёткое сопоставление названий в /search/
+SEARCH_MATCH_THRESHOLD = float(os.getenv("SEARCH_MATCH_THRESHOLD", "0.45"))  # оценка от 0 до 1
+SEARCH_LOCAL_MATCH_THRESHOLD = float(os.getenv("SEARCH_LOCAL_MATCH_THRESHOLD", "0.8"))  # ответ без запроса к источнику
+SEARCH_MAX_ALTERNATIVES = int(os.getenv("SEARCH_MAX_ALTERNATIVES", "3"))
+
+# Подсказки /search/suggest
+SUGGEST_MAX_ENTRIES = int(os.getenv("SUGGEST_MAX_ENTRIES", "200000"))  # названий в памяти процесса
+SUGGEST_SCAN_LIMIT = int(os.getenv("SUGGEST_SCAN_LIMIT", "2000"))  # ключей, просматриваемых для длинного префикса
+
+# Пакетный поиск /search/batch
+SEARCH_BATCH_MAX_NAMES = int(os.getenv("SEARCH_BATCH_MAX_NAMES", "50"))  # названий в одном запросе
+SEARCH_BATCH_CONCURRENCY = int(os.getenv("SEARCH_BATCH_CONCURRENCY", "8"))  # одновременных запросов к источнику
+
+# Бюджет времени запросов; клиент может сократить его заголовком REQUEST_TIMEOUT_HEADER
+ANALYZE_DEADLINE = float(os.getenv("ANALYZE_DEADLINE", "45"))  # бюджет запроса /analyze/, секунды
+SEARCH_DEADLINE = float(os.getenv("SEARCH_DEADLINE", "15"))  # бюджет запроса /search/, секунды
+REQUEST_TIMEOUT_HEADER = os.getenv("REQUEST_TIMEOUT_HEADER", "X-Request-Timeout")  # бюджет клиента, секунды
+
+# Запуск воркера: прогрев до готовности /ready
+WARMUP_CONNECTIONS = os.getenv("WARMUP_CONNECTIONS", "true").lower() in ("1", "true", "yes")  # соединения с источниками
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "5"))  # ожидание одного соединения при прогреве, секунды
@@ -0,0 +1,66 @@
+"""Бюджет времени запроса.
+
+Обработчик создаёт Deadline с общим сроком (клиент может сократить его заголовком
+REQUEST_TIMEOUT_HEADER) и передаёт вниз до каждого запроса к внешним сервисам:
+ожидание ограничено остатком бюджета, а по его истечении незавершённый запрос
+отменяется и больше не расходует квоту источника.
+"""
+from typing import Optional, Awaitable, TypeVar
+import asyncio
+import math
+import time
+
+T = TypeVar("T")
+
+
+class Deadline:
+    """Срок выполнения запроса по часам time.monotonic"""
+
+    def __init__(self, budget: float, capped: bool = False):
+        self.budget = budget
+        self.started = time.monotonic()
+        self.expires_at = self.started + budget
+        self.capped = capped  # срок задан пределом этапа, а не общим сроком запроса
+
+    @classmethod
+    def from_header(cls, value: Optional[str], default: float) -> "Deadline":
+        """Бюджет из заголовка клиента в секундах, не больше default; некорректное значение игнорируется"""
+        budget = default
+        if value:
+            try:
+                requested = float(value)
+            except ValueError:
+                requested = math.nan
+            if math.isfinite(requested) and requested > 0:
+                budget = min(requested, default)
+        return cls(budget)
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def limit(self, seconds: float) -> "Deadline":
+        """Срок этапа: не дольше seconds и не позже общего срока.
+
+        capped показывает, что срок ограничен самим этапом: общий срок истекает позже.
+        """
+        remaining = self.remaining()
+        if seconds <= remaining:
+            return Deadline(seconds, capped=True)
+        stage = Deadline(remaining)
+        # тот же момент истечения, что у общего срока, без погрешности пересчёта
+        stage.expires_at = self.expires_at
+        return stage
+
+    async def run(self, awaitable: Awaitable[T]) -> T:
+        """Ждёт awaitable не дольше остатка бюджета.
+
+        По истечении срока awaitable отменяется и поднимается asyncio.TimeoutError.
+        """
+        return await asyncio.wait_for(awaitable, timeout=self.remaining())
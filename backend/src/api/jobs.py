@@ -0,0 +1,195 @@
+from typing import Optional, Dict, List, Callable, Awaitable
+from dataclasses import dataclass, field
+from cachetools import TTLCache
+import asyncio
+import logging
+import secrets
+import json
+import time
+
+from src.api.config import JOB_WORKERS, JOB_MAX_QUEUE, JOB_MAX_QUEUE_BYTES, JOB_RETENTION, JOB_POLL_INTERVAL
+from src.api.state import StateBackend, safe
+from src.api.limits import QueueFull
+
+logger = logging.getLogger("api.jobs")
+
+JobHandler = Callable[[], Awaitable[dict]]
+
+
+@dataclass
+class Job:
+    """Фоновая задача анализа"""
+    id: str
+    handler: Optional[JobHandler]
+    status: str = "queued"  # queued, running, done
+    result: Optional[dict] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+    remote: bool = False  # задача выполняется другим воркером, состояние читается из хранилища
+    size: int = 0  # байт данных задачи в памяти до её завершения
+
+    def to_record(self) -> bytes:
+        return json.dumps({
+            "status": self.status, "result": self.result,
+            "created_at": self.created_at, "finished_at": self.finished_at
+        }, ensure_ascii=False).encode("utf-8")
+
+    def update(self, record: bytes) -> None:
+        data = json.loads(record)
+        self.status = data["status"]
+        self.result = data["result"]
+        self.created_at = data["created_at"]
+        self.finished_at = data["finished_at"]
+        if self.status == "done":
+            self.done.set()
+
+
+class JobQueue:
+    """Очередь фоновых задач с ограниченным числом обработчиков.
+
+    Готовые задачи хранятся retention секунд, после чего их результат недоступен.
+    Кроме числа задач ограничен общий размер их данных в памяти (max_bytes).
+    С общим хранилищем (backend) состояние задач публикуется, и узнать его можно
+    у любого воркера, а не только у принявшего задачу.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_queue: int = JOB_MAX_QUEUE, retention: float = JOB_RETENTION,
+                 poll_interval: float = JOB_POLL_INTERVAL, max_bytes: int = JOB_MAX_QUEUE_BYTES):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_bytes = max_bytes
+        self._bytes = 0  # размер данных задач в очереди и в работе
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self.backend: Optional[StateBackend] = None
+        self._pending: Dict[str, Job] = {}
+        self._finished: TTLCache = TTLCache(maxsize=max(max_queue, 1) * 10, ttl=retention)
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._publishing: Dict[str, asyncio.Task] = {}  # id задачи -> публикация состояния queued
+
+    def start(self) -> None:
+        """Запускает обработчики в текущем event loop"""
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Останавливает обработчики; незавершённые задачи теряются"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._loop = None
+        self._pending.clear()
+        self._bytes = 0
+
+    def _ensure_started(self) -> None:
+        if self._queue is None or self._loop is not asyncio.get_running_loop():
+            self.start()
+
+    def submit(self, handler: JobHandler, size: int = 0) -> Job:
+        """Ставит задачу в очередь; size — байт данных, которые handler держит в памяти.
+
+        При переполнении очереди по числу задач или по размеру данных — QueueFull.
+        """
+        self._ensure_started()
+        if self._bytes + size > self.max_bytes:
+            raise QueueFull(retry_after=1.0)
+        job = Job(id=secrets.token_hex(16), handler=handler, size=size)
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise QueueFull(retry_after=1.0)
+        self._bytes += size
+        self._pending[job.id] = job
+        if self.backend is not None:
+            # публикация не задерживает ответ; ссылка на задачу хранится до её завершения
+            task = asyncio.create_task(self._publish(job))
+            self._publishing[job.id] = task
+            task.add_done_callback(lambda _: self._publishing.pop(job.id, None))
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._pending.get(job_id) or self._finished.get(job_id)
+
+    async def find(self, job_id: str) -> Optional[Job]:
+        """Задача этого воркера или, с общим хранилищем, любого другого"""
+        job = self.get(job_id)
+        if job is not None or self.backend is None:
+            return job
+        record = await safe(self.backend.get(f"job:{job_id}"), None, "jobs")
+        if record is None:
+            return None
+        job = Job(id=job_id, handler=None, remote=True)
+        job.update(record)
+        return job
+
+    async def _publish(self, job: Job) -> None:
+        if self.backend is not None:
+            await safe(self.backend.set(f"job:{job.id}", job.to_record(), self.retention), what="jobs")
+
+    async def wait(self, job: Job, timeout: Optional[float] = None) -> bool:
+        """Ждёт завершения задачи. Возвращает False по таймауту"""
+        if job.remote and self.backend is not None:
+            return await self._poll(job, timeout)
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _poll(self, job: Job, timeout: Optional[float]) -> bool:
+        """Ожидание задачи другого воркера: опрос хранилища каждые poll_interval секунд"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not job.done.is_set():
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            await asyncio.sleep(self.poll_interval if remaining is None else min(self.poll_interval, remaining))
+            record = await safe(self.backend.get(f"job:{job.id}"), None, "jobs")
+            if record is not None:
+                job.update(record)
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            job.status = "running"
+            if job.id in self._publishing:
+                # состояние queued не должно перезаписать более позднее
+                await self._publishing[job.id]
+            await self._publish(job)
+            try:
+                job.result = await job.handler()
+            except Exception as err:
+                logger.error("Job %s failed: %r", job.id, err)
+                job.result = {"status": "error", "message": "Ошибка при анализе изображения"}
+            finally:
+                if job.result is None:
+                    job.result = {"status": "error", "message": "Ошибка при анализе изображения"}
+                job.status = "done"
+                # данные задачи освобождаются вместе с обработчиком
+                job.handler = None
+                self._bytes -= job.size
+                job.finished_at = time.time()
+                self._pending.pop(job.id, None)
+                self._finished[job.id] = job
+                job.done.set()
+                self._queue.task_done()
+            await self._publish(job)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "pending": len(self._pending),
+            "bytes": self._bytes,
+            "finished": len(self._finished),
+        }
+
+
+analyze_jobs = JobQueue()
@@ -0,0 +1,183 @@
+from typing import Optional, Dict, List, Tuple, AsyncIterator
+from contextlib import asynccontextmanager
+from fastapi import Request
+from cachetools import TTLCache
+import threading
+import asyncio
+import heapq
+import time
+
+from src.api.state import StateBackend, take_tokens, bucket_ttl, safe
+from src.api.config import (
+    RATE_LIMIT_RATE, RATE_LIMIT_BURST, RATE_LIMIT_MAX_CLIENTS, CLIENT_ID_HEADER, TRUST_CLIENT_ID,
+    TRUST_FORWARDED_FOR, FORWARDED_FOR_HOPS, ANALYZE_MAX_CONCURRENCY, ANALYZE_MAX_QUEUE, ANALYZE_MAX_QUEUE_PER_CLIENT
+)
+
+
+class QueueFull(Exception):
+    """Очередь ожидания переполнена"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Queue is full, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+def client_key(request: Request) -> str:
+    """Ключ клиента для лимитов: IP, а при TRUST_CLIENT_ID — идентификатор устройства.
+
+    Заголовок устройства задаёт сам клиент, поэтому без проверки на шлюзе новый
+    идентификатор в каждом запросе обходил бы лимиты. X-Forwarded-For учитывается
+    только при TRUST_FORWARDED_FOR (сервис за своим прокси): берётся адрес, записанный
+    FORWARDED_FOR_HOPS-м прокси с конца.
+    """
+    device_id = request.headers.get(CLIENT_ID_HEADER)
+    if device_id and TRUST_CLIENT_ID:
+        return f"device:{device_id[:128]}"
+    if TRUST_FORWARDED_FOR:
+        # прокси дописывают адреса в конец, начало заголовка задаёт сам клиент
+        forwarded = [address.strip() for address in request.headers.get("X-Forwarded-For", "").split(",")]
+        if FORWARDED_FOR_HOPS > 0 and len(forwarded) >= FORWARDED_FOR_HOPS and forwarded[-FORWARDED_FOR_HOPS]:
+            return f"ip:{forwarded[-FORWARDED_FOR_HOPS]}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+class TokenBucketLimiter:
+    """Ограничение частоты запросов алгоритмом token bucket для каждого клиента.
+
+    С общим хранилищем (backend) корзины общие для всех воркеров; при его недоступности
+    лимит считается локально.
+    """
+
+    def __init__(self, rate: float = RATE_LIMIT_RATE, burst: int = RATE_LIMIT_BURST,
+                 max_clients: int = RATE_LIMIT_MAX_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        # за время ttl пустая корзина гарантированно наполняется, поэтому вытеснение
+        # неактивного клиента равносильно полной корзине
+        self._buckets: TTLCache = TTLCache(maxsize=max_clients, ttl=bucket_ttl(rate, burst))  # ключ -> (токены, время)
+        self._lock = threading.Lock()
+        self.backend: Optional[StateBackend] = None
+
+    def acquire(self, key: str, tokens: float = 1.0) -> float:
+        """Списывает токены. Возвращает 0, если запрос разрешён, иначе сколько секунд ждать"""
+        now = time.monotonic()
+        with self._lock:
+            wait, self._buckets[key] = take_tokens(self._buckets.get(key), now, self.rate, self.burst, tokens)
+        return wait
+
+    async def aacquire(self, key: str, tokens: float = 1.0) -> float:
+        """То же, что acquire, но через общее хранилище, если оно подключено"""
+        if self.backend is not None:
+            wait = await safe(self.backend.take_tokens(f"rate:{key}", self.rate, self.burst, tokens),
+                              what="rate limit")
+            if wait is not None:
+                return wait
+        return self.acquire(key, tokens)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class FairScheduler:
+    """Общий лимит одновременных задач с честной очередью между клиентами.
+
+    Взвешенная справедливая очередь (start-time fair queueing): каждому ожидающему
+    назначается виртуальное время окончания с учётом веса клиента, освободившийся
+    слот получает ожидающий с наименьшим временем. Клиент, присылающий много запросов
+    подряд, не блокирует остальных.
+    """
+
+    def __init__(self, capacity: int = ANALYZE_MAX_CONCURRENCY, max_queue: int = ANALYZE_MAX_QUEUE,
+                 max_queue_per_client: int = ANALYZE_MAX_QUEUE_PER_CLIENT):
+        self.capacity = capacity
+        self.max_queue = max_queue
+        self.max_queue_per_client = max_queue_per_client
+        self.active = 0
+        self._virtual_time = 0.0
+        self._finish: Dict[str, float] = {}  # ключ клиента -> последнее виртуальное время окончания
+        self._queued: Dict[str, int] = {}
+        self._heap: List[Tuple[float, int, str, asyncio.Future]] = []
+        self._counter = 0
+
+    @property
+    def queued(self) -> int:
+        return sum(self._queued.values())
+
+    def _enqueue(self, key: str, weight: float, limited: bool) -> asyncio.Future:
+        if limited and (self.queued >= self.max_queue or self._queued.get(key, 0) >= self.max_queue_per_client):
+            raise QueueFull(retry_after=1.0)
+        start = max(self._virtual_time, self._finish.get(key, 0.0))
+        finish = start + 1.0 / max(weight, 1e-6)
+        self._finish[key] = finish
+        self._queued[key] = self._queued.get(key, 0) + 1
+        future = asyncio.get_running_loop().create_future()
+        self._counter += 1
+        heapq.heappush(self._heap, (finish, self._counter, key, future))
+        return future
+
+    def _dequeued(self, key: str) -> None:
+        self._queued[key] -= 1
+        if not self._queued[key]:
+            del self._queued[key]
+            if not self._heap and not self.active:
+                self._finish.clear()
+
+    def _withdraw(self, key: str, future: asyncio.Future) -> None:
+        """Убирает ожидающего, который ушёл из очереди (отмена или таймаут), из учёта очереди"""
+        for index, entry in enumerate(self._heap):
+            if entry[3] is future:
+                self._heap[index] = self._heap[-1]
+                self._heap.pop()
+                heapq.heapify(self._heap)
+                self._dequeued(key)
+                return
+
+    def _release(self) -> None:
+        """Передаёт освободившийся слот следующему ожидающему"""
+        while self._heap:
+            finish, _, key, future = heapq.heappop(self._heap)
+            self._dequeued(key)
+            if not future.done():
+                self._virtual_time = finish
+                future.set_result(None)
+                return
+        self.active -= 1
+        if not self.active and not self._heap:
+            self._virtual_time = 0.0
+            self._finish.clear()
+
+    @asynccontextmanager
+    async def slot(self, key: str, weight: float = 1.0, timeout: Optional[float] = None,
+                   limited: bool = True) -> AsyncIterator[None]:
+        """Занимает слот, при необходимости дожидаясь своей очереди.
+
+        Если слот не освободился за timeout секунд, поднимается asyncio.TimeoutError.
+        limited=False — ожидание без лимитов очереди, для задач, число которых уже
+        ограничено снаружи (фоновые задачи анализа).
+        """
+        if self.active < self.capacity and not self._heap:
+            self.active += 1
+        else:
+            future = self._enqueue(key, weight, limited)
+            try:
+                await asyncio.wait_for(future, timeout)
+            except (asyncio.CancelledError, asyncio.TimeoutError):
+                if future.done() and not future.cancelled():
+                    # слот уже передан, но ожидающий отменён
+                    self._release()
+                else:
+                    future.cancel()
+                    self._withdraw(key, future)
+                raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> Dict[str, int]:
+        return {"active": self.active, "queued": self.queued, "capacity": self.capacity}
+
+
+rate_limiter = TokenBucketLimiter()
+analyze_scheduler = FairScheduler()
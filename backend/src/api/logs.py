@@ -0,0 +1,106 @@
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+import logging
+import atexit
+import queue
+import json
+import sys
+
+from src.api.config import LOG_LEVEL, LOG_FILE, LOG_FORMAT
+
+# идентификатор текущего HTTP-запроса, попадает в каждую запись лога
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+# атрибуты LogRecord, которые не считаются дополнительными полями
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+_listener: Optional[QueueListener] = None
+
+
+class RequestIdFilter(logging.Filter):
+    """Добавляет в запись идентификатор запроса из контекста"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Запись лога одной строкой JSON; поля из extra= выводятся как есть"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """QueueHandler без форматирования в вызывающем потоке.
+
+    Записи не покидают процесс, поэтому сообщение собирается и пишется
+    в потоке QueueListener, а event loop только кладёт запись в очередь.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _build_formatter(fmt: str) -> logging.Formatter:
+    if fmt == "text":
+        return logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s")
+    return JsonFormatter()
+
+
+def setup_logging(level: str = LOG_LEVEL, path: str = LOG_FILE, fmt: str = LOG_FORMAT) -> QueueListener:
+    """Настраивает корневой логгер: очередь в памяти и фоновый поток записи.
+
+    Повторный вызов заменяет ранее запущенный поток записи.
+    """
+    global _listener
+    stop_logging()
+
+    formatter = _build_formatter(fmt)
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if path:
+        handlers.append(RotatingFileHandler(path, maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    for handler in [h for h in root.handlers if isinstance(h, QueueHandler)]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging() -> None:
+    """Дописывает накопленные записи и останавливает поток записи"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
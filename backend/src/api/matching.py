@@ -0,0 +1,214 @@
+"""Нечёткое сопоставление названий продуктов.
+
+Названия нормализуются (регистр, ё → е, пунктуация, окончания слов), кандидаты
+отбираются по индексу триграмм, а оценка считается векторно: близость наборов
+триграмм основ (косинус) и доля общих корней слов (коэффициент Жаккара), где у
+корня отброшены приставки и суффиксы причастий: "варёная" и "отварная" совпадают.
+"""
+from typing import Optional, List, Dict, Iterable, NamedTuple
+from collections import Counter
+import math
+import re
+
+from src.api.config import SEARCH_MATCH_THRESHOLD
+
+# вес близости триграмм в итоговой оценке, остальное — совпадение корней слов
+TRIGRAM_WEIGHT = 0.6
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+# служебные слова не влияют на сопоставление
+_STOP_WORDS = frozenset({"в", "во", "и", "с", "со", "на", "без", "из", "для", "по", "от", "к"})
+
+# окончания прилагательных, причастий и существительных, длинные проверяются первыми
+_ENDINGS = tuple(sorted({
+    "ими", "ыми", "его", "ого", "ему", "ому", "ая", "яя", "ое", "ее", "ые", "ие", "ый", "ий", "ой",
+    "ую", "юю", "ых", "их", "ым", "им", "ом", "ем",
+    "ями", "ами", "ах", "ях", "ов", "ев", "ей", "ам", "ям", "ью",
+    "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+}, key=len, reverse=True))
+
+# приставки и суффиксы причастий, отбрасываемые у корня
+_PREFIXES = ("пере", "при", "под", "раз", "про", "от", "об", "вы", "за")
+_SUFFIXES = ("енн", "анн", "ен", "ан", "н")
+
+# основа не короче этого числа букв
+_MIN_STEM = 3
+
+_NOT_LOADED = object()
+np = _NOT_LOADED  # numpy загружается при первом поиске; None — numpy не установлен
+
+
+def load_numpy():
+    """Импортирует numpy при первом вызове; без numpy оценки считаются в цикле"""
+    global np
+    if np is _NOT_LOADED:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        np = numpy
+    return np
+
+
+class Match(NamedTuple):
+    """Найденное название и его оценка от 0 до 1"""
+    name: str
+    score: float
+
+
+def normalize_text(text: str) -> str:
+    """Нижний регистр, ё → е, пунктуация заменена пробелами"""
+    return _NON_WORD.sub(" ", text.lower().replace("ё", "е")).strip()
+
+
+def stem(word: str) -> str:
+    """Упрощённый стемминг: отбрасывает окончание, если остаётся основа не короче _MIN_STEM"""
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def root(word_stem: str) -> str:
+    """Корень основы: без приставки и суффикса причастия, если остаётся не меньше _MIN_STEM букв"""
+    for prefix in _PREFIXES:
+        if word_stem.startswith(prefix) and len(word_stem) - len(prefix) >= _MIN_STEM:
+            word_stem = word_stem[len(prefix):]
+            break
+    for suffix in _SUFFIXES:
+        if word_stem.endswith(suffix) and len(word_stem) - len(suffix) >= _MIN_STEM:
+            return word_stem[:-len(suffix)]
+    return word_stem
+
+
+def name_stems(name: str) -> List[str]:
+    """Основы значимых слов названия без повторов, в исходном порядке"""
+    words = [word for word in normalize_text(name).split() if word not in _STOP_WORDS]
+    return list(dict.fromkeys(stem(word) for word in words))
+
+
+def name_tokens(name: str) -> List[str]:
+    """Корни значимых слов названия без повторов"""
+    return list(dict.fromkeys(root(word_stem) for word_stem in name_stems(name)))
+
+
+def trigrams(tokens: Iterable[str]) -> List[str]:
+    """Триграммы основ с границами слов"""
+    result = set()
+    for token in tokens:
+        padded = f" {token} "
+        result.update(padded[index:index + 3] for index in range(len(padded) - 2))
+    return sorted(result)
+
+
+class NameMatcher:
+    """Индекс названий для нечёткого поиска.
+
+    Хранит списки названий по триграммам и корням слов; при поиске общие триграммы
+    и корни кандидатов подсчитываются одной операцией над массивами.
+    """
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.names: List[str] = []
+        self._ids: Dict[str, int] = {}
+        self._trigram_postings: Dict[str, List[int]] = {}
+        self._token_postings: Dict[str, List[int]] = {}
+        self._trigram_counts: List[int] = []
+        self._token_counts: List[int] = []
+        self._arrays: Dict[str, object] = {}  # кеш массивов numpy для списков и счётчиков
+        for name in names:
+            self.add(name)
+
+    def add(self, name: str) -> bool:
+        """Добавляет название. Возвращает False, если оно уже есть или не содержит слов"""
+        if name in self._ids:
+            return False
+        stems = name_stems(name)
+        if not stems:
+            return False
+        tokens = list(dict.fromkeys(root(word_stem) for word_stem in stems))
+        index = len(self.names)
+        self._ids[name] = index
+        self.names.append(name)
+        grams = trigrams(stems)
+        for gram in grams:
+            self._trigram_postings.setdefault(gram, []).append(index)
+            self._arrays.pop("t:" + gram, None)
+        for token in tokens:
+            self._token_postings.setdefault(token, []).append(index)
+            self._arrays.pop("w:" + token, None)
+        self._trigram_counts.append(len(grams))
+        self._token_counts.append(len(tokens))
+        self._arrays.pop("trigram_counts", None)
+        self._arrays.pop("token_counts", None)
+        return True
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._ids
+
+    def _array(self, key: str, values: List[int]):
+        array = self._arrays.get(key)
+        if array is None:
+            array = self._arrays[key] = np.asarray(values, dtype=np.int64)
+        return array
+
+    def rank(self, query: str, limit: int = 5, threshold: float = SEARCH_MATCH_THRESHOLD) -> List[Match]:
+        """Лучшие совпадения с оценкой не ниже threshold, по убыванию оценки"""
+        stems = name_stems(query)
+        tokens = list(dict.fromkeys(root(word_stem) for word_stem in stems))
+        query_trigrams = trigrams(stems)
+        grams = [gram for gram in query_trigrams if gram in self._trigram_postings]
+        if not grams or limit <= 0:
+            return []
+        query_grams = len(query_trigrams)
+        words = [token for token in tokens if token in self._token_postings]
+        if load_numpy() is None:
+            return self._rank_python(grams, query_grams, tokens, words, limit, threshold)
+
+        ids = np.concatenate([self._array("t:" + gram, self._trigram_postings[gram]) for gram in grams])
+        candidates, shared = np.unique(ids, return_counts=True)
+        trigram_counts = self._array("trigram_counts", self._trigram_counts)[candidates]
+        score = TRIGRAM_WEIGHT * shared / np.sqrt(query_grams * trigram_counts)
+
+        shared_words = np.zeros(len(candidates))
+        if words:
+            word_ids, word_counts = np.unique(
+                np.concatenate([self._array("w:" + word, self._token_postings[word]) for word in words]),
+                return_counts=True
+            )
+            # название с общим корнем обычно есть среди кандидатов по триграммам, остальные не учитываются
+            positions = np.minimum(np.searchsorted(candidates, word_ids), len(candidates) - 1)
+            found = candidates[positions] == word_ids
+            shared_words[positions[found]] = word_counts[found]
+        token_counts = self._array("token_counts", self._token_counts)[candidates]
+        score += (1 - TRIGRAM_WEIGHT) * shared_words / (len(tokens) + token_counts - shared_words)
+
+        order = np.argsort(-score, kind="stable")[:limit]
+        return [
+            Match(self.names[candidates[index]], round(float(score[index]), 4))
+            for index in order if score[index] >= threshold
+        ]
+
+    def _rank_python(self, grams: List[str], query_grams: int, tokens: List[str], words: List[str],
+                     limit: int, threshold: float) -> List[Match]:
+        shared = Counter(index for gram in grams for index in self._trigram_postings[gram])
+        shared_words = Counter(index for word in words for index in self._token_postings[word])
+        scored = []
+        for index, count in shared.items():
+            common = shared_words.get(index, 0)
+            score = TRIGRAM_WEIGHT * count / math.sqrt(query_grams * self._trigram_counts[index])
+            score += (1 - TRIGRAM_WEIGHT) * common / (len(tokens) + self._token_counts[index] - common)
+            if score >= threshold:
+                scored.append((-score, index))
+        scored.sort()
+        return [Match(self.names[index], round(-score, 4)) for score, index in scored[:limit]]
+
+
+def best_match(query: str, names: Iterable[str], threshold: float = SEARCH_MATCH_THRESHOLD) -> Optional[Match]:
+    """Лучшее совпадение среди names или None"""
+    matches = NameMatcher(names).rank(query, limit=1, threshold=threshold)
+    return matches[0] if matches else None
@@ -0,0 +1,190 @@
+from typing import Dict, Tuple, List, Sequence
+from contextlib import contextmanager
+from bisect import bisect_left
+import threading
+import time
+
+# границы корзин гистограмм по умолчанию, секунды
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 45.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Метрика с метками в формате Prometheus"""
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Sequence[str]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}")
+        return tuple(str(label) for label in labels)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track(self, *labels: str):
+        """Увеличивает значение на время выполнения блока"""
+        self.inc(*labels)
+        try:
+            yield
+        finally:
+            self.dec(*labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], List[float]] = {}  # счётчики корзин + [сумма, количество]
+
+    def observe(self, *labels: str, value: float) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                data[index] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    @contextmanager
+    def time(self, *labels: str):
+        """Замеряет длительность блока"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(*labels, value=time.perf_counter() - started)
+
+    def count(self, *labels: str) -> int:
+        data = self._values.get(self._key(labels))
+        return int(data[-1]) if data else 0
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, data in sorted(self._values.items()):
+                cumulative = 0.0
+                for bound, count in zip(self.buckets, data):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                    lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+                labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{labels} {_format_value(data[-1])}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(data[-2])}")
+                lines.append(f"{self.name}_count{labels} {_format_value(data[-1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "food_api_stage_duration_seconds", "Длительность этапов обработки запроса", ("endpoint", "stage")
+))
+GEMINI_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "food_api_gemini_request_duration_seconds", "Длительность запроса к Gemini", ("model", "outcome")
+))
+UPSTREAM_RATE_LIMITED = REGISTRY.register(Counter(
+    "food_api_upstream_rate_limited_total", "Ответы 429 от внешних сервисов", ("upstream", "model")
+))
+ANALYZE_RESULTS = REGISTRY.register(Counter(
+    "food_api_analyze_results_total", "Результаты анализа изображений по статусу", ("status",)
+))
+SEARCH_RESULTS = REGISTRY.register(Counter(
+    "food_api_search_results_total", "Результаты поиска по статусу", ("status",)
+))
+SEARCH_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "food_api_search_cache_lookups_total", "Обращения к кешу поиска", ("result",)
+))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    "food_api_in_flight", "Выполняющиеся операции", ("operation",)
+))
+DEADLINE_BUDGET_USED = REGISTRY.register(Histogram(
+    "food_api_deadline_budget_used_ratio", "Доля бюджета времени запроса, израсходованная этапом",
+    ("endpoint", "stage"), buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0)
+))
+DEADLINE_EXCEEDED = REGISTRY.register(Counter(
+    "food_api_deadline_exceeded_total", "Запросы, не уложившиеся в бюджет времени", ("endpoint",)
+))
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "food_api_http_request_duration_seconds", "Длительность HTTP-запросов", ("method", "route", "status")
+))
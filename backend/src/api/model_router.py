@@ -0,0 +1,211 @@
+from dataclasses import dataclass, asdict
+from typing import Optional, List, Dict, Iterable
+import logging
+import json
+import time
+
+from src.api.state import StateBackend, safe
+from src.api.config import (
+    MODEL_FAILURE_THRESHOLD, MODEL_CIRCUIT_OPEN_SECONDS, MODEL_QUOTA_COOLDOWN,
+    MODEL_EWMA_ALPHA, MODEL_ERROR_RATE_THRESHOLD, STATE_SYNC_INTERVAL
+)
+from src.env import work_models
+
+logger = logging.getLogger("api.model_router")
+
+
+def classify_error(err: Exception) -> str:
+    """Тип ошибки Gemini: quota (429), invalid (400) или error"""
+    code = getattr(err, "code", None)
+    text = str(err)
+    if code == 429 or ('429' in text and 'RESOURCE_EXHAUSTED' in text):
+        return "quota"
+    if code == 400 or ('400' in text and 'INVALID_ARGUMENT' in text):
+        return "invalid"
+    return "error"
+
+
+@dataclass
+class ModelState:
+    """Состояние модели: задержка, доля ошибок, квота и автомат размыкания"""
+    name: str
+    priority: int
+    latency_ewma: Optional[float] = None  # секунды
+    error_rate: float = 0.0  # EWMA доли неудачных запросов
+    consecutive_failures: int = 0
+    requests: int = 0
+    failures: int = 0
+    quota_exhausted_until: float = 0.0  # time.monotonic()
+    circuit_open_until: float = 0.0
+    half_open: bool = False  # после размыкания разрешён один пробный запрос
+    probing: bool = False  # пробный запрос уже выполняется
+    last_error: Optional[str] = None
+
+    def available(self, now: float) -> bool:
+        return now >= self.quota_exhausted_until and now >= self.circuit_open_until
+
+
+class ModelRouter:
+    """Выбор модели Gemini с учётом здоровья, квот и размыкания цепи.
+
+    Модели перебираются в порядке приоритета из work_models; модели с исчерпанной
+    квотой или разомкнутой цепью пропускаются, а с высокой долей ошибок идут последними.
+
+    С общим хранилищем (backend) воркеры обмениваются исчерпанием квоты и размыканием
+    цепи; задержка и доля ошибок считаются в каждом процессе отдельно.
+    """
+
+    def __init__(self, models: Iterable[str] = work_models, failure_threshold: int = MODEL_FAILURE_THRESHOLD,
+                 open_seconds: float = MODEL_CIRCUIT_OPEN_SECONDS, quota_cooldown: float = MODEL_QUOTA_COOLDOWN,
+                 alpha: float = MODEL_EWMA_ALPHA, error_rate_threshold: float = MODEL_ERROR_RATE_THRESHOLD):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.quota_cooldown = quota_cooldown
+        self.alpha = alpha
+        self.error_rate_threshold = error_rate_threshold
+        self._states: Dict[str, ModelState] = {
+            name: ModelState(name=name, priority=index) for index, name in enumerate(models)
+        }
+        self.backend: Optional[StateBackend] = None
+        self.sync_interval = STATE_SYNC_INTERVAL
+        self._synced = float("-inf")
+
+    def candidates(self) -> List[str]:
+        """Доступные модели в порядке попыток"""
+        now = time.monotonic()
+        available = [
+            state for state in self._states.values()
+            if state.available(now) and not (state.half_open and state.probing)
+        ]
+        available.sort(key=lambda state: (state.error_rate > self.error_rate_threshold, state.priority))
+        return [state.name for state in available]
+
+    def acquire(self, model: str) -> bool:
+        """Занимает модель перед запросом. У полуоткрытой цепи одновременно выполняется
+        только один пробный запрос: пока он идёт, остальные получают False и пробуют другую модель"""
+        state = self._state(model)
+        if not state.half_open:
+            return True
+        if state.probing:
+            return False
+        state.probing = True
+        return True
+
+    def release(self, model: str) -> None:
+        """Освобождает пробный запрос: вызывается после любого исхода, включая отмену"""
+        self._state(model).probing = False
+
+    def quota_exhausted(self) -> bool:
+        """Исчерпана ли квота у всех моделей"""
+        now = time.monotonic()
+        return bool(self._states) and all(now < state.quota_exhausted_until for state in self._states.values())
+
+    def _state(self, model: str) -> ModelState:
+        if model not in self._states:
+            self._states[model] = ModelState(name=model, priority=len(self._states))
+        return self._states[model]
+
+    def _observe(self, state: ModelState, latency: float, failed: bool) -> None:
+        state.requests += 1
+        state.error_rate += self.alpha * (float(failed) - state.error_rate)
+        if state.latency_ewma is None:
+            state.latency_ewma = latency
+        else:
+            state.latency_ewma += self.alpha * (latency - state.latency_ewma)
+
+    def record_success(self, model: str, latency: float) -> bool:
+        """Учитывает успешный ответ. Возвращает True, если цепь была разомкнута и теперь замкнута"""
+        state = self._state(model)
+        self._observe(state, latency, failed=False)
+        changed = state.half_open or state.circuit_open_until > 0
+        state.consecutive_failures = 0
+        state.half_open = False
+        state.probing = False
+        state.circuit_open_until = 0.0
+        return changed
+
+    def record_failure(self, model: str, kind: str, latency: float) -> bool:
+        """Учитывает ошибку. Возвращает True, если модель стала недоступна (квота или размыкание цепи).
+
+        Неверный запрос (invalid) — ошибка клиента, а не модели: он не влияет на долю ошибок и цепь.
+        """
+        state = self._state(model)
+        state.last_error = kind
+        state.probing = False
+        if kind == "invalid":
+            return False
+        self._observe(state, latency, failed=True)
+        now = time.monotonic()
+        state.failures += 1
+        if kind == "quota":
+            # квота не говорит о неисправности модели, цепь не размыкается
+            state.quota_exhausted_until = now + self.quota_cooldown
+            logger.warning("Model %s quota exhausted for %.0fs", model, self.quota_cooldown)
+            return True
+        state.consecutive_failures += 1
+        if state.half_open or state.consecutive_failures >= self.failure_threshold:
+            state.circuit_open_until = now + self.open_seconds
+            state.half_open = True
+            logger.warning("Model %s circuit opened for %.0fs after %s", model, self.open_seconds, kind)
+            return True
+        return False
+
+    async def pull(self) -> None:
+        """Применяет квоты и размыкания, записанные другими воркерами (не чаще sync_interval)"""
+        if self.backend is None or time.monotonic() - self._synced < self.sync_interval:
+            return
+        self._synced = time.monotonic()
+        names = list(self._states)
+        records = await safe(self.backend.get_many([f"model:{name}" for name in names]), [], "model state")
+        # в хранилище время по часам (time.time), локально — time.monotonic
+        offset = time.monotonic() - time.time()
+        for name, raw in zip(names, records):
+            if raw is None:
+                continue
+            record = json.loads(raw)
+            state = self._states[name]
+            state.quota_exhausted_until = max(state.quota_exhausted_until, record["quota_until"] + offset)
+            circuit_until = record["circuit_until"] + offset
+            if circuit_until > state.circuit_open_until:
+                state.circuit_open_until = circuit_until
+                state.half_open = True
+
+    async def push(self, model: str) -> None:
+        """Публикует квоту и состояние цепи модели для других воркеров"""
+        if self.backend is None:
+            return
+        state = self._state(model)
+        key = f"model:{model}"
+        offset = time.time() - time.monotonic()
+        raw = await safe(self.backend.get(key), None, "model state")
+        shared = json.loads(raw) if raw else {"quota_until": 0.0, "circuit_until": 0.0}
+        quota_until = state.quota_exhausted_until + offset if state.quota_exhausted_until else 0.0
+        circuit_until = state.circuit_open_until + offset if state.circuit_open_until else 0.0
+        record = {
+            "quota_until": max(shared["quota_until"], quota_until),
+            # успешный запрос замыкает цепь для всех воркеров
+            "circuit_until": max(shared["circuit_until"], circuit_until) if circuit_until else 0.0,
+        }
+        ttl = max(self.quota_cooldown, self.open_seconds, 1.0)
+        await safe(self.backend.set(key, json.dumps(record).encode("utf-8"), ttl), what="model state")
+
+    def snapshot(self) -> List[dict]:
+        """Состояние моделей для служебного эндпоинта"""
+        now = time.monotonic()
+        result = []
+        for state in sorted(self._states.values(), key=lambda item: item.priority):
+            data = asdict(state)
+            data["available"] = state.available(now)
+            data["quota_exhausted_for"] = round(max(0.0, state.quota_exhausted_until - now), 1)
+            data["circuit_open_for"] = round(max(0.0, state.circuit_open_until - now), 1)
+            del data["quota_exhausted_until"], data["circuit_open_until"]
+            result.append(data)
+        return result
+
+    def reset(self) -> None:
+        for state in self._states.values():
+            self._states[state.name] = ModelState(name=state.name, priority=state.priority)
+        self._synced = float("-inf")
+
+
+model_router = ModelRouter()
@@ -0,0 +1,258 @@
+"""Локальный индекс пищевой ценности продуктов.
+
+Хранит продукты в формате health-diet.ru (название + строка info) в SQLite и заранее
+считает медианные КБЖУ для каждого набора слов названия.
+
+Импорт выгрузки:
+    python -m src.api.nutrition_db import foods.csv
+    python -m src.api.nutrition_db import foods.jsonl
+"""
+from typing import Optional, Iterable, Iterator, Tuple, List, Dict
+from statistics import median
+from pathlib import Path
+import threading
+import argparse
+import sqlite3
+import logging
+import json
+import csv
+
+from src.api.cache import normalize_query
+from src.api.matching import NameMatcher
+from src.api.config import NUTRITION_DB_PATH, SEARCH_LOCAL_MATCH_THRESHOLD
+
+logger = logging.getLogger("api.nutrition_db")
+
+NUTRIENTS = ("calories", "proteins", "fats", "carbohydrates")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS foods (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    info TEXT NOT NULL,
+    calories REAL NOT NULL,
+    proteins REAL NOT NULL,
+    fats REAL NOT NULL,
+    carbohydrates REAL NOT NULL,
+    UNIQUE (name, info)
+);
+CREATE INDEX IF NOT EXISTS foods_name_key ON foods (name_key);
+CREATE TABLE IF NOT EXISTS nutrition (
+    name_key TEXT PRIMARY KEY,
+    calories REAL NOT NULL,
+    proteins REAL NOT NULL,
+    fats REAL NOT NULL,
+    carbohydrates REAL NOT NULL,
+    samples INTEGER NOT NULL
+);
+"""
+
+
+def parse_food_info(info: str) -> Dict[str, float]:
+    """Разбирает строку вида "47 ккал, Б 0.4, Ж 0.4, У 9.8" в словарь КБЖУ"""
+    nutrients = {"calories": 0.0, "proteins": 0.0, "fats": 0.0, "carbohydrates": 0.0}
+    for f_c in info.split(', '):
+        parts = f_c.split()
+        if not parts:
+            continue
+        if f_c.endswith('ккал'):
+            nutrients["calories"] = float(parts[0])
+        elif parts[0] == 'Б':
+            nutrients["proteins"] = float(parts[1])
+        elif parts[0] == 'Ж':
+            nutrients["fats"] = float(parts[1])
+        elif parts[0] == 'У':
+            nutrients["carbohydrates"] = float(parts[1])
+    return nutrients
+
+
+def median_nutrients(samples: List[Dict[str, float]]) -> Optional[dict]:
+    """Медианные КБЖУ на 100 г по списку продуктов"""
+    if not samples:
+        return None
+    result = {key: round(median(sample[key] for sample in samples), 2) for key in NUTRIENTS}
+    result["weight"] = 100.0
+    return result
+
+
+class NutritionIndex:
+    """Индекс продуктов в SQLite с медианными КБЖУ по нормализованному названию"""
+
+    def __init__(self, path: str = NUTRITION_DB_PATH):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._matcher: Optional[NameMatcher] = None  # строится при первом нечётком поиске
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ":memory:":
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def lookup(self, name: str) -> Optional[dict]:
+        """Медианные КБЖУ для названия или None, если его нет в индексе"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT calories, proteins, fats, carbohydrates FROM nutrition WHERE name_key = ?",
+                (normalize_query(name),)
+            ).fetchone()
+        if row is None:
+            return None
+        result = dict(zip(NUTRIENTS, row))
+        result["weight"] = 100.0
+        return result
+
+    def match(self, name: str, threshold: float = SEARCH_LOCAL_MATCH_THRESHOLD) -> Optional[dict]:
+        """Нечёткий поиск: медианные КБЖУ ближайшего названия с оценкой не ниже threshold.
+
+        В результат добавляются найденное название (matched_name) и оценка (score).
+        """
+        with self._lock:
+            conn = self._connect()
+            if self._matcher is None:
+                self._matcher = NameMatcher(row[0] for row in conn.execute("SELECT name_key FROM nutrition"))
+            matches = self._matcher.rank(name, limit=1, threshold=threshold)
+            if not matches:
+                return None
+            key, score = matches[0]
+            row = conn.execute(
+                "SELECT n.calories, n.proteins, n.fats, n.carbohydrates, f.name FROM nutrition n "
+                "JOIN foods f ON f.name_key = n.name_key WHERE n.name_key = ? LIMIT 1",
+                (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        result = dict(zip(NUTRIENTS, row[:4]))
+        result["weight"] = 100.0
+        result["matched_name"] = row[4]
+        result["score"] = score
+        return result
+
+    def names(self) -> List[Tuple[str, dict]]:
+        """Название и медианные КБЖУ для каждого набора слов в индексе"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT MIN(f.name), n.calories, n.proteins, n.fats, n.carbohydrates FROM nutrition n "
+                "JOIN foods f ON f.name_key = n.name_key GROUP BY n.name_key"
+            ).fetchall()
+        return [(row[0], {**dict(zip(NUTRIENTS, row[1:])), "weight": 100.0}) for row in rows]
+
+    def add_foods(self, foods: Iterable[Tuple[str, str]]) -> int:
+        """Добавляет продукты (название, info) и пересчитывает медианы затронутых названий.
+
+        Возвращает число новых записей. Строки с некорректным info пропускаются.
+        """
+        rows = []
+        for name, info in foods:
+            if not name or not info:
+                continue
+            try:
+                nutrients = parse_food_info(info)
+            except (ValueError, IndexError):
+                logger.debug("Skip food with bad info: %r %r", name, info)
+                continue
+            rows.append((name, normalize_query(name), info, *(nutrients[key] for key in NUTRIENTS)))
+        if not rows:
+            return 0
+
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                before = conn.total_changes
+                conn.executemany(
+                    "INSERT OR IGNORE INTO foods (name, name_key, info, calories, proteins, fats, carbohydrates) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                added = conn.total_changes - before
+                keys = {row[1] for row in rows}
+                self._refresh_medians(conn, keys)
+            if self._matcher is not None:
+                for key in keys:
+                    self._matcher.add(key)
+        return added
+
+    @staticmethod
+    def _refresh_medians(conn: sqlite3.Connection, keys: Iterable[str]) -> None:
+        for key in keys:
+            samples = [
+                dict(zip(NUTRIENTS, row)) for row in conn.execute(
+                    "SELECT calories, proteins, fats, carbohydrates FROM foods WHERE name_key = ?", (key,)
+                )
+            ]
+            result = median_nutrients(samples)
+            if result is None:
+                continue
+            conn.execute(
+                "INSERT OR REPLACE INTO nutrition (name_key, calories, proteins, fats, carbohydrates, samples) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, *(result[nutrient] for nutrient in NUTRIENTS), len(samples))
+            )
+
+    def import_file(self, path: str, batch_size: int = 5000) -> int:
+        """Импортирует выгрузку CSV (колонки name, info) или JSONL ({"name", "info"})"""
+        added = 0
+        batch = []
+        for item in _read_dump(path):
+            batch.append(item)
+            if len(batch) >= batch_size:
+                added += self.add_foods(batch)
+                batch.clear()
+        added += self.add_foods(batch)
+        return added
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT COUNT(*) FROM nutrition").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._matcher = None
+
+
+def _read_dump(path: str) -> Iterator[Tuple[str, str]]:
+    """Читает пары (название, info) из CSV или JSONL"""
+    with open(path, encoding="utf-8", newline="") as file:
+        if path.endswith((".jsonl", ".ndjson")):
+            for line in file:
+                if line.strip():
+                    item = json.loads(line)
+                    yield item.get("name", ""), item.get("info", "")
+        else:
+            for item in csv.DictReader(file):
+                yield item.get("name", ""), item.get("info", "")
+
+
+nutrition_index = NutritionIndex()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Локальный индекс пищевой ценности")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    import_parser = subparsers.add_parser("import", help="Импорт выгрузки CSV/JSONL")
+    import_parser.add_argument("files", nargs="+")
+    import_parser.add_argument("--db", default=NUTRITION_DB_PATH, help="Путь к базе SQLite")
+    args = parser.parse_args(argv)
+
+    index = NutritionIndex(args.db)
+    try:
+        for path in args.files:
+            added = index.import_file(path)
+            print(f"{path}: добавлено {added}")
+        print(f"Названий в индексе: {len(index)}")
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()
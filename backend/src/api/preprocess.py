@@ -0,0 +1,333 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Optional, Dict, Tuple, NamedTuple, TYPE_CHECKING
+from PIL import Image, ImageOps
+from io import BytesIO
+import asyncio
+import logging
+import time
+import zlib
+
+from src.api.cache import perceptual_hash
+from src.api.config import (
+    PREPROCESS_WORKERS, IMAGE_MAX_EDGE, IMAGE_FORMAT, IMAGE_QUALITY, IMAGE_PASSTHROUGH_MAX_SIZE
+)
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+logger = logging.getLogger("api.preprocess")
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+# маркеры начала кадра JPEG (SOF), в которых записаны размеры
+_JPEG_SOF = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+# допустимые размеры исходного изображения, пикселей по каждой стороне
+IMAGE_MAX_SOURCE_EDGE = 2500
+IMAGE_MIN_SOURCE_EDGE = 100
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+class ImageSizeError(ValueError):
+    """Размеры изображения вне допустимых пределов"""
+
+
+def size_error(width: int, height: int) -> Optional[str]:
+    """Сообщение об ошибке, если размеры изображения недопустимы, иначе None"""
+    if width > IMAGE_MAX_SOURCE_EDGE or height > IMAGE_MAX_SOURCE_EDGE:
+        return "Изображение слишком длинное или слишком широкое"
+    elif width < IMAGE_MIN_SOURCE_EDGE or height < IMAGE_MIN_SOURCE_EDGE:
+        return "Изображение слишком короткое или слишком узкое"
+    return None
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    """Изображение, подготовленное к отправке в Gemini"""
+    data: bytes
+    mime_type: str
+    width: int  # исходные размеры, по ним проверяются ограничения
+    height: int
+    dhash: Optional[int]  # None — файл отправлен как есть, без декодирования
+    timings: Dict[str, float] = field(default_factory=dict)  # длительность этапов, мс
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.width, self.height
+
+    def to_part(self) -> "types.Part":
+        from google.genai import types
+        return types.Part.from_bytes(data=self.data, mime_type=self.mime_type)
+
+
+class ImageHeader(NamedTuple):
+    """Тип и размеры изображения из заголовка файла"""
+    mime_type: str
+    width: int
+    height: int
+    needs_decode: bool = False  # поворот по EXIF или анимация: как есть отправлять нельзя
+
+
+def _exif_orientation(tiff: bytes) -> int:
+    """Значение тега Orientation из блока EXIF (заголовок TIFF); 1 — без поворота"""
+    byte_order = {b"II": "little", b"MM": "big"}.get(tiff[:2])
+    if byte_order is None or len(tiff) < 8:
+        return 1
+    offset = int.from_bytes(tiff[4:8], byte_order)
+    count = int.from_bytes(tiff[offset:offset + 2], byte_order)
+    for index in range(count):
+        entry = tiff[offset + 2 + index * 12:offset + 14 + index * 12]
+        if len(entry) < 12:
+            break
+        if int.from_bytes(entry[:2], byte_order) == 0x0112:
+            return int.from_bytes(entry[8:10], byte_order)
+    return 1
+
+
+def _jpeg_header(data: bytes) -> Optional[ImageHeader]:
+    """Перебирает сегменты JPEG до маркера кадра, не трогая сжатые данные"""
+    orientation = 1
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            return None
+        marker = data[position + 1]
+        if marker == 0xFF:  # байты заполнения перед маркером
+            position += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # маркеры без длины
+            position += 2
+            continue
+        length = int.from_bytes(data[position + 2:position + 4], "big")
+        segment = data[position + 4:position + 2 + length]
+        if marker == 0xE1 and segment.startswith(b"Exif\x00\x00"):
+            orientation = _exif_orientation(segment[6:])
+        elif marker in _JPEG_SOF:
+            if len(segment) < 6:
+                return None
+            height = int.from_bytes(segment[1:3], "big")
+            width = int.from_bytes(segment[3:5], "big")
+            # четыре компонента — CMYK, его переводим в RGB
+            return ImageHeader("image/jpeg", width, height, orientation not in (0, 1) or segment[5] == 4)
+        elif marker == 0xDA:  # сжатые данные начались раньше кадра
+            return None
+        position += 2 + length
+    return None
+
+
+def _webp_header(data: bytes) -> Optional[ImageHeader]:
+    chunk = data[12:16]
+    if chunk == b"VP8 " and data[23:26] == b"\x9d\x01\x2a":
+        width = int.from_bytes(data[26:28], "little") & 0x3FFF
+        height = int.from_bytes(data[28:30], "little") & 0x3FFF
+        return ImageHeader("image/webp", width, height)
+    if chunk == b"VP8L" and data[20:21] == b"\x2f":
+        bits = int.from_bytes(data[21:25], "little")
+        return ImageHeader("image/webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1)
+    if chunk == b"VP8X" and len(data) >= 30:
+        flags = data[20]
+        width = int.from_bytes(data[24:27], "little") + 1
+        height = int.from_bytes(data[27:30], "little") + 1
+        # флаги: 0x08 — блок EXIF (возможен поворот), 0x02 — анимация
+        return ImageHeader("image/webp", width, height, bool(flags & 0x0A))
+    return None
+
+
+def read_image_header(data: bytes) -> Optional[ImageHeader]:
+    """Тип и размеры изображения по заголовку, без декодирования.
+
+    Поддерживаются JPEG, PNG и WebP; None — формат не распознан или заголовок повреждён.
+    """
+    if data.startswith(b"\xff\xd8"):
+        return _jpeg_header(data)
+    if data.startswith(b"\x89PNG\r\n\x1a\n") and data[12:16] == b"IHDR":
+        return ImageHeader("image/png", int.from_bytes(data[16:20], "big"), int.from_bytes(data[20:24], "big"))
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return _webp_header(data)
+    return None
+
+
+def _jpeg_intact(data: bytes) -> bool:
+    """Сегменты до начала сжатых данных (SOS) целы, файл заканчивается маркером EOI"""
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            return False
+        marker = data[position + 1]
+        if marker == 0xFF:
+            position += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            position += 2
+            continue
+        length = int.from_bytes(data[position + 2:position + 4], "big")
+        if length < 2 or position + 2 + length > len(data):
+            return False
+        if marker == 0xDA:
+            return data.endswith(b"\xff\xd9")
+        position += 2 + length
+    return False
+
+
+def _png_intact(data: bytes) -> bool:
+    """Длины и контрольные суммы CRC всех блоков верны, последний блок — IEND"""
+    position = 8
+    while position + 12 <= len(data):
+        length = int.from_bytes(data[position:position + 4], "big")
+        end = position + 12 + length
+        if end > len(data):
+            return False
+        chunk = data[position + 4:end - 4]
+        if zlib.crc32(chunk) != int.from_bytes(data[end - 4:end], "big"):
+            return False
+        if chunk[:4] == b"IEND":
+            return True
+        position = end
+    return False
+
+
+def _webp_intact(data: bytes) -> bool:
+    """Размер в заголовке RIFF совпадает с длиной файла, блоки укладываются в него без остатка"""
+    if int.from_bytes(data[4:8], "little") + 8 != len(data):
+        return False
+    position = 12
+    while position + 8 <= len(data):
+        size = int.from_bytes(data[position + 4:position + 8], "little")
+        position += 8 + size + (size & 1)
+    return position == len(data)
+
+
+_INTACT_CHECKS = {"image/jpeg": _jpeg_intact, "image/png": _png_intact, "image/webp": _webp_intact}
+
+
+def _is_intact(contents: bytes, header: ImageHeader) -> bool:
+    """Проверка структуры файла без декодирования: обрезанный файл отправлять как есть нельзя.
+
+    Испорченные внутри сжатые данные так не обнаружить; такой файл Gemini отклонит как
+    неверный запрос, и это не считается отказом модели.
+    """
+    return _INTACT_CHECKS[header.mime_type](contents)
+
+
+def passthrough_image(contents: bytes, max_edge: int = IMAGE_MAX_EDGE,
+                      max_size: int = IMAGE_PASSTHROUGH_MAX_SIZE) -> Optional[PreparedImage]:
+    """Исходный файл без пересжатия, если он уже в пределах ограничений и не повреждён.
+
+    Размеры читаются из заголовка, целостность проверяется по структуре файла, без
+    декодирования. Поэтому нет и dHash: такой файл находится в кеше только по точному
+    совпадению, кеш похожих изображений для него не работает. None — файл нужно предобработать.
+    """
+    if len(contents) > max_size:
+        return None
+    timings = {}
+    start = time.perf_counter()
+    header = read_image_header(contents)
+    timings["header"] = (time.perf_counter() - start) * 1000
+    if header is None or header.needs_decode or not 0 < max(header.width, header.height) <= max_edge:
+        return None
+    start = time.perf_counter()
+    if not _is_intact(contents, header):
+        return None
+    timings["verify"] = (time.perf_counter() - start) * 1000
+    return PreparedImage(
+        data=contents,
+        mime_type=header.mime_type,
+        width=header.width,
+        height=header.height,
+        dhash=None,
+        timings=timings
+    )
+
+
+def prepare_image(contents: bytes) -> PreparedImage:
+    """Исходный файл, если его можно отправить как есть, иначе результат preprocess_image"""
+    return passthrough_image(contents) or preprocess_image(contents)
+
+
+def preprocess_image(contents: bytes, max_edge: int = IMAGE_MAX_EDGE, image_format: str = IMAGE_FORMAT,
+                     quality: int = IMAGE_QUALITY) -> PreparedImage:
+    """Декодирует, поворачивает по EXIF, уменьшает и пересжимает изображение.
+
+    Выполняется в отдельном процессе, поэтому не использует состояние приложения.
+    Размеры проверяются по заголовку до декодирования: ImageSizeError не даёт распаковать
+    огромное изображение.
+    """
+    timings = {}
+    start = time.perf_counter()
+    image = Image.open(BytesIO(contents))
+    width, height = image.size
+    error = size_error(width, height)
+    if error is not None:
+        image.close()
+        raise ImageSizeError(error)
+    # JPEG декодируется сразу в уменьшенном масштабе
+    image.draft("RGB", (max_edge, max_edge))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    timings["decode"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+    dhash = perceptual_hash(image)
+    timings["resize"] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    buf = BytesIO()
+    image.save(buf, format=image_format, quality=quality)
+    timings["encode"] = (time.perf_counter() - start) * 1000
+    image.close()
+
+    return PreparedImage(
+        data=buf.getvalue(),
+        mime_type=_MIME_TYPES.get(image_format.upper(), "image/jpeg"),
+        width=width,
+        height=height,
+        dhash=dhash,
+        timings=timings
+    )
+
+
+def start_preprocess_pool(workers: int = PREPROCESS_WORKERS) -> None:
+    """Запускает пул процессов для предобработки"""
+    global _executor
+    stop_preprocess_pool()
+    if workers > 0:
+        _executor = ProcessPoolExecutor(max_workers=workers)
+        logger.info("Preprocess pool started with %d workers", workers)
+
+
+def stop_preprocess_pool() -> None:
+    """Останавливает пул процессов"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def warm_preprocess_pool(workers: int = PREPROCESS_WORKERS) -> None:
+    """Запускает процессы пула и загружает в них PIL на маленьком изображении"""
+    buf = BytesIO()
+    Image.new("RGB", (IMAGE_MIN_SOURCE_EDGE, IMAGE_MIN_SOURCE_EDGE)).save(buf, format="PNG")
+    sample = buf.getvalue()
+    if _executor is None:
+        await asyncio.to_thread(preprocess_image, sample)
+        return
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(_executor, preprocess_image, sample) for _ in range(max(workers, 1))))
+
+
+async def run_preprocess(contents: bytes) -> PreparedImage:
+    """Выполняет подготовку изображения (prepare_image) вне event loop.
+
+    Без запущенного пула процессов (тесты, PREPROCESS_WORKERS=0) используется пул потоков.
+    """
+    start = time.perf_counter()
+    if _executor is not None:
+        prepared = await asyncio.get_running_loop().run_in_executor(_executor, prepare_image, contents)
+    else:
+        prepared = await asyncio.to_thread(prepare_image, contents)
+    prepared.timings["preprocess"] = (time.perf_counter() - start) * 1000
+    return prepared
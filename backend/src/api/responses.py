@@ -0,0 +1,24 @@
+from starlette.responses import JSONResponse
+from pydantic import BaseModel
+from typing import Any
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON-ответ без повторной валидации и стандартного кодировщика.
+
+    Модель pydantic сериализуется в байты самим pydantic-core, остальное —
+    через orjson, а без него — через json из стандартной библиотеки.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return content.model_dump_json().encode("utf-8")
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
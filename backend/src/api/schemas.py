@@ -1,7 +1,9 @@
-from pydantic import BaseModel, Field
-from typing import Dict, Union, Literal
+from pydantic import BaseModel, Field, TypeAdapter, StringConstraints
+from typing import Dict, List, Union, Literal, Optional, Annotated
 from enum import Enum
 
+from src.api.config import SEARCH_BATCH_MAX_NAMES
+
 
 class StatusEnum(str, Enum):
     success = "success"
@@ -20,28 +22,43 @@ class FoodItem(BaseModel):
 
 
 class FoodSuccessResponse(BaseModel):
-    status: StatusEnum = StatusEnum.success
+    status: Literal[StatusEnum.success] = StatusEnum.success
     food_items: Dict[str, FoodItem]
 
 
 class NotFoundResponse(BaseModel):
-    status: StatusEnum = StatusEnum.not_found
+    status: Literal[StatusEnum.not_found] = StatusEnum.not_found
     message: str
 
 
 class ErrorResponse(BaseModel):
-    status: StatusEnum = StatusEnum.error
+    status: Literal[StatusEnum.error] = StatusEnum.error
     message: str
 
 
 class DangerResponse(BaseModel):
-    status: StatusEnum = StatusEnum.danger
+    status: Literal[StatusEnum.danger] = StatusEnum.danger
     message: str
     food_items: Dict[str, FoodItem]
 
 
-# Union тип для всех возможных ответов /analyze/
-FoodResponse = Union[FoodSuccessResponse, NotFoundResponse, ErrorResponse, DangerResponse]
+# Union тип для всех возможных ответов /analyze/, вариант выбирается по status
+FoodResponse = Annotated[
+    Union[FoodSuccessResponse, NotFoundResponse, ErrorResponse, DangerResponse],
+    Field(discriminator="status")
+]
+
+
+class FoodBatchResponse(BaseModel):
+    """Результаты /analyze/batch в порядке загруженных файлов"""
+    results: List[FoodResponse]
+
+
+class JobResponse(BaseModel):
+    """Состояние фоновой задачи анализа"""
+    job_id: str
+    status: Literal["queued", "running", "done"]
+    result: Optional[FoodResponse] = None
 
 
 class NutritionSearch(BaseModel):
@@ -52,10 +69,19 @@ class NutritionSearch(BaseModel):
     weight: float = Field(gt=0, default=100.0, description="Вес в граммах (всегда 100 г)")
 
 
+class SearchAlternative(BaseModel):
+    food_name: str
+    score: float = Field(ge=0.0, le=1.0, description="Оценка совпадения с запросом")
+    nutrition: NutritionSearch
+
+
 class FoodResponseSearch(BaseModel):
     status: Literal["success"] = "success"
     food_name: str
     nutrition: NutritionSearch
+    matched_name: Optional[str] = Field(None, description="Название найденного продукта, если оно не совпадает с запросом")
+    score: float = Field(1.0, ge=0.0, le=1.0, description="Оценка совпадения с запросом")
+    alternatives: List[SearchAlternative] = Field(default_factory=list, description="Другие подходящие продукты")
 
 
 class NotFoundResponseSearch(BaseModel):
@@ -68,5 +94,35 @@ class ErrorFoundResponseSearch(BaseModel):
     message: str = "Ошибка при поиске"
 
 
-# Union тип для всех возможных ответов /search/
-FoodAPIResponseSearch = Union[FoodResponseSearch, NotFoundResponseSearch, ErrorFoundResponseSearch]
+class SuggestItem(BaseModel):
+    food_name: str
+    nutrition: Optional[NutritionSearch] = None
+
+
+class SuggestResponse(BaseModel):
+    prefix: str
+    suggestions: List[SuggestItem]
+
+
+# Union тип для всех возможных ответов /search/, вариант выбирается по status
+FoodAPIResponseSearch = Annotated[
+    Union[FoodResponseSearch, NotFoundResponseSearch, ErrorFoundResponseSearch],
+    Field(discriminator="status")
+]
+
+
+class SearchBatchRequest(BaseModel):
+    """Названия продуктов для /search/batch"""
+    food_names: List[Annotated[str, StringConstraints(min_length=1, max_length=100)]] = Field(
+        min_length=1, max_length=SEARCH_BATCH_MAX_NAMES
+    )
+
+
+class SearchBatchResponse(BaseModel):
+    """Результаты /search/batch в порядке названий запроса"""
+    results: List[FoodAPIResponseSearch]
+
+
+# Валидаторы собираются один раз при импорте
+food_response_adapter = TypeAdapter(FoodResponse)
+search_response_adapter = TypeAdapter(FoodAPIResponseSearch)
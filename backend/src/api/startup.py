@@ -0,0 +1,201 @@
+"""Прогрев воркера перед приёмом запросов.
+
+Тяжёлые модули (google.genai, numpy) импортируются лениво, поэтому импорт
+приложения занимает доли секунды. После старта warm_up в фоне загружает их,
+создаёт клиентов Gemini, открывает соединения с источниками, запускает пул
+предобработки и прогоняет валидаторы ответов, чтобы первый запрос не платил
+за инициализацию. Пока прогрев не закончен, /ready отвечает 503.
+
+Профиль импорта и прогрева:
+    python -m src.api.startup
+"""
+from typing import Optional, Dict, List, Tuple, Iterable
+from contextlib import contextmanager
+import subprocess
+import argparse
+import asyncio
+import logging
+import httpx
+import time
+import sys
+import os
+
+from src.api.config import HEALTH_DIET_URL, WARMUP_CONNECTIONS, WARMUP_TIMEOUT
+from src.api.analyze import get_generate_config, parse_food_response
+from src.api.clients import get_http_client, get_gemini_client, start_gemini_clients
+from src.api.preprocess import warm_preprocess_pool
+from src.api.model_router import model_router
+from src.api.matching import load_numpy
+from src.api.responses import FastJSONResponse
+from src.api.schemas import search_response_adapter
+
+logger = logging.getLogger("api.startup")
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# ответы для прогрева валидаторов и сериализации
+_SAMPLE_ANALYSIS = (
+    '{"status": "success", "food_items": {"Яблоко": {"proteins": 0.4, "fats": 0.4, "carbohydrates": 9.8, '
+    '"water": 86.0, "weight": 150, "benefit_score": 4.5}}}'
+)
+_SAMPLE_SEARCH = {
+    "status": "success", "food_name": "Яблоко",
+    "nutrition": {"calories": 47.0, "proteins": 0.4, "fats": 0.4, "carbohydrates": 9.8, "weight": 100.0}
+}
+
+
+class StartupProfile:
+    """Длительность этапов запуска воркера и его готовность к приёму запросов"""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}  # этап -> длительность, мс
+        self.errors: Dict[str, str] = {}
+        self.ready = False
+
+    def reset(self) -> None:
+        self.stages.clear()
+        self.errors.clear()
+        self.ready = False
+
+    def record(self, name: str, milliseconds: float) -> None:
+        self.stages[name] = round(milliseconds, 1)
+
+    @contextmanager
+    def stage(self, name: str):
+        """Замеряет этап; ошибка этапа записывается в отчёт и не прерывает прогрев"""
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as err:
+            logger.warning("Warm-up stage %s failed: %s", name, err)
+            self.errors[name] = str(err) or type(err).__name__
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def report(self) -> dict:
+        return {"ready": self.ready, "stages_ms": dict(self.stages), "errors": dict(self.errors)}
+
+
+startup_profile = StartupProfile()
+
+
+def _import_modules() -> None:
+    """Импортирует модули, которые приложение загружает лениво"""
+    get_generate_config()
+    load_numpy()
+
+
+def _warm_validators() -> None:
+    """Первый разбор и сериализация ответов заранее создают служебные структуры pydantic и orjson"""
+    FastJSONResponse(parse_food_response(_SAMPLE_ANALYSIS))
+    FastJSONResponse(search_response_adapter.validate_python(_SAMPLE_SEARCH))
+    FastJSONResponse({"status": "ready"})
+
+
+async def open_connections(api_keys: Iterable[str], timeout: float = WARMUP_TIMEOUT) -> int:
+    """Открывает соединения с health-diet.ru и Gemini, чтобы TLS-рукопожатие не досталось первому запросу.
+
+    Ответ сервера не важен: соединение остаётся в пуле клиента. Возвращает число открытых соединений.
+    """
+    calls = [get_http_client().head(HEALTH_DIET_URL)]
+    models = model_router.candidates()
+    for api_key in api_keys:
+        if not models:
+            break
+        try:
+            calls.append(get_gemini_client(api_key).aio.models.get(model=models[0]))
+        except Exception as err:
+            logger.warning("Gemini client init failed: %s", err)
+    results = await asyncio.gather(*(asyncio.wait_for(call, timeout) for call in calls), return_exceptions=True)
+    opened = 0
+    for result in results:
+        if isinstance(result, (httpx.TransportError, TimeoutError)):
+            logger.warning("Warm-up connection failed: %r", result)
+        else:
+            # ошибка API (например, 404 или неверный ключ) означает, что соединение открыто
+            opened += 1
+    return opened
+
+
+async def warm_up(api_keys: Iterable[str], connections: bool = WARMUP_CONNECTIONS,
+                  profile: Optional[StartupProfile] = None) -> StartupProfile:
+    """Прогревает воркер и отмечает его готовым; запускается в фоне при старте приложения"""
+    profile = profile or startup_profile
+    api_keys = list(api_keys)
+    start = time.perf_counter()
+    with profile.stage("imports"):
+        # импорт в потоке: event loop тем временем отвечает на /health и /ready
+        await asyncio.to_thread(_import_modules)
+    with profile.stage("gemini_clients"):
+        await start_gemini_clients(api_keys)
+    with profile.stage("validators"):
+        _warm_validators()
+    with profile.stage("preprocess_pool"):
+        await warm_preprocess_pool()
+    if connections:
+        with profile.stage("connections"):
+            await open_connections(api_keys)
+    profile.record("warm_up", (time.perf_counter() - start) * 1000)
+    profile.ready = True
+    logger.info("Worker ready: %s", profile.stages)
+    return profile
+
+
+def import_profile(module: str = "src.api.api") -> Tuple[float, List[Tuple[str, float]]]:
+    """Время импорта модуля в новом интерпретаторе: общее и по модулям без учёта вложенных, мс"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, cwd=BACKEND_DIR
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    modules = []
+    total = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_time) / 1000))
+        if name.strip() == module:
+            total = int(cumulative) / 1000
+    modules.sort(key=lambda item: item[1], reverse=True)
+    return total, modules
+
+
+async def _profile_warm_up(connections: bool) -> StartupProfile:
+    from src.api.clients import start_http_client, close_http_client, close_gemini_clients
+    from src.api.preprocess import start_preprocess_pool, stop_preprocess_pool
+    from src.env import API_KEY
+
+    await start_http_client()
+    start_preprocess_pool()
+    try:
+        return await warm_up([API_KEY], connections=connections, profile=StartupProfile())
+    finally:
+        stop_preprocess_pool()
+        await close_gemini_clients()
+        await close_http_client()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Профиль запуска воркера: импорт и прогрев")
+    parser.add_argument("--module", default="src.api.api", help="Импортируемый модуль")
+    parser.add_argument("--top", type=int, default=15, help="Число самых долгих модулей в отчёте")
+    parser.add_argument("--no-connections", action="store_true", help="Не открывать соединения с источниками")
+    args = parser.parse_args(argv)
+
+    total, modules = import_profile(args.module)
+    print(f"Импорт {args.module}: {total:.0f} мс")
+    for name, milliseconds in modules[:args.top]:
+        print(f"  {name:<50} {milliseconds:8.1f} мс")
+
+    profile = asyncio.run(_profile_warm_up(not args.no_connections))
+    print("Прогрев:")
+    for name, milliseconds in profile.stages.items():
+        print(f"  {name:<50} {milliseconds:8.1f} мс")
+    for name, error in profile.errors.items():
+        print(f"  ошибка {name}: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+from typing import Optional, List, Set, Tuple, Iterable
+import threading
+import sqlite3
+import asyncio
+import logging
+import time
+
+from src.api.config import STATE_BACKEND, STATE_SQLITE_PATH, STATE_REDIS_URL, STATE_KEY_PREFIX
+
+logger = logging.getLogger("api.state")
+
+
+def take_tokens(bucket: Optional[Tuple[float, float]], now: float, rate: float, burst: float,
+                tokens: float) -> Tuple[float, Tuple[float, float]]:
+    """Шаг token bucket: (секунды ожидания или 0, новое состояние (токены, время))"""
+    available, updated = bucket if bucket is not None else (float(burst), now)
+    available = min(float(burst), available + max(0.0, now - updated) * rate)
+    if available >= tokens:
+        return 0.0, (available - tokens, now)
+    wait = (tokens - available) / rate if rate > 0 else float("inf")
+    return wait, (available, now)
+
+
+def bucket_ttl(rate: float, burst: float) -> float:
+    """За это время пустая корзина наполняется, и её состояние можно забыть"""
+    return burst / rate if rate > 0 else 3600.0
+
+
+class StateBackend:
+    """Общее состояние воркеров: значения и множества с временем жизни, token bucket.
+
+    Реализации должны быть безопасны для одновременного использования
+    несколькими процессами; время жизни задаётся в секундах.
+    """
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return (await self.get_many([key]))[0]
+
+    async def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        raise NotImplementedError
+
+    async def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    async def add_member(self, key: str, member: str, ttl: float) -> None:
+        """Добавляет элемент во множество и продлевает его время жизни"""
+        raise NotImplementedError
+
+    async def members_many(self, keys: List[str]) -> List[Set[str]]:
+        raise NotImplementedError
+
+    async def take_tokens(self, key: str, rate: float, burst: float, tokens: float = 1.0) -> float:
+        """Атомарно списывает токены. Возвращает 0, если запрос разрешён, иначе сколько секунд ждать"""
+        raise NotImplementedError
+
+    async def clear(self) -> None:
+        """Удаляет все ключи сервиса"""
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+
+class SQLiteBackend(StateBackend):
+    """Общее состояние воркеров одного хоста в файле SQLite (WAL).
+
+    Запросы выполняются в потоке, чтобы не блокировать event loop;
+    token bucket списывается в транзакции BEGIN IMMEDIATE.
+    """
+
+    # через сколько записей удаляются просроченные строки
+    CLEANUP_EVERY = 1000
+
+    def __init__(self, path: str = STATE_SQLITE_PATH, prefix: str = STATE_KEY_PREFIX):
+        self.path = path
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS kv (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                expires REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS members (
+                key TEXT NOT NULL,
+                member TEXT NOT NULL,
+                expires REAL NOT NULL,
+                PRIMARY KEY (key, member)
+            );
+            CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL,
+                expires REAL NOT NULL
+            );
+        """)
+
+    async def _run(self, func, *args):
+        return await asyncio.to_thread(self._locked, func, *args)
+
+    def _locked(self, func, *args):
+        with self._lock:
+            return func(*args)
+
+    def _written(self, now: float) -> None:
+        self._writes += 1
+        if self._writes % self.CLEANUP_EVERY == 0:
+            for table in ("kv", "members", "buckets"):
+                self._conn.execute(f"DELETE FROM {table} WHERE expires < ?", (now,))
+
+    def _get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        now = time.time()
+        found = {}
+        for key in keys:
+            row = self._conn.execute(
+                "SELECT value FROM kv WHERE key = ? AND expires >= ?", (self.prefix + key, now)
+            ).fetchone()
+            if row is not None:
+                found[key] = bytes(row[0])
+        return [found.get(key) for key in keys]
+
+    def _set(self, key: str, value: bytes, ttl: float) -> None:
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires) VALUES (?, ?, ?)", (self.prefix + key, value, now + ttl)
+        )
+        self._written(now)
+
+    def _delete(self, key: str) -> None:
+        self._conn.execute("DELETE FROM kv WHERE key = ?", (self.prefix + key,))
+
+    def _add_member(self, key: str, member: str, ttl: float) -> None:
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO members (key, member, expires) VALUES (?, ?, ?)",
+            (self.prefix + key, member, now + ttl)
+        )
+        self._conn.execute("UPDATE members SET expires = ? WHERE key = ?", (now + ttl, self.prefix + key))
+        self._written(now)
+
+    def _members_many(self, keys: List[str]) -> List[Set[str]]:
+        now = time.time()
+        return [
+            {row[0] for row in self._conn.execute(
+                "SELECT member FROM members WHERE key = ? AND expires >= ?", (self.prefix + key, now)
+            )}
+            for key in keys
+        ]
+
+    def _take_tokens(self, key: str, rate: float, burst: float, tokens: float) -> float:
+        now = time.time()
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute(
+                "SELECT tokens, updated FROM buckets WHERE key = ? AND expires >= ?", (self.prefix + key, now)
+            ).fetchone()
+            wait, (available, updated) = take_tokens(tuple(row) if row else None, now, rate, burst, tokens)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated, expires) VALUES (?, ?, ?, ?)",
+                (self.prefix + key, available, updated, now + bucket_ttl(rate, burst))
+            )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._written(now)
+        return wait
+
+    def _clear(self) -> None:
+        for table in ("kv", "members", "buckets"):
+            self._conn.execute(f"DELETE FROM {table} WHERE key LIKE ? ESCAPE '\\'", (_like_prefix(self.prefix),))
+
+    async def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return await self._run(self._get_many, keys) if keys else []
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self._run(self._set, key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await self._run(self._delete, key)
+
+    async def add_member(self, key: str, member: str, ttl: float) -> None:
+        await self._run(self._add_member, key, member, ttl)
+
+    async def members_many(self, keys: List[str]) -> List[Set[str]]:
+        return await self._run(self._members_many, keys) if keys else []
+
+    async def take_tokens(self, key: str, rate: float, burst: float, tokens: float = 1.0) -> float:
+        return await self._run(self._take_tokens, key, rate, burst, tokens)
+
+    async def clear(self) -> None:
+        await self._run(self._clear)
+
+    async def close(self) -> None:
+        await self._run(self._conn.close)
+
+
+def _like_prefix(prefix: str) -> str:
+    return prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+class RedisBackend(StateBackend):
+    """Общее состояние воркеров на нескольких хостах в Redis (или сервере с тем же протоколом).
+
+    Token bucket списывается оптимистичной транзакцией WATCH/MULTI/EXEC.
+    """
+
+    def __init__(self, url: str = STATE_REDIS_URL, prefix: str = STATE_KEY_PREFIX):
+        try:
+            import redis.asyncio as redis
+            from redis.exceptions import WatchError
+        except ImportError:
+            raise RuntimeError("Для STATE_BACKEND=redis нужен пакет redis")
+        self.prefix = prefix
+        self._watch_error = WatchError
+        self._redis = redis.Redis.from_url(url)
+
+    async def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        if not keys:
+            return []
+        return await self._redis.mget([self.prefix + key for key in keys])
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self._redis.set(self.prefix + key, value, px=max(1, int(ttl * 1000)))
+
+    async def delete(self, key: str) -> None:
+        await self._redis.delete(self.prefix + key)
+
+    async def add_member(self, key: str, member: str, ttl: float) -> None:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.sadd(self.prefix + key, member)
+            pipe.pexpire(self.prefix + key, max(1, int(ttl * 1000)))
+            await pipe.execute()
+
+    async def members_many(self, keys: List[str]) -> List[Set[str]]:
+        if not keys:
+            return []
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.smembers(self.prefix + key)
+            results = await pipe.execute()
+        return [{member.decode("utf-8") for member in members} for members in results]
+
+    async def take_tokens(self, key: str, rate: float, burst: float, tokens: float = 1.0) -> float:
+        key = self.prefix + key
+        async with self._redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    raw = await pipe.get(key)
+                    bucket = tuple(float(part) for part in raw.split(b":")) if raw else None
+                    wait, (available, updated) = take_tokens(bucket, time.time(), rate, burst, tokens)
+                    pipe.multi()
+                    pipe.set(key, f"{available!r}:{updated!r}", px=max(1, int(bucket_ttl(rate, burst) * 1000)))
+                    await pipe.execute()
+                    return wait
+                except self._watch_error:
+                    # ключ изменил другой воркер — повторяем с новым состоянием
+                    continue
+
+    async def clear(self) -> None:
+        keys = [key async for key in self._redis.scan_iter(match=self.prefix + "*")]
+        if keys:
+            await self._redis.delete(*keys)
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+def create_state_backend(kind: str = STATE_BACKEND) -> Optional[StateBackend]:
+    """Хранилище общего состояния по настройке STATE_BACKEND; для memory — None"""
+    if kind == "memory":
+        return None
+    if kind == "sqlite":
+        return SQLiteBackend()
+    if kind == "redis":
+        return RedisBackend()
+    raise ValueError(f"Unknown STATE_BACKEND: {kind}")
+
+
+async def safe(awaitable, default=None, what: str = "state backend"):
+    """Выполняет обращение к общему хранилищу; при сбое работа продолжается на локальном состоянии"""
+    try:
+        return await awaitable
+    except Exception as err:
+        logger.warning("Shared state unavailable (%s): %r", what, err)
+        return default
+
+
+def iter_bands(value: int, bands: int, bits: int = 64) -> Iterable[Tuple[int, int]]:
+    """Делит хеш на bands непересекающихся частей: (номер, значение части).
+
+    Если расстояние Хэмминга меньше bands, хотя бы одна часть совпадает целиком.
+    """
+    start = 0
+    for index in range(bands):
+        width = bits // bands + (1 if index < bits % bands else 0)
+        yield index, (value >> start) & ((1 << width) - 1)
+        start += width
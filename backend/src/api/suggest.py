@@ -0,0 +1,193 @@
+"""Автодополнение названий продуктов для поиска по мере ввода.
+
+Названия хранятся в отсортированном массиве ключей: каждое слово названия
+вместе с продолжением даёт ключ, поэтому "отвар" находит и "Гречка отварная".
+Диапазон ключей с общим префиксом находится двоичным поиском. Для коротких
+префиксов, под которые подходят тысячи названий, лучшие записи хранятся заранее
+и обновляются при добавлении названий и успешных поисках.
+"""
+from typing import Optional, List, Dict, Tuple, Iterable, Set
+from dataclasses import dataclass
+from itertools import islice
+import threading
+import bisect
+import heapq
+
+from src.api.matching import normalize_text
+from src.api.config import SUGGEST_MAX_ENTRIES, SUGGEST_SCAN_LIMIT
+
+# для префиксов не длиннее этого лучшие записи хранятся заранее
+SHORT_PREFIX = 4
+# наибольшее число подсказок в ответе
+MAX_SUGGESTIONS = 20
+# новые ключи вставляются по одному, пока их меньше этой доли массива, иначе массив пересортировывается
+INSORT_FRACTION = 1 / 64
+
+
+@dataclass
+class Suggestion:
+    """Название продукта, его КБЖУ и число успешных поисков"""
+    name: str
+    nutrition: Optional[dict] = None
+    popularity: int = 0
+
+
+class SuggestIndex:
+    """Префиксный индекс названий с сортировкой по популярности"""
+
+    def __init__(self, max_entries: int = SUGGEST_MAX_ENTRIES, scan_limit: int = SUGGEST_SCAN_LIMIT):
+        self.max_entries = max_entries
+        self.scan_limit = scan_limit
+        self._keys: List[Tuple[str, int]] = []  # (нормализованное окончание названия, номер записи)
+        self._entries: List[Suggestion] = []
+        self._ids: Dict[str, int] = {}  # набор слов нормализованного названия -> номер записи
+        self._top: Dict[str, List[int]] = {}  # короткий префикс -> лучшие записи по порядку
+        self._lock = threading.Lock()
+
+    def _rank(self, index: int) -> Tuple[int, int, int]:
+        """Порядок подсказок: сначала популярные, затем короткие"""
+        entry = self._entries[index]
+        return -entry.popularity, len(entry.name), index
+
+    @staticmethod
+    def _identity(key: str) -> str:
+        """Ключ записи: набор слов, как у поискового кеша, поэтому варианты запроса
+        с другим порядком слов или пробелами попадают в одну запись"""
+        return " ".join(sorted(set(key.split())))
+
+    @staticmethod
+    def _name_keys(key: str) -> List[str]:
+        words = key.split()
+        return [" ".join(words[position:]) for position in range(len(words))]
+
+    @staticmethod
+    def _short_prefixes(keys: Iterable[str]) -> Set[str]:
+        return {key[:length] for key in keys for length in range(1, min(SHORT_PREFIX, len(key)) + 1)}
+
+    def _promote(self, index: int, prefixes: Iterable[str]) -> None:
+        """Ставит запись на её место в списках лучших; популярность только растёт, поэтому хватает вставки"""
+        for prefix in prefixes:
+            top = self._top.setdefault(prefix, [])
+            if index not in top:
+                top.append(index)
+            top.sort(key=self._rank)
+            del top[MAX_SUGGESTIONS:]
+
+    def _add(self, name: str, nutrition: Optional[dict], popularity: int, keys: List[Tuple[str, int]]) -> bool:
+        """Добавляет запись; ключи новой записи складываются в keys. Вызывается под блокировкой"""
+        key = normalize_text(name)
+        if not key:
+            return False
+        identity = self._identity(key)
+        index = self._ids.get(identity)
+        if index is not None:
+            entry = self._entries[index]
+            if nutrition is not None:
+                entry.nutrition = nutrition
+            if popularity:
+                entry.popularity += popularity
+                self._promote(index, self._short_prefixes(self._name_keys(key)))
+            return True
+        if len(self._entries) >= self.max_entries:
+            return False
+        index = len(self._entries)
+        self._entries.append(Suggestion(name=name, nutrition=nutrition, popularity=popularity))
+        self._ids[identity] = index
+        keys.extend((name_key, index) for name_key in self._name_keys(key))
+        return True
+
+    def add(self, name: str, nutrition: Optional[dict] = None, popularity: int = 0) -> bool:
+        """Добавляет название или обновляет его КБЖУ и популярность.
+
+        Возвращает False, если название пустое или индекс заполнен.
+        """
+        keys = []
+        with self._lock:
+            added = self._add(name, nutrition, popularity, keys)
+            for item in keys:
+                bisect.insort(self._keys, item)
+            if keys:
+                self._promote(keys[0][1], self._short_prefixes(key for key, _ in keys))
+        return added
+
+    def _merge_keys(self, keys: List[Tuple[str, int]]) -> None:
+        """Вливает отсортированные новые ключи в массив ключей. Вызывается под блокировкой.
+
+        Немногие ключи вставляются на место (сдвиг массива выполняется в C), много ключей —
+        одной сортировкой: Timsort сливает два упорядоченных куска за линейное время.
+        """
+        if len(keys) < len(self._keys) * INSORT_FRACTION:
+            position = 0
+            for item in keys:
+                position = bisect.bisect_left(self._keys, item, position)
+                self._keys.insert(position, item)
+        else:
+            self._keys.extend(keys)
+            self._keys.sort()
+
+    def add_many(self, items: Iterable[Tuple[str, Optional[dict]]], chunk_size: int = 5000) -> int:
+        """Добавляет пары (название, КБЖУ) с одним слиянием ключей; возвращает число принятых.
+
+        Записи добавляются частями по chunk_size, а ключи сортируются вне блокировки,
+        поэтому подсказки отвечают и во время большой загрузки.
+        """
+        keys = []
+        added = 0
+        items = iter(items)
+        while True:
+            chunk = list(islice(items, chunk_size))
+            if not chunk:
+                break
+            with self._lock:
+                added += sum(self._add(name, nutrition, 0, keys) for name, nutrition in chunk)
+        if not keys:
+            return added
+        keys.sort()
+        candidates: Dict[str, Set[int]] = {}
+        for key, index in keys:
+            for prefix in self._short_prefixes([key]):
+                candidates.setdefault(prefix, set()).add(index)
+        with self._lock:
+            self._merge_keys(keys)
+            for prefix, ids in candidates.items():
+                ids.update(self._top.get(prefix, ()))
+                self._top[prefix] = heapq.nsmallest(MAX_SUGGESTIONS, ids, key=self._rank)
+        return added
+
+    def record_hit(self, name: str, nutrition: Optional[dict] = None) -> None:
+        """Учитывает успешный поиск: популярные названия поднимаются в подсказках"""
+        self.add(name, nutrition, popularity=1)
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Suggestion]:
+        """Названия, одно из слов которых начинается с prefix: сначала популярные, затем короткие"""
+        key = normalize_text(prefix)
+        limit = min(limit, MAX_SUGGESTIONS)
+        if not key or limit <= 0:
+            return []
+        with self._lock:
+            if len(key) <= SHORT_PREFIX:
+                return [self._entries[index] for index in self._top.get(key, ())[:limit]]
+            start = bisect.bisect_left(self._keys, (key,))
+            end = bisect.bisect_left(self._keys, (key + "\uffff",), lo=start)
+            # длинный префикс подходит к немногим ключам, но просмотр всё равно ограничен
+            ids = {index for _, index in self._keys[start:min(end, start + self.scan_limit)]}
+            return [self._entries[index] for index in heapq.nsmallest(limit, ids, key=self._rank)]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._keys.clear()
+            self._entries.clear()
+            self._ids.clear()
+            self._top.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def load_suggestions(index: SuggestIndex, items: Iterable[Tuple[str, Optional[dict]]], batch_size: int = 5000) -> int:
+    """Загружает названия одним слиянием ключей; записи добавляются частями по batch_size,
+    чтобы подсказки оставались доступны во время загрузки"""
+    return index.add_many(items, batch_size)
+
+
+suggest_index = SuggestIndex()
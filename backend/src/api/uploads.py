@@ -0,0 +1,101 @@
+from typing import Optional, Dict, Iterable
+from fastapi import UploadFile, HTTPException
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+
+from src.api.config import MAX_UPLOAD_SIZE, MULTIPART_OVERHEAD, UPLOAD_CHUNK_SIZE
+
+ALLOWED_TYPES = {"image/jpeg", "image/png", "image/webp"}
+
+# сигнатуры в начале файла
+_SIGNATURES = (
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+)
+
+
+def size_error_message(max_size: int = MAX_UPLOAD_SIZE) -> str:
+    return f"Размер файла превышает {max_size // (1024 * 1024)}MB"
+
+
+def sniff_image_type(header: bytes) -> Optional[str]:
+    """Определяет тип изображения по первым байтам файла"""
+    for signature, mime_type in _SIGNATURES:
+        if header.startswith(signature):
+            return mime_type
+    # контейнер RIFF: размер файла между сигнатурой и типом содержимого
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+async def read_upload(file: UploadFile, max_size: int = MAX_UPLOAD_SIZE,
+                      allowed_types: Iterable[str] = ALLOWED_TYPES) -> bytes:
+    """Читает загруженное изображение частями с проверками до чтения всего файла.
+
+    Заявленный тип проверяется до чтения, размер — по известной длине и по ходу чтения,
+    формат — по сигнатуре первых байт.
+    """
+    if file.content_type not in allowed_types:
+        raise HTTPException(
+            status_code=400,
+            detail="Поддерживаются только JPEG, PNG и WebP"
+        )
+    if file.size is not None and file.size > max_size:
+        raise HTTPException(status_code=400, detail=size_error_message(max_size))
+
+    first = await file.read(UPLOAD_CHUNK_SIZE)
+    if sniff_image_type(first) not in allowed_types:
+        raise HTTPException(
+            status_code=400,
+            detail="Невозможно обработать изображение"
+        )
+
+    chunks = [first]
+    total = len(first)
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        total += len(chunk)
+        if total > max_size:
+            raise HTTPException(status_code=400, detail=size_error_message(max_size))
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+class UploadLimitMiddleware:
+    """Ограничивает размер тела запроса для путей загрузки.
+
+    limits — допустимый размер загружаемых файлов по пути, к нему добавляется запас
+    на multipart. Запрос с заголовком Content-Length больше лимита отклоняется до чтения
+    тела, при передаче без длины (chunked) чтение прерывается, как только лимит превышен.
+    """
+
+    def __init__(self, app: ASGIApp, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        max_size = self.limits.get(scope.get("path", "")) if scope["type"] == "http" else None
+        if max_size is None or scope.get("method") != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        limit = max_size + MULTIPART_OVERHEAD
+        detail = size_error_message(max_size)
+        content_length = dict(scope.get("headers", [])).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            response = JSONResponse({"detail": detail}, status_code=400, headers={"Connection": "close"})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise HTTPException(status_code=400, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -1,14 +1,30 @@
-from unittest.mock import Mock, MagicMock, patch
+from unittest.mock import Mock, MagicMock, AsyncMock, patch
 from pathlib import Path
 from typing import List
 from PIL import Image
+import asyncio
 import pytest
+import httpx
 import json
 
-from src.api.analyze import analyze_food_image, analyze_food_json
+from src.api import analyze
+from src.api.analyze import analyze_food_image, analyze_food_image_stream, analyze_food_json, FoodItemStream, parse_food_response, match_foods, group_foods
+from src.api.schemas import FoodSuccessResponse, DangerResponse, NotFoundResponse, ErrorResponse, FoodItem
+from src.api.model_router import ModelRouter
+from src.api.suggest import SuggestIndex
+from src.api.deadline import Deadline
+from src.api.nutrition_db import NutritionIndex
+from src.api.preprocess import PreparedImage
 from src.env import skip_api_request
 
 
+def mock_http_client(response: MagicMock):
+    """Подменяет общий HTTP-клиент клиентом с заданным ответом"""
+    http_client = MagicMock()
+    http_client.post = AsyncMock(return_value=response)
+    return patch("src.api.analyze.get_http_client", return_value=http_client)
+
+
 class TestAnalyzeFoodImage:
     """Тестирование функции analyze_food_image"""
 
@@ -105,7 +121,7 @@ class TestAnalyzeFoodImage:
             "status": "error",
             "message": "Изображение слишком длинное или слишком широкое"
         }
-        assert result == await analyze_food_image(mock_image, api_key="test", test_answer="тестовый ответ")
+        assert result == (await analyze_food_image(mock_image, api_key="test", test_answer="тестовый ответ")).model_dump(mode="json")
 
     @pytest.mark.asyncio
     @pytest.mark.parametrize("size_image", [(50, 600), (20, 10), (200, 11)])
@@ -117,7 +133,7 @@ class TestAnalyzeFoodImage:
             "status": "error",
             "message": "Изображение слишком короткое или слишком узкое"
         }
-        assert result == await analyze_food_image(mock_image, api_key="test", test_answer="тестовый ответ")
+        assert result == (await analyze_food_image(mock_image, api_key="test", test_answer="тестовый ответ")).model_dump(mode="json")
 
     @pytest.mark.asyncio
     async def test_api_key(self):
@@ -128,7 +144,7 @@ class TestAnalyzeFoodImage:
             "status": "error",
             "message": "Ошибка сервиса распознавания фото"
         }
-        assert result == await analyze_food_image(mock_image, api_key="", test_answer="тестовый ответ")
+        assert result == (await analyze_food_image(mock_image, api_key="", test_answer="тестовый ответ")).model_dump(mode="json")
 
     @pytest.mark.asyncio
     async def test_text_fake(self, get_test_data):
@@ -145,14 +161,9 @@ class TestAnalyzeFoodImage:
                 result = await analyze_food_image(photo, test_answer=str(answer))
                 if counter in [0, 1, 2, 3, 4]:  # валидные значения
                     answer_obj = json.loads(answer)
-                    assert answer_obj == result
-                elif counter == 5:
-                    assert result == {
-                        "status": "success",
-                        "message": "Обработка ошибки markdown"
-                    }
-                elif counter in [6, 7, 8, 9]:  # не валидные значения
-                    assert result == {
+                    assert answer_obj == result.model_dump(mode="json")
+                elif counter in [5, 6, 7, 8, 9]:  # не валидные значения
+                    assert result.model_dump(mode="json") == {
                         "status": "error",
                         "message": "Ошибка формирования ответа"
                     }
@@ -165,7 +176,7 @@ class TestAnalyzeFoodImage:
         error_image = Mock(spec=Image.Image)
         error_image.size = (500, 500)
         result = await analyze_food_image(error_image, test_answer={"неверный тип ответа"}) # type: ignore
-        assert result == {
+        assert result.model_dump(mode="json") == {
             "status": "error",
             "message": "Ошибка при анализе изображения"
         }
@@ -179,7 +190,7 @@ class TestAnalyzeFoodImage:
         photo_path = current_dir / path
         photo = Image.open(photo_path.resolve())
         result = await analyze_food_image(photo)
-        assert result.get("status") == "success" or result == {
+        assert result.status == "success" or result.model_dump(mode="json") == {
             "status": "error",
             "message": "Ограничение лимита"
         }
@@ -193,7 +204,7 @@ class TestAnalyzeFoodImage:
         photo = Image.open(photo_path.resolve())
         result = await analyze_food_image(photo)
         print(result)
-        assert result.get("status") == "danger" or result == {
+        assert result.status == "danger" or result.model_dump(mode="json") == {
             "status": "error",
             "message": "Ограничение лимита"
         }
@@ -206,13 +217,483 @@ class TestAnalyzeFoodImage:
         photo_path = current_dir / "../src/image/4.webp"
         photo = Image.open(photo_path.resolve())
         result = await analyze_food_image(photo)
-        assert result.get("status") == "not_found" or result == {
+        assert result.status == "not_found" or result.model_dump(mode="json") == {
             "status": "error",
             "message": "Ограничение лимита"
         }
 
 
+class TestParseFoodResponse:
+    """Тестирование разбора ответа модели"""
+    ITEM = '{"proteins": 4.0, "fats": 1.0, "carbohydrates": 38.0, "water": 105.0, "weight": 150, "benefit_score": 3.8}'
+
+    def test_plain(self):
+        result = parse_food_response(f'{{"status": "success", "food_items": {{"рис": {self.ITEM}}}}}')
+        assert isinstance(result, FoodSuccessResponse)
+        assert result.food_items["рис"].weight == 150
+
+    @pytest.mark.parametrize("template", [
+        "```json\n{}\n```",
+        "```{}```  ",
+        "Вот результат анализа: {} Надеюсь, это поможет.",
+    ])
+    def test_surrounding_text(self, template):
+        """JSON-объект извлекается из markdown и текста вокруг"""
+        result = parse_food_response(template.format('{"status": "not_found", "message": "Нет еды"}'))
+        assert result == NotFoundResponse(message="Нет еды")
+
+    def test_salvage_items(self):
+        """Некорректные продукты отбрасываются, корректные сохраняются"""
+        text = f"""{{"status": "success", "food_items": {{
+            "рис": {self.ITEM},
+            "соус": {{"proteins": -1, "fats": 1.0, "carbohydrates": 2.0, "water": 5.0, "weight": 20, "benefit_score": 2}},
+            "хлеб": {{"proteins": 8.0, "fats": 1.0}},
+            "чай": "без сахара"
+        }}}}"""
+        result = parse_food_response(text)
+        assert isinstance(result, FoodSuccessResponse)
+        assert list(result.food_items) == ["рис"]
+
+    def test_salvage_danger(self):
+        """В опасном ответе сохраняется сообщение"""
+        text = f'{{"status": "danger", "message": "Ядовито", "food_items": {{"гриб": {self.ITEM}, "x": {{}}}}}}'
+        result = parse_food_response(text)
+        assert isinstance(result, DangerResponse)
+        assert result.message == "Ядовито"
+        assert list(result.food_items) == ["гриб"]
+
+    @pytest.mark.parametrize("text", [
+        '{"status": "success", "food_items": {"хлеб": {"proteins": 8.0}}}',
+        '{"status": "success", "message": "без продуктов"}',
+        '{"status": "unknown", "message": "-"}',
+        '{"status": "success", "food_items": {',
+        "не JSON",
+    ])
+    def test_invalid(self, text):
+        """Если спасти нечего — ошибка формирования ответа"""
+        assert parse_food_response(text) == ErrorResponse(message="Ошибка формирования ответа")
+
+    def test_error_status(self):
+        """Ошибка, которую вернула сама модель, передаётся как есть"""
+        assert parse_food_response('{"status": "error", "message": "Плохое фото"}') == \
+            ErrorResponse(message="Плохое фото")
+
+
+class TestGeminiConcurrency:
+    """Тестирование асинхронного вызова Gemini"""
+
+    @pytest.fixture(autouse=True)
+    def reset_router(self):
+        """Состояние моделей не переносится между тестами"""
+        analyze.model_router.reset()
+        yield
+        analyze.model_router.reset()
+
+    @staticmethod
+    def make_client(delay: float, counter: dict) -> MagicMock:
+        """Клиент Gemini, отвечающий с задержкой и считающий одновременные запросы"""
+        async def generate_content(**kwargs):
+            counter["active"] += 1
+            counter["max"] = max(counter["max"], counter["active"])
+            try:
+                await asyncio.sleep(delay)
+            finally:
+                counter["active"] -= 1
+            return MagicMock(text='{"status": "not_found", "message": "Нет еды"}')
+
+        client = MagicMock()
+        client.aio.models.generate_content = AsyncMock(side_effect=generate_content)
+        return client
+
+    @pytest.mark.asyncio
+    async def test_uses_async_api(self):
+        """Запрос к Gemini выполняется через асинхронный интерфейс"""
+        image = Mock(spec=Image.Image)
+        image.size = (500, 500)
+        client = self.make_client(0, {"active": 0, "max": 0})
+        with patch("src.api.analyze.get_gemini_client", return_value=client):
+            result = await analyze_food_image(image)
+        assert result.model_dump(mode="json") == {"status": "not_found", "message": "Нет еды"}
+        client.aio.models.generate_content.assert_awaited_once()
+        client.models.generate_content.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_prebuilt_request(self):
+        """В запрос передаются заранее подготовленные промпт и настройки"""
+        image = Mock(spec=Image.Image)
+        image.size = (500, 500)
+        client = self.make_client(0, {"active": 0, "max": 0})
+        with patch("src.api.analyze.get_gemini_client", return_value=client):
+            await analyze_food_image(image)
+            await analyze_food_image(image)
+        calls = client.aio.models.generate_content.await_args_list
+        assert calls[0].kwargs["contents"][0] is analyze.PROMPT
+        assert calls[0].kwargs["config"] is analyze.get_generate_config()
+        assert calls[1].kwargs["config"] is calls[0].kwargs["config"]
+
+    @pytest.mark.asyncio
+    async def test_prepared_image_inline(self):
+        """Подготовленное изображение отправляется как inline-часть с исходными байтами"""
+        prepared = PreparedImage(data=b"jpeg", mime_type="image/jpeg", width=500, height=400, dhash=0)
+        client = self.make_client(0, {"active": 0, "max": 0})
+        with patch("src.api.analyze.get_gemini_client", return_value=client):
+            await analyze_food_image(prepared)
+        part = client.aio.models.generate_content.await_args.kwargs["contents"][1]
+        assert part.inline_data.data == b"jpeg"
+        assert part.inline_data.mime_type == "image/jpeg"
+
+    @pytest.mark.asyncio
+    async def test_concurrency_limit(self):
+        """Число одновременных запросов к Gemini не превышает лимит"""
+        image = Mock(spec=Image.Image)
+        image.size = (500, 500)
+        counter = {"active": 0, "max": 0}
+        client = self.make_client(0.05, counter)
+        with patch("src.api.analyze.get_gemini_client", return_value=client), \
+                patch.object(analyze, "GEMINI_MAX_CONCURRENCY", 2), \
+                patch.object(analyze, "_gemini_semaphore", None):
+            results = await asyncio.gather(*(analyze_food_image(image) for _ in range(6)))
+        assert all(result.status == "not_found" for result in results)
+        assert counter["max"] == 2
+
+    @pytest.mark.asyncio
+    async def test_event_loop_not_blocked(self):
+        """Во время ожидания ответа Gemini event loop обслуживает другие задачи"""
+        image = Mock(spec=Image.Image)
+        image.size = (500, 500)
+        client = self.make_client(0.2, {"active": 0, "max": 0})
+        with patch("src.api.analyze.get_gemini_client", return_value=client):
+            task = asyncio.create_task(analyze_food_image(image))
+            await asyncio.sleep(0.01)
+            assert not task.done()
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(task, timeout=0.05)
+
+
+class TestModelFailover:
+    """Тестирование перехода на следующую модель"""
+
+    @pytest.fixture(autouse=True)
+    def router(self):
+        router = ModelRouter(["main", "lite"], failure_threshold=2)
+        with patch.object(analyze, "model_router", router):
+            yield router
+
+    @staticmethod
+    def make_client(*outcomes) -> MagicMock:
+        """Клиент Gemini, по очереди возвращающий ответы или исключения"""
+        client = MagicMock()
+        responses = [outcome if isinstance(outcome, Exception) else MagicMock(text=outcome) for outcome in outcomes]
+        client.aio.models.generate_content = AsyncMock(side_effect=responses)
+        return client
+
+    @staticmethod
+    def image() -> Mock:
+        image = Mock(spec=Image.Image)
+        image.size = (500, 500)
+        return image
+
+    @pytest.mark.asyncio
+    async def test_retry_on_quota(self, router):
+        """После 429 тот же запрос выполняется на следующей модели"""
+        client = self.make_client(Exception("429 RESOURCE_EXHAUSTED"), '{"status": "not_found", "message": "-"}')
+        with patch("src.api.analyze.get_gemini_client", return_value=client):
+            result = await analyze_food_image(self.image())
+        assert result.status == "not_found"
+        models = [call.kwargs["model"] for call in client.aio.models.generate_content.await_args_list]
+        assert models == ["main", "lite"]
+        assert router.candidates() == ["lite"]
+
+    @pytest.mark.asyncio
+    async def test_exhausted_model_not_tried(self, router):
+        """Модель с исчерпанной квотой не получает запросы, пока не истечёт пауза"""
+        router.record_failure("main", "quota", 0.1)
+        client = self.make_client('{"status": "not_found", "message": "-"}')
+        with patch("src.api.analyze.get_gemini_client", return_value=client):
+            await analyze_food_image(self.image())
+        assert client.aio.models.generate_content.await_args.kwargs["model"] == "lite"
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("errors, message", [
+        (["429 RESOURCE_EXHAUSTED", "429 RESOURCE_EXHAUSTED"], "Ограничение лимита"),
+        (["503 UNAVAILABLE", "400 INVALID_ARGUMENT"], "Неверные аргументы"),
+        (["503 UNAVAILABLE", "503 UNAVAILABLE"], "Ошибка при анализе изображения"),
+    ])
+    async def test_all_models_failed(self, errors, message):
+        client = self.make_client(*(Exception(error) for error in errors))
+        with patch("src.api.analyze.get_gemini_client", return_value=client):
+            result = await analyze_food_image(self.image())
+        assert result.model_dump(mode="json") == {"status": "error", "message": message}
+
+    @pytest.mark.asyncio
+    async def test_invalid_request_not_retried(self, router):
+        """Неверный запрос (400) — ошибка клиента: другие модели не пробуются, цепь не размыкается"""
+        for _ in range(3):
+            client = self.make_client(Exception("400 INVALID_ARGUMENT"), '{"status": "not_found", "message": "-"}')
+            with patch("src.api.analyze.get_gemini_client", return_value=client):
+                result = await analyze_food_image(self.image())
+            assert result.model_dump(mode="json") == {"status": "error", "message": "Неверные аргументы"}
+            client.aio.models.generate_content.assert_awaited_once()
+        assert router.candidates() == ["main", "lite"]
+
+    @pytest.mark.asyncio
+    async def test_no_models_available(self, router):
+        """Если все квоты исчерпаны, запрос к Gemini не отправляется"""
+        router.record_failure("main", "quota", 0.1)
+        router.record_failure("lite", "quota", 0.1)
+        client = self.make_client()
+        with patch("src.api.analyze.get_gemini_client", return_value=client):
+            result = await analyze_food_image(self.image())
+        assert result.model_dump(mode="json") == {"status": "error", "message": "Ограничение лимита"}
+        client.aio.models.generate_content.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_deadline(self, router):
+        """По истечении бюджета следующая модель не пробуется"""
+        async def slow(**kwargs):
+            await asyncio.sleep(1)
+
+        client = MagicMock()
+        client.aio.models.generate_content = AsyncMock(side_effect=slow)
+        with patch("src.api.analyze.get_gemini_client", return_value=client):
+            result = await analyze_food_image(self.image(), timeout=0.05)
+        assert result.status == "error"
+        assert client.aio.models.generate_content.await_count == 1
+        assert {item["name"]: item for item in router.snapshot()}["main"]["last_error"] == "timeout"
+
+    @pytest.mark.asyncio
+    async def test_single_probe(self, router):
+        """После паузы полуоткрытая модель получает один пробный запрос, остальные идут на следующую"""
+        router.record_failure("main", "error", 1.0)
+        router.record_failure("main", "error", 1.0)
+        router._states["main"].circuit_open_until = 0.0
+
+        async def generate(model, **kwargs):
+            await asyncio.sleep(0.05)
+            return MagicMock(text='{"status": "not_found", "message": "-"}')
+
+        client = MagicMock()
+        client.aio.models.generate_content = AsyncMock(side_effect=generate)
+        with patch("src.api.analyze.get_gemini_client", return_value=client):
+            results = await asyncio.gather(*(analyze_food_image(self.image()) for _ in range(4)))
+        assert all(result.status == "not_found" for result in results)
+        models = [call.kwargs["model"] for call in client.aio.models.generate_content.await_args_list]
+        assert sorted(models) == ["lite", "lite", "lite", "main"]
+        assert router.candidates() == ["main", "lite"]
+        assert router.acquire("main") and router.acquire("main")
+
+    @pytest.mark.asyncio
+    async def test_client_deadline_not_model_failure(self, router):
+        """Короткий срок клиента истекает раньше предела ANALYZE_TIMEOUT: модель не считается сбойной"""
+        async def slow(**kwargs):
+            await asyncio.sleep(1)
+
+        client = MagicMock()
+        client.aio.models.generate_content = AsyncMock(side_effect=slow)
+        with patch("src.api.analyze.get_gemini_client", return_value=client):
+            for _ in range(3):
+                result = await analyze_food_image(self.image(), timeout=30, deadline=Deadline(0.05))
+                assert result.status == "error"
+        state = {item["name"]: item for item in router.snapshot()}["main"]
+        assert (state["failures"], state["last_error"]) == (0, None)
+        assert router.candidates() == ["main", "lite"]
+
+
+STREAM_ANSWER = json.dumps({
+    "status": "success",
+    "food_items": {
+        "Салат \"{оливье}\"": {"proteins": 5.0, "fats": 20.0, "carbohydrates": 8.0, "water": 60.0,
+                               "weight": 150, "benefit_score": 2.5},
+        "Ошибка": {"proteins": -1},
+        "Чай": {"proteins": 0.0, "fats": 0.0, "carbohydrates": 0.0, "water": 200.0, "weight": 200, "benefit_score": 4.0},
+    }
+}, ensure_ascii=False)
+
+
+class TestFoodItemStream:
+    """Тестирование пошагового разбора ответа модели"""
+
+    def test_items_as_soon_as_closed(self):
+        """Продукт отдаётся на закрывающей скобке своего объекта, даже при разбиении по символу"""
+        text = "```json\n" + STREAM_ANSWER + "\n```"
+        parser = FoodItemStream()
+        found = {}
+        for position, char in enumerate(text):
+            for name, item in parser.feed(char):
+                found[name] = position
+        assert list(found) == ['Салат "{оливье}"', "Чай"]
+        assert text[found["Чай"]] == "}" and text[:found["Чай"] + 1].endswith('"benefit_score": 4.0}')
+        assert parser.text == text
+
+    def test_nested_keys_ignored(self):
+        """Ключ food_items внутри продукта и продукты после закрытия food_items не разбираются"""
+        text = ('{"food_items": {"Суп": {"proteins": 1.0, "fats": 1.0, "carbohydrates": 1.0, "water": 1.0, '
+                '"weight": 1, "benefit_score": 1.0}}, "extra": {"food_items": {"x": {}}}}')
+        assert [name for name, _ in FoodItemStream().feed(text)] == ["Суп"]
+
+    def test_not_food(self):
+        assert FoodItemStream().feed('{"status": "not_found", "message": "Нет {еды}"}') == []
+
+
+class TestAnalyzeFoodImageStream:
+    """Тестирование потокового анализа изображения"""
+
+    @pytest.fixture(autouse=True)
+    def router(self):
+        router = ModelRouter(["main", "lite"], failure_threshold=2)
+        with patch.object(analyze, "model_router", router):
+            yield router
+
+    @staticmethod
+    def make_client(*outcomes) -> MagicMock:
+        """Клиент Gemini: каждый ответ — список частей текста или исключение"""
+        def stream(parts):
+            async def chunks():
+                for part in parts:
+                    if isinstance(part, Exception):
+                        raise part
+                    yield MagicMock(text=part)
+            return chunks()
+
+        client = MagicMock()
+        client.aio.models.generate_content_stream = AsyncMock(side_effect=[
+            outcome if isinstance(outcome, Exception) else stream(outcome) for outcome in outcomes
+        ])
+        return client
+
+    @staticmethod
+    async def collect(image=None, **kwargs) -> list:
+        if image is None:
+            image = Mock(spec=Image.Image)
+            image.size = (500, 500)
+        return [part async for part in analyze_food_image_stream(image, **kwargs)]
+
+    @pytest.mark.asyncio
+    async def test_items_then_result(self):
+        """Продукты приходят по одному, затем проверенный ответ целиком"""
+        middle = STREAM_ANSWER.index('"Чай"')
+        client = self.make_client([STREAM_ANSWER[:40], STREAM_ANSWER[40:middle], STREAM_ANSWER[middle:]])
+        with patch("src.api.analyze.get_gemini_client", return_value=client):
+            parts = await self.collect()
+        assert [part[0] for part in parts[:-1]] == ['Салат "{оливье}"', "Чай"]
+        assert isinstance(parts[0][1], FoodItem)
+        result = parts[-1]
+        assert isinstance(result, FoodSuccessResponse)
+        assert set(result.food_items) == {'Салат "{оливье}"', "Чай"}
+
+    @pytest.mark.asyncio
+    async def test_failover_before_first_chunk(self, router):
+        """Ошибка до первой части ответа переводит запрос на следующую модель"""
+        client = self.make_client(Exception("429 RESOURCE_EXHAUSTED"), [STREAM_ANSWER])
+        with patch("src.api.analyze.get_gemini_client", return_value=client):
+            parts = await self.collect()
+        assert parts[-1].status == "success"
+        models = [call.kwargs["model"] for call in client.aio.models.generate_content_stream.await_args_list]
+        assert models == ["main", "lite"]
+
+    @pytest.mark.asyncio
+    async def test_invalid_request_not_retried(self, router):
+        """Неверный запрос не переходит на следующую модель и не размыкает цепь"""
+        for _ in range(3):
+            client = self.make_client(Exception("400 INVALID_ARGUMENT"), [STREAM_ANSWER])
+            with patch("src.api.analyze.get_gemini_client", return_value=client):
+                parts = await self.collect()
+            assert parts == [ErrorResponse(message="Неверные аргументы")]
+            client.aio.models.generate_content_stream.assert_awaited_once()
+        assert router.candidates() == ["main", "lite"]
+
+    @pytest.mark.asyncio
+    async def test_error_after_first_chunk(self):
+        """Обрыв после первой части не повторяется на другой модели: уже отданные продукты остаются"""
+        middle = STREAM_ANSWER.index('"Чай"')
+        client = self.make_client([STREAM_ANSWER[:middle], Exception("503 UNAVAILABLE")], [STREAM_ANSWER])
+        with patch("src.api.analyze.get_gemini_client", return_value=client):
+            parts = await self.collect()
+        assert parts[0][0] == 'Салат "{оливье}"'
+        assert parts[-1].model_dump(mode="json") == {"status": "error", "message": "Ошибка при анализе изображения"}
+        client.aio.models.generate_content_stream.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_deadline_between_chunks(self):
+        async def slow():
+            yield MagicMock(text=STREAM_ANSWER[:10])
+            await asyncio.sleep(1)
+
+        client = MagicMock()
+        client.aio.models.generate_content_stream = AsyncMock(return_value=slow())
+        with patch("src.api.analyze.get_gemini_client", return_value=client):
+            parts = await self.collect(timeout=0.05)
+        assert parts == [ErrorResponse(message="Ошибка при анализе изображения")]
+
+    @pytest.mark.asyncio
+    async def test_client_deadline_not_model_failure(self, router):
+        """Срок клиента, истёкший между частями ответа, не размыкает цепь модели"""
+        def slow():
+            async def chunks():
+                yield MagicMock(text=STREAM_ANSWER[:10])
+                await asyncio.sleep(1)
+            return chunks()
+
+        client = MagicMock()
+        client.aio.models.generate_content_stream = AsyncMock(side_effect=lambda **kwargs: slow())
+        with patch("src.api.analyze.get_gemini_client", return_value=client):
+            for _ in range(3):
+                await self.collect(timeout=30, deadline=Deadline(0.05))
+        assert router.candidates() == ["main", "lite"]
+        assert {item["name"]: item for item in router.snapshot()}["main"]["failures"] == 0
+
+    @pytest.mark.asyncio
+    async def test_size_checked(self):
+        image = Mock(spec=Image.Image)
+        image.size = (50, 50)
+        parts = await self.collect(image)
+        assert parts == [ErrorResponse(message="Изображение слишком короткое или слишком узкое")]
+
+
+class TestMatchFoods:
+    """Тестирование выбора продукта среди ответа источника"""
+
+    FOODS = [
+        {"name": "Гречка отварная", "info": "110 ккал, Б 4.2, Ж 1.1, У 21.3"},
+        {"name": "гречка отварная", "info": "120 ккал, Б 4.4, Ж 1.3, У 22.1"},
+        {"name": "Гречка с молоком", "info": "140 ккал, Б 5.0, Ж 3.0, У 20.0"},
+        {"name": "Гречка", "info": "313 ккал, Б 12.6, Ж 3.3, У 62.1"},
+        {"name": "Рис", "info": "не число ккал"},
+    ]
+
+    def test_exact(self):
+        """Точное совпадение выбирается даже при близких альтернативах"""
+        result = match_foods("Гречка", group_foods(self.FOODS))
+        assert result["calories"] == 313.0
+        assert "matched_name" not in result
+        assert [item["food_name"] for item in result["alternatives"]] == ["Гречка с молоком", "Гречка отварная"]
+
+    def test_fuzzy(self):
+        """Другая форма слова находит продукт, медиана считается по его записям"""
+        result = match_foods("гречка варёная", group_foods(self.FOODS))
+        assert result["matched_name"] == "Гречка отварная"
+        assert result["calories"] == 115.0
+        assert result["score"] < 1
+        assert result["alternatives"][0]["food_name"] == "Гречка"
+
+    def test_not_found(self):
+        assert match_foods("курица", group_foods(self.FOODS)) is None
+        assert match_foods("рис", group_foods(self.FOODS)) is None
+
+    def test_no_alternatives(self):
+        result = match_foods("рис", group_foods([{"name": "Рис", "info": "116 ккал, Б 2.2, Ж 0.5, У 24.9"}]))
+        assert result == {"calories": 116.0, "proteins": 2.2, "fats": 0.5, "carbohydrates": 24.9, "weight": 100.0}
+
+
 class TestAnalyzeFoodJSON:
+    @pytest.fixture(autouse=True)
+    def local_index(self, tmp_path):
+        """Пустой локальный индекс на время теста"""
+        index = NutritionIndex(str(tmp_path / "nutrition.db"))
+        with patch.object(analyze, "nutrition_index", index):
+            yield index
+        index.close()
+
     @pytest.mark.asyncio
     @pytest.mark.parametrize("name, result", [
         ("яблоко", {'calories': 47.5, 'proteins': 0.4, 'fats': 0.4, 'carbohydrates': 9.8, 'weight': 100.0}),
@@ -229,18 +710,97 @@ class TestAnalyzeFoodJSON:
         assert result == res
 
     @pytest.mark.asyncio
-    async def test_bad_status(self):
+    @pytest.mark.parametrize("status_code", [404, 500, 503])
+    async def test_bad_status(self, status_code):
+        """Ошибка источника — не "не найдено", а исключение"""
         mocked_response = MagicMock()
-        mocked_response.status_code = 404
-        with patch("requests.post", return_value=mocked_response):
-            res = await analyze_food_json(name="яблоко")
-            assert res == False
+        mocked_response.status_code = status_code
+        with mock_http_client(mocked_response):
+            with pytest.raises(httpx.HTTPStatusError):
+                await analyze_food_json(name="яблоко")
 
     @pytest.mark.asyncio
     async def test_bad_data(self):
         mocked_response = MagicMock()
         mocked_response.status_code = 200
         mocked_response.json.return_value = "неверный ответ от api"
-        with patch("requests.post", return_value=mocked_response):
+        with mock_http_client(mocked_response):
+            with pytest.raises(httpx.DecodingError):
+                await analyze_food_json(name="яблоко")
+
+    @pytest.mark.asyncio
+    async def test_uses_shared_client(self):
+        """Поиск идёт через общий HTTP-клиент, а не через новое соединение"""
+        mocked_response = MagicMock()
+        mocked_response.status_code = 200
+        mocked_response.json.return_value = {"result": {"foods": [
+            {"name": "Яблоко", "info": "47 ккал, Б 0.4, Ж 0.4, У 9.8"}
+        ]}}
+        with mock_http_client(mocked_response) as get_client:
             res = await analyze_food_json(name="яблоко")
-            assert res == False
+        assert res == {'calories': 47.0, 'proteins': 0.4, 'fats': 0.4, 'carbohydrates': 9.8, 'weight': 100.0}
+        get_client.return_value.post.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_deadline_cancels_upstream(self):
+        """По истечении срока запрос к источнику отменяется"""
+        cancelled = asyncio.Event()
+
+        async def slow_post(*args, **kwargs):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        http_client = MagicMock()
+        http_client.post = slow_post
+        with patch("src.api.analyze.get_http_client", return_value=http_client):
+            with pytest.raises(asyncio.TimeoutError):
+                await analyze_food_json(name="яблоко", deadline=Deadline(0.05))
+        assert cancelled.is_set()
+
+    @pytest.mark.asyncio
+    async def test_local_index_first(self, local_index):
+        """Продукт из локального индекса находится без запроса к источнику"""
+        local_index.add_foods([("Яблоко", "47 ккал, Б 0.4, Ж 0.4, У 9.8"), ("яблоко", "45 ккал, Б 0.2, Ж 0.4, У 9.6")])
+        with mock_http_client(MagicMock()) as get_client:
+            res = await analyze_food_json(name="Яблоко")
+        assert res == {'calories': 46.0, 'proteins': 0.3, 'fats': 0.4, 'carbohydrates': 9.7, 'weight': 100.0}
+        get_client.return_value.post.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_remote_written_back(self, local_index):
+        """Ответ источника сохраняется в локальный индекс, включая другие продукты"""
+        mocked_response = MagicMock()
+        mocked_response.status_code = 200
+        mocked_response.json.return_value = {"result": {"foods": [
+            {"name": "Яблоко", "info": "47 ккал, Б 0.4, Ж 0.4, У 9.8"},
+            {"name": "Яблоко печёное", "info": "66 ккал, Б 0.5, Ж 0.4, У 14.7"},
+            {"name": "Яблоко сушёное", "info": "не число ккал"}
+        ]}}
+        with mock_http_client(mocked_response) as get_client:
+            first = await analyze_food_json(name="яблоко")
+            second = await analyze_food_json(name="печёное яблоко")
+        alternatives = first.pop("alternatives")
+        assert first == {'calories': 47.0, 'proteins': 0.4, 'fats': 0.4, 'carbohydrates': 9.8, 'weight': 100.0}
+        assert [item["food_name"] for item in alternatives] == ["Яблоко печёное"]
+        assert second == {'calories': 66.0, 'proteins': 0.5, 'fats': 0.4, 'carbohydrates': 14.7, 'weight': 100.0}
+        get_client.return_value.post.assert_awaited_once()
+        assert len(local_index) == 2
+
+    @pytest.mark.asyncio
+    async def test_remote_feeds_suggestions(self):
+        """Названия из ответа источника попадают в подсказки поиска"""
+        mocked_response = MagicMock()
+        mocked_response.status_code = 200
+        mocked_response.json.return_value = {"result": {"foods": [
+            {"name": "Яблоко", "info": "47 ккал, Б 0.4, Ж 0.4, У 9.8"},
+            {"name": "Яблоко печёное", "info": "66 ккал, Б 0.5, Ж 0.4, У 14.7"}
+        ]}}
+        index = SuggestIndex()
+        with mock_http_client(mocked_response), patch.object(analyze, "suggest_index", index):
+            await analyze_food_json(name="яблоко")
+        suggestions = index.suggest("печ")
+        assert [item.name for item in suggestions] == ["Яблоко печёное"]
+        assert suggestions[0].nutrition["calories"] == 66.0
@@ -1,16 +1,57 @@
 from unittest.mock import patch, AsyncMock
 from fastapi.testclient import TestClient
 from fastapi import Request
+from pathlib import Path
 from io import BytesIO
 from PIL import Image
 import asyncio
 import pytest
+import httpx
+import logging
+import json
+import time
 
 from src.api.api import app, log_requests
+from src.api.cache import image_result_cache, search_cache
+from src.api.limits import rate_limiter, FairScheduler
+from src.api.suggest import suggest_index
+from src.api.startup import startup_profile
+from src.api.config import SEARCH_DEADLINE
+from src.api.analyze import fetch_foods
+from src.api.nutrition_db import NutritionIndex
+from src.api.schemas import FoodSuccessResponse, FoodItem, ErrorResponse
 
 client = TestClient(app)
 
 
+@pytest.fixture(autouse=True)
+def local_index(tmp_path):
+    """Локальный индекс во временной базе: поиск через источник не пишет в nutrition.db приложения"""
+    index = NutritionIndex(str(tmp_path / "nutrition.db"))
+    with patch("src.api.analyze.nutrition_index", index), patch("src.api.api.nutrition_index", index):
+        yield index
+    index.close()
+
+
+@pytest.fixture
+def clear_analyze_state():
+    """Каждый тест анализа начинается с пустого кеша результатов и лимитов запросов"""
+    image_result_cache.clear()
+    rate_limiter.clear()
+    yield
+    image_result_cache.clear()
+    rate_limiter.clear()
+
+
+def create_test_image(format_: str = "JPEG", size: tuple = (100, 100), color: tuple = (73, 109, 137)) -> BytesIO:
+    """Создаёт однотонное тестовое изображение."""
+    img = Image.new("RGB", size, color=color)
+    buf = BytesIO()
+    img.save(buf, format=format_)
+    buf.seek(0)
+    return buf
+
+
 class TestStaticEndpoints:
     """Тестирование статичных эндпоинтов"""
 
@@ -30,7 +71,26 @@ class TestStaticEndpoints:
         data = response.json()
         assert data == {"status": "healthy", "service": "food-detect"}
 
+    def test_ready_endpoint(self):
+        """/ready отвечает 503, пока воркер не прогрет, и 200 с профилем запуска после"""
+        startup_profile.reset()
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["status"] == "starting"
 
+        startup_profile.record("imports", 12.5)
+        startup_profile.ready = True
+        try:
+            response = client.get("/ready")
+            assert response.status_code == 200
+            assert response.json() == {
+                "status": "ready", "startup": {"ready": True, "stages_ms": {"imports": 12.5}, "errors": {}}
+            }
+        finally:
+            startup_profile.reset()
+
+
+@pytest.mark.usefixtures("clear_analyze_state")
 class TestAnalyzeFoodEndpoint:
     """Тестирование эндпоинта /analyze/"""
 
@@ -104,23 +164,15 @@ class TestAnalyzeFoodEndpoint:
             }
         ]
 
-    @staticmethod
-    def create_test_image(format_: str = "JPEG") -> BytesIO:
-        """Создаёт простое тестовое изображение."""
-        img = Image.new("RGB", (100, 100), color=(73, 109, 137))
-        buf = BytesIO()
-        img.save(buf, format=format_)
-        buf.seek(0)
-        return buf
-
     @pytest.mark.asyncio
     async def test_valid_image_analysis_with_get_test_data(self, get_test_data):
         """Тестирует обработку изображения для всех кейсов из get_test_data."""
         for mock_result in get_test_data:
+            image_result_cache.clear()
             with patch("src.api.api.analyze_food_image", new_callable=AsyncMock) as mock_analyze:
                 mock_analyze.return_value = mock_result
 
-                img_buf = self.create_test_image()
+                img_buf = create_test_image()
                 response = client.post(
                     "/analyze/",
                     files={"file": ("test.jpg", img_buf, "image/jpeg")}
@@ -146,7 +198,7 @@ class TestAnalyzeFoodEndpoint:
         """Неподдерживаемый тип файла → 400 ошибка."""
         response = client.post("/analyze/", files={"file": ("test.txt", b"fake text", "text/plain")})
         assert response.status_code == 400
-        assert "Поддерживаются только JPEG и PNG" in response.json()["detail"]
+        assert "Поддерживаются только JPEG, PNG и WebP" in response.json()["detail"]
 
     @pytest.mark.asyncio
     async def test_file_too_large(self):
@@ -156,6 +208,16 @@ class TestAnalyzeFoodEndpoint:
         assert response.status_code == 400
         assert "Размер файла превышает 10MB" in response.json()["detail"]
 
+    @pytest.mark.asyncio
+    async def test_body_too_large_rejected_early(self):
+        """Тело запроса заметно больше лимита отклоняется без вызова анализа."""
+        large_file = b"\xff\xd8\xff" + b"x" * (11 * 1024 * 1024)
+        with patch("src.api.api.read_upload", new_callable=AsyncMock) as mock_read:
+            response = client.post("/analyze/", files={"file": ("big.jpg", large_file, "image/jpeg")})
+        assert response.status_code == 400
+        assert "Размер файла превышает 10MB" in response.json()["detail"]
+        mock_read.assert_not_awaited()
+
     @pytest.mark.asyncio
     async def test_corrupted_image(self):
         """Некорректное изображение → 400 ошибка."""
@@ -169,7 +231,7 @@ class TestAnalyzeFoodEndpoint:
         with patch("src.api.api.analyze_food_image", new_callable=AsyncMock) as mock_analyze:
             mock_analyze.side_effect = asyncio.TimeoutError()
 
-            img_buf = self.create_test_image()
+            img_buf = create_test_image()
             response = client.post(
                 "/analyze/",
                 files={"file": ("test.jpg", img_buf, "image/jpeg")}
@@ -177,6 +239,57 @@ class TestAnalyzeFoodEndpoint:
             assert response.status_code == 408
             assert "Анализ изображения превысил лимит времени" in response.json()["detail"]
 
+    @pytest.mark.asyncio
+    async def test_client_deadline(self):
+        """Бюджет из заголовка клиента ограничивает анализ, а незавершённый запрос к модели отменяется."""
+        cancelled = []
+
+        async def slow_analyze(image, deadline=None):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(deadline.budget)
+                raise
+
+        with patch("src.api.api.analyze_food_image", side_effect=slow_analyze):
+            started = time.perf_counter()
+            response = client.post(
+                "/analyze/",
+                files={"file": ("test.jpg", create_test_image(), "image/jpeg")},
+                headers={"X-Request-Timeout": "0.2"}
+            )
+        assert response.status_code == 408
+        assert time.perf_counter() - started < 2
+        assert cancelled == [0.2]
+
+    def test_deadline_error_result(self):
+        """Запрос к модели, прерванный по сроку запроса раньше внешнего ожидания, тоже даёт 408."""
+        def expired_analyze(image, deadline=None):
+            time.sleep(0.3)
+            return ErrorResponse(message="Ошибка при анализе изображения")
+
+        with patch("src.api.api.analyze_food_image", side_effect=expired_analyze):
+            response = client.post(
+                "/analyze/",
+                files={"file": ("test.jpg", create_test_image(), "image/jpeg")},
+                headers={"X-Request-Timeout": "0.2"}
+            )
+        assert response.status_code == 408
+        assert "Анализ изображения превысил лимит времени" in response.json()["detail"]
+
+    @pytest.mark.asyncio
+    async def test_server_timing_budget(self):
+        """Server-Timing содержит бюджет запроса рядом с расходом по этапам."""
+        with patch("src.api.api.analyze_food_image", new_callable=AsyncMock) as mock_analyze:
+            mock_analyze.return_value = {"status": "not_found", "message": "Нет еды"}
+            response = client.post(
+                "/analyze/",
+                files={"file": ("test.jpg", create_test_image(), "image/jpeg")},
+                headers={"X-Request-Timeout": "30"}
+            )
+        assert "budget;dur=30000.0" in response.headers["server-timing"]
+        assert mock_analyze.await_args.kwargs["deadline"].budget == 30.0
+
     @pytest.mark.asyncio
     async def test_unknown_status_from_analyzer(self):
         """Неизвестный статус → 500 ошибка."""
@@ -185,7 +298,7 @@ class TestAnalyzeFoodEndpoint:
         with patch("src.api.api.analyze_food_image", new_callable=AsyncMock) as mock_analyze:
             mock_analyze.return_value = mock_result
 
-            img_buf = self.create_test_image()
+            img_buf = create_test_image()
             response = client.post(
                 "/analyze/",
                 files={"file": ("test.jpg", img_buf, "image/jpeg")}
@@ -250,9 +363,401 @@ class TestAnalyzeFoodEndpoint:
             mock_analyze.assert_awaited_once()
 
 
+    @pytest.mark.asyncio
+    async def test_result_cache(self, get_test_data):
+        """Повторная загрузка того же фото отдаётся из кеша без вызова анализа."""
+        with patch("src.api.api.analyze_food_image", new_callable=AsyncMock) as mock_analyze:
+            mock_analyze.return_value = get_test_data[0]
+            first = client.post("/analyze/", files={"file": ("test.jpg", create_test_image(), "image/jpeg")})
+            second = client.post("/analyze/", files={"file": ("test.jpg", create_test_image(), "image/jpeg")})
+
+        assert first.status_code == second.status_code == 200
+        assert first.headers["X-Cache"] == "MISS"
+        assert second.headers["X-Cache"] == "HIT"
+        assert first.json() == second.json()
+        mock_analyze.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_result_cache_similar_image(self, get_test_data):
+        """Пересжатое фото находится в кеше по перцептивному хешу."""
+        # больше IMAGE_MAX_EDGE: файлы декодируются, и для них считается dHash
+        size = (1200, 1200)
+        with patch("src.api.api.analyze_food_image", new_callable=AsyncMock) as mock_analyze:
+            mock_analyze.return_value = get_test_data[3]
+            client.post("/analyze/", files={"file": ("test.jpg", create_test_image("JPEG", size), "image/jpeg")})
+            response = client.post(
+                "/analyze/", files={"file": ("test.png", create_test_image("PNG", size), "image/png")}
+            )
+
+        assert response.status_code == 200
+        assert response.headers["X-Cache"] == "HIT-SIMILAR"
+        assert response.json()["status"] == "danger"
+        mock_analyze.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_image_preprocessed(self, get_test_data):
+        """В анализ передаётся уменьшенное изображение, время этапов в Server-Timing."""
+        img = Image.new("RGB", (2400, 1200), color=(73, 109, 137))
+        buf = BytesIO()
+        img.save(buf, format="JPEG")
+        buf.seek(0)
+        with patch("src.api.api.analyze_food_image", new_callable=AsyncMock) as mock_analyze:
+            mock_analyze.return_value = get_test_data[2]
+            response = client.post("/analyze/", files={"file": ("big.jpg", buf, "image/jpeg")})
+
+        assert response.status_code == 200
+        prepared = mock_analyze.await_args.args[0]
+        assert prepared.size == (2400, 1200)
+        assert max(Image.open(BytesIO(prepared.data)).size) <= 1024
+        timing = response.headers["Server-Timing"]
+        for stage in ("read", "decode", "resize", "encode", "preprocess", "analyze"):
+            assert f"{stage};dur=" in timing
+
+    @pytest.mark.asyncio
+    async def test_image_passthrough(self, get_test_data):
+        """Файл в пределах ограничений передаётся в анализ как есть, без декодирования; WebP принимается."""
+        contents = (Path(__file__).parent / "../src/image/4.webp").resolve().read_bytes()
+        with patch("src.api.api.analyze_food_image", new_callable=AsyncMock) as mock_analyze, \
+                patch("src.api.preprocess.preprocess_image") as decode:
+            mock_analyze.return_value = get_test_data[2]
+            response = client.post("/analyze/", files={"file": ("4.webp", contents, "image/webp")})
+
+        assert response.status_code == 200
+        decode.assert_not_called()
+        prepared = mock_analyze.await_args.args[0]
+        assert prepared.data == contents
+        assert (prepared.mime_type, prepared.size, prepared.dhash) == ("image/webp", (480, 294), None)
+        timing = response.headers["Server-Timing"]
+        assert "header;dur=" in timing and "decode;dur=" not in timing
+
+    @pytest.mark.asyncio
+    async def test_corrupted_image_not_sent(self):
+        """Обрезанный файл с верным заголовком отклоняется с 400 и не доходит до Gemini."""
+        contents = (Path(__file__).parent / "../src/image/2.jpg").resolve().read_bytes()
+        with patch("src.api.api.analyze_food_image", new_callable=AsyncMock) as mock_analyze:
+            response = client.post("/analyze/", files={"file": ("2.jpg", contents[:len(contents) // 2], "image/jpeg")})
+
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Невозможно обработать изображение"
+        mock_analyze.assert_not_awaited()
+
+    def test_oversized_image_not_decoded(self):
+        """Слишком большое изображение отклоняется с 400 по размерам из заголовка, до анализа."""
+        buf = BytesIO()
+        Image.new("L", (3000, 120)).save(buf, format="PNG")
+        with patch("src.api.api.analyze_food_image", new_callable=AsyncMock) as mock_analyze:
+            response = client.post("/analyze/", files={"file": ("wide.png", buf.getvalue(), "image/png")})
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Изображение слишком длинное или слишком широкое"
+        mock_analyze.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_rate_limit(self, get_test_data):
+        """Превышение лимита частоты → 429 с заголовком Retry-After."""
+        with patch("src.api.api.analyze_food_image", new_callable=AsyncMock) as mock_analyze, \
+                patch.object(rate_limiter, "burst", 2), patch.object(rate_limiter, "rate", 0.1), \
+                patch("src.api.limits.TRUST_CLIENT_ID", True):
+            mock_analyze.return_value = get_test_data[2]
+            statuses = [
+                client.post("/analyze/", files={"file": ("test.jpg", create_test_image(), "image/jpeg")})
+                for _ in range(3)
+            ]
+            other_device = client.post(
+                "/analyze/",
+                files={"file": ("test.jpg", create_test_image(), "image/jpeg")},
+                headers={"X-Device-Id": "phone-2"}
+            )
+
+        assert [response.status_code for response in statuses] == [200, 200, 429]
+        assert statuses[2].json()["detail"] == "Слишком много запросов"
+        assert int(statuses[2].headers["Retry-After"]) >= 1
+        assert other_device.status_code == 200
+
+    @pytest.mark.asyncio
+    async def test_queue_full(self, get_test_data):
+        """Переполненная очередь анализа → 429."""
+        from src.api.limits import QueueFull
+
+        img_buf = create_test_image()
+        with patch("src.api.api.analyze_scheduler") as mock_scheduler:
+            mock_scheduler.slot.side_effect = QueueFull(retry_after=1.0)
+            response = client.post("/analyze/", files={"file": ("test.jpg", img_buf, "image/jpeg")})
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "1"
+
+    @pytest.mark.asyncio
+    async def test_error_not_cached(self, get_test_data):
+        """Ошибки анализа не кешируются."""
+        with patch("src.api.api.analyze_food_image", new_callable=AsyncMock) as mock_analyze:
+            mock_analyze.return_value = get_test_data[4]
+            for _ in range(2):
+                response = client.post("/analyze/", files={"file": ("test.jpg", create_test_image(), "image/jpeg")})
+                assert response.status_code == 400
+        assert mock_analyze.await_count == 2
+
+
+@pytest.mark.usefixtures("clear_analyze_state")
+class TestAnalyzeBatchEndpoint:
+    """Тестирование эндпоинта /analyze/batch"""
+
+    @staticmethod
+    def create_gradient_image(size: tuple) -> BytesIO:
+        """Изображение с градиентом: dHash отличается от однотонного, кеш похожих не срабатывает"""
+        img = Image.linear_gradient("L").rotate(-90).resize(size).convert("RGB")
+        buf = BytesIO()
+        img.save(buf, format="PNG")
+        buf.seek(0)
+        return buf
+
+    @pytest.mark.asyncio
+    async def test_batch(self):
+        """Результаты возвращаются в порядке файлов, ошибки — на месте своего файла."""
+        results = {
+            (120, 120): {"status": "not_found", "message": "Нет еды"},
+            (150, 150): {"status": "error", "message": "Ограничение лимита"},
+        }
+        files = [
+            ("files", ("a.jpg", create_test_image(size=(120, 120), color=(255, 0, 0)), "image/jpeg")),
+            ("files", ("b.txt", b"text", "text/plain")),
+            ("files", ("c.png", self.create_gradient_image((150, 150)), "image/png")),
+        ]
+        with patch("src.api.api.analyze_food_image", new_callable=AsyncMock) as mock_analyze:
+            mock_analyze.side_effect = lambda image, deadline=None: results[image.size]
+            response = client.post("/analyze/batch", files=files)
+
+        assert response.status_code == 200
+        data = response.json()["results"]
+        assert [item["status"] for item in data] == ["not_found", "error", "error"]
+        assert data[1]["message"] == "Поддерживаются только JPEG, PNG и WebP"
+        assert data[2]["message"] == "Ограничение лимита"
+        assert mock_analyze.await_count == 2
+
+    @pytest.mark.asyncio
+    async def test_batch_parallel(self):
+        """Изображения пакета анализируются одновременно."""
+        state = {"active": 0, "max": 0}
+
+        async def analyze(image, deadline=None):
+            state["active"] += 1
+            state["max"] = max(state["max"], state["active"])
+            await asyncio.sleep(0.05)
+            state["active"] -= 1
+            return {"status": "not_found", "message": "Нет еды"}
+
+        colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0)]
+        files = [("files", (f"{i}.jpg", create_test_image(color=color), "image/jpeg")) for i, color in enumerate(colors)]
+        with patch("src.api.api.analyze_food_image", side_effect=analyze):
+            response = client.post("/analyze/batch", files=files)
+
+        assert response.status_code == 200
+        assert len(response.json()["results"]) == 4
+        assert state["max"] > 1
+
+    def test_batch_waits_for_slots(self):
+        """Изображения принятого пакета ждут слот анализа, а не упираются в лимит очереди клиента."""
+        async def analyze(image, deadline=None):
+            await asyncio.sleep(0.02)
+            return {"status": "not_found", "message": "Нет еды"}
+
+        files = [
+            ("files", (f"{i}.jpg", create_test_image(color=(i * 30, 100, 30)), "image/jpeg")) for i in range(8)
+        ]
+        scheduler = FairScheduler(capacity=1, max_queue=2, max_queue_per_client=1)
+        with patch("src.api.api.analyze_food_image", side_effect=analyze), \
+                patch("src.api.api.analyze_scheduler", scheduler):
+            response = client.post("/analyze/batch", files=files)
+
+        assert response.status_code == 200
+        assert [item["status"] for item in response.json()["results"]] == ["not_found"] * 8
+        assert scheduler.stats() == {"active": 0, "queued": 0, "capacity": 1}
+
+    @pytest.mark.asyncio
+    async def test_batch_too_many_files(self):
+        files = [("files", (f"{i}.jpg", b"x", "image/jpeg")) for i in range(11)]
+        response = client.post("/analyze/batch", files=files)
+        assert response.status_code == 400
+        assert "Не более 10 изображений" in response.json()["detail"]
+
+
+@pytest.mark.usefixtures("clear_analyze_state")
+class TestAnalyzeStreamEndpoint:
+    """Тестирование потокового эндпоинта /analyze/stream"""
+
+    ITEM = {"proteins": 1.5, "fats": 0.3, "carbohydrates": 22.8, "water": 74.0, "weight": 120, "benefit_score": 4.0}
+
+    @staticmethod
+    def events(response) -> list:
+        """Разбирает поток text/event-stream в список (событие, данные)"""
+        result = []
+        for block in response.text.strip().split("\n\n"):
+            lines = dict(line.split(": ", 1) for line in block.splitlines())
+            result.append((lines["event"], json.loads(lines["data"])))
+        return result
+
+    def stream(self, *parts):
+        async def analyze(image, deadline=None):
+            for part in parts:
+                yield part
+        return patch("src.api.api.analyze_food_image_stream", side_effect=analyze)
+
+    def test_items_then_result(self):
+        """Продукты приходят отдельными событиями, затем итоговый ответ; он же попадает в кеш"""
+        result = FoodSuccessResponse(food_items={"Банан": FoodItem(**self.ITEM)})
+        with self.stream(("Банан", FoodItem(**self.ITEM)), result):
+            response = client.post("/analyze/stream", files={"file": ("a.jpg", create_test_image(), "image/jpeg")})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert self.events(response) == [
+            ("item", {"name": "Банан", "item": self.ITEM}),
+            ("result", {"status": "success", "food_items": {"Банан": self.ITEM}}),
+        ]
+
+        with self.stream() as mock_stream:
+            cached = client.post("/analyze/stream", files={"file": ("a.jpg", create_test_image(), "image/jpeg")})
+        assert self.events(cached) == [("result", {"status": "success", "food_items": {"Банан": self.ITEM}})]
+        mock_stream.assert_not_called()
+
+    def test_error_event(self):
+        """Ошибка анализа приходит событием error с кодом, как у /analyze/"""
+        with self.stream(ErrorResponse(message="Ограничение лимита")):
+            response = client.post("/analyze/stream", files={"file": ("a.jpg", create_test_image(), "image/jpeg")})
+        assert self.events(response) == [("error", {"status_code": 400, "message": "Ограничение лимита"})]
+        assert len(image_result_cache) == 0
+
+    def test_deadline_event(self):
+        """Анализ, прерванный по сроку запроса, приходит событием error с кодом 408"""
+        async def expired_analyze(image, deadline=None):
+            time.sleep(0.3)
+            yield ErrorResponse(message="Ошибка при анализе изображения")
+
+        with patch("src.api.api.analyze_food_image_stream", side_effect=expired_analyze):
+            response = client.post(
+                "/analyze/stream",
+                files={"file": ("a.jpg", create_test_image(), "image/jpeg")},
+                headers={"X-Request-Timeout": "0.2"}
+            )
+        assert self.events(response) == [
+            ("error", {"status_code": 408, "message": "Анализ изображения превысил лимит времени"})
+        ]
+
+    def test_queue_deadline(self):
+        """Ожидание слота в очереди ограничено сроком запроса"""
+        with patch("src.api.api.analyze_scheduler", FairScheduler(capacity=0)), self.stream() as mock_stream:
+            started = time.perf_counter()
+            response = client.post(
+                "/analyze/stream",
+                files={"file": ("a.jpg", create_test_image(), "image/jpeg")},
+                headers={"X-Request-Timeout": "0.2"}
+            )
+        assert time.perf_counter() - started < 2
+        assert self.events(response) == [
+            ("error", {"status_code": 408, "message": "Анализ изображения превысил лимит времени"})
+        ]
+        mock_stream.assert_not_called()
+
+    def test_invalid_file(self):
+        """Неверный файл отклоняется до начала потока"""
+        response = client.post("/analyze/stream", files={"file": ("a.txt", b"text", "text/plain")})
+        assert response.status_code == 400
+
+
+@pytest.mark.usefixtures("clear_analyze_state")
+class TestAnalyzeJobs:
+    """Тестирование фонового режима /analyze/jobs"""
+
+    @staticmethod
+    def image_file() -> tuple:
+        return "test.jpg", create_test_image(), "image/jpeg"
+
+    def test_submit_and_poll(self):
+        """Задача принимается сразу, результат доступен по идентификатору."""
+        result = {"status": "not_found", "message": "Нет еды"}
+        with patch("src.api.api.analyze_food_image", new_callable=AsyncMock) as mock_analyze, \
+                TestClient(app) as lifespan_client:
+            mock_analyze.return_value = result
+            response = lifespan_client.post("/analyze/jobs", files={"file": self.image_file()})
+            assert response.status_code == 202
+            job_id = response.json()["job_id"]
+            assert response.json()["status"] in ("queued", "running", "done")
+
+            for _ in range(100):
+                data = lifespan_client.get(f"/analyze/jobs/{job_id}").json()
+                if data["status"] == "done":
+                    break
+                time.sleep(0.01)
+            assert data == {"job_id": job_id, "status": "done", "result": result}
+
+    def test_jobs_wait_for_slot(self):
+        """Задачи одного клиента ждут слот анализа, а не упираются в лимит его очереди."""
+        async def slow_analyze(image, deadline=None):
+            await asyncio.sleep(0.2)
+            return {"status": "not_found", "message": "Нет еды"}
+
+        def image_file(number: int) -> tuple:
+            buf = BytesIO()
+            Image.new("RGB", (120, 120), color=(number * 40, 100, 30)).save(buf, format="JPEG")
+            return f"{number}.jpg", buf.getvalue(), "image/jpeg"
+
+        scheduler = FairScheduler(capacity=1, max_queue=2, max_queue_per_client=1)
+        with patch("src.api.api.analyze_food_image", side_effect=slow_analyze), \
+                patch("src.api.api.analyze_scheduler", scheduler), TestClient(app) as lifespan_client:
+            job_ids = [
+                lifespan_client.post("/analyze/jobs", files={"file": image_file(number)}).json()["job_id"]
+                for number in range(4)
+            ]
+            results = [json.loads(lifespan_client.get(f"/analyze/jobs/{job_id}/events").text.strip()
+                                  .rsplit("data: ", 1)[1])["result"] for job_id in job_ids]
+        assert all(result["status"] == "not_found" for result in results)
+
+    def test_events(self):
+        """Поток событий отдаёт состояние, затем результат."""
+        async def slow_analyze(image, deadline=None):
+            await asyncio.sleep(0.05)
+            return {"status": "not_found", "message": "Нет еды"}
+
+        with patch("src.api.api.analyze_food_image", side_effect=slow_analyze), TestClient(app) as lifespan_client:
+            job_id = lifespan_client.post("/analyze/jobs", files={"file": self.image_file()}).json()["job_id"]
+            response = lifespan_client.get(f"/analyze/jobs/{job_id}/events")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [block for block in response.text.split("\n\n") if block.startswith("event:")]
+        assert events[0].startswith("event: status")
+        assert events[-1].startswith("event: result")
+        payload = json.loads(events[-1].split("data: ", 1)[1])
+        assert payload["status"] == "done"
+        assert payload["result"]["status"] == "not_found"
+
+    def test_job_error(self):
+        """Ошибка анализа возвращается как результат задачи."""
+        with patch("src.api.api.analyze_food_image", new_callable=AsyncMock) as mock_analyze, \
+                TestClient(app) as lifespan_client:
+            mock_analyze.return_value = {"status": "error", "message": "Ограничение лимита"}
+            job_id = lifespan_client.post("/analyze/jobs", files={"file": self.image_file()}).json()["job_id"]
+            response = lifespan_client.get(f"/analyze/jobs/{job_id}/events")
+        payload = json.loads(response.text.strip().rsplit("data: ", 1)[1])
+        assert payload["result"] == {"status": "error", "message": "Ограничение лимита"}
+
+    def test_invalid_upload(self):
+        """Некорректный файл отклоняется сразу, без постановки в очередь."""
+        response = client.post("/analyze/jobs", files={"file": ("a.txt", b"text", "text/plain")})
+        assert response.status_code == 400
+
+    def test_unknown_job(self):
+        assert client.get("/analyze/jobs/unknown").status_code == 404
+        assert client.get("/analyze/jobs/unknown/events").status_code == 404
+
+
 class TestSearchEndpoint:
     """Тестирование эндпоинта /search/"""
 
+    @pytest.fixture(autouse=True)
+    def clear_search_cache(self):
+        """Каждый тест начинается с пустого кеша поиска"""
+        search_cache.clear()
+        yield
+        search_cache.clear()
+
     @pytest.mark.asyncio
     async def test_search_existing_food(self):
         """Проверяет поиск существующего продукта (например, 'яблоко')."""
@@ -310,32 +815,338 @@ class TestSearchEndpoint:
             assert "message" in data
 
 
+    @pytest.mark.asyncio
+    async def test_search_client_deadline(self):
+        """Бюджет клиента ограничивает ожидание ответа, но не общий запрос к источнику."""
+        budgets = []
+
+        async def slow(name, deadline=None):
+            budgets.append(deadline.budget)
+            await asyncio.sleep(5)
+
+        with patch("src.api.api.analyze_food_json", side_effect=slow):
+            started = time.perf_counter()
+            response = client.get("/search/", params={"food_name": "вишня"}, headers={"X-Request-Timeout": "0.1"})
+        assert response.json()["status"] == "error"
+        assert time.perf_counter() - started < 2
+        assert budgets == [SEARCH_DEADLINE]
+
+    @pytest.mark.asyncio
+    async def test_shared_fetch_outlives_short_deadline(self):
+        """Короткий срок первого клиента не прерывает общий запрос: второй клиент получает результат."""
+        nutrition = {"calories": 47.0, "proteins": 0.4, "fats": 0.4, "carbohydrates": 9.8, "weight": 100.0}
+
+        async def slow(name, deadline=None):
+            await deadline.run(asyncio.sleep(0.3))
+            return nutrition
+
+        transport = httpx.ASGITransport(app=app)
+        with patch("src.api.api.analyze_food_json", side_effect=slow) as mock_analyze:
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+                short = async_client.get("/search/", params={"food_name": "вишня"},
+                                         headers={"X-Request-Timeout": "0.1"})
+                patient = async_client.get("/search/", params={"food_name": "Вишня"})
+                short, patient = await asyncio.gather(short, patient)
+        assert short.json()["status"] == "error"
+        assert patient.json()["status"] == "success"
+        assert patient.json()["nutrition"] == nutrition
+        assert mock_analyze.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_search_upstream_timeout(self):
+        """Таймаут фазы HTTP-запроса к источнику → ответ со статусом error."""
+        with patch("src.api.api.analyze_food_json", new_callable=AsyncMock) as mock_analyze:
+            mock_analyze.side_effect = httpx.ReadTimeout("read timeout")
+            response = client.get("/search/", params={"food_name": "яблоко"})
+            assert response.status_code == 200
+            assert response.json()["status"] == "error"
+
+
+    @pytest.mark.asyncio
+    async def test_search_cached(self):
+        """Повторный запрос с тем же набором слов отдаётся из кеша."""
+        nutrition = {"calories": 47.0, "proteins": 0.4, "fats": 0.4, "carbohydrates": 9.8, "weight": 100.0}
+        with patch("src.api.api.analyze_food_json", new_callable=AsyncMock) as mock_analyze:
+            mock_analyze.return_value = nutrition
+            first = client.get("/search/", params={"food_name": "Яблоко зелёное"})
+            second = client.get("/search/", params={"food_name": "зелёное  яблоко"})
+        assert first.json()["nutrition"] == second.json()["nutrition"] == nutrition
+        assert second.json()["food_name"] == "зелёное  яблоко"
+        mock_analyze.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_search_fuzzy_match(self):
+        """Найденное название, оценка и альтернативы передаются в ответе."""
+        nutrition = {"calories": 110.0, "proteins": 4.2, "fats": 1.1, "carbohydrates": 21.3, "weight": 100.0}
+        result = {**nutrition, "matched_name": "Гречка отварная", "score": 0.74, "alternatives": [
+            {"food_name": "Гречка", "score": 0.62, "nutrition": nutrition}
+        ]}
+        with patch("src.api.api.analyze_food_json", new_callable=AsyncMock) as mock_analyze:
+            mock_analyze.return_value = result
+            data = client.get("/search/", params={"food_name": "гречка варёная"}).json()
+        assert data["food_name"] == "гречка варёная"
+        assert data["matched_name"] == "Гречка отварная" and data["score"] == 0.74
+        assert data["nutrition"] == nutrition
+        assert data["alternatives"] == [{"food_name": "Гречка", "score": 0.62, "nutrition": nutrition}]
+
+    def test_upstream_error_not_cached(self):
+        """Ответ 5xx источника — ошибка, а не "не найдено", и не кешируется."""
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(503)))
+        with patch("src.api.analyze.get_http_client", return_value=http_client), \
+                patch("src.api.analyze.fetch_foods", wraps=fetch_foods) as mock_fetch:
+            for _ in range(2):
+                assert client.get("/search/", params={"food_name": "бррр"}).json()["status"] == "error"
+        assert mock_fetch.await_count == 2
+        assert search_cache.peek("бррр") == (None, False)
+
+    @pytest.mark.asyncio
+    async def test_search_not_found_cached(self):
+        """Результат "не найдено" тоже кешируется."""
+        with patch("src.api.api.analyze_food_json", new_callable=AsyncMock) as mock_analyze:
+            mock_analyze.return_value = False
+            for _ in range(3):
+                assert client.get("/search/", params={"food_name": "бррр"}).json()["status"] == "not_found"
+        mock_analyze.assert_awaited_once()
+
+
+class TestSearchBatchEndpoint:
+    """Тестирование эндпоинта /search/batch"""
+
+    NUTRITION = {"calories": 47.0, "proteins": 0.4, "fats": 0.4, "carbohydrates": 9.8, "weight": 100.0}
+
+    @pytest.fixture(autouse=True)
+    def clear_search_cache(self):
+        search_cache.clear()
+        yield
+        search_cache.clear()
+
+    def test_results_in_order(self):
+        """Одинаковые после нормализации названия ищутся один раз, ответ — по каждому названию"""
+        async def analyze(name, deadline=None):
+            return False if name == "бррр" else self.NUTRITION
+
+        with patch("src.api.api.analyze_food_json", new_callable=AsyncMock) as mock_analyze:
+            mock_analyze.side_effect = analyze
+            response = client.post("/search/batch", json={"food_names": ["Яблоко", "бррр", "яблоко ", "Груша"]})
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [item["status"] for item in results] == ["success", "not_found", "success", "success"]
+        assert [results[0]["food_name"], results[2]["food_name"]] == ["Яблоко", "яблоко "]
+        assert results[0]["nutrition"] == self.NUTRITION
+        assert sorted(call.args[0] for call in mock_analyze.await_args_list) == ["Груша", "Яблоко", "бррр"]
+
+    def test_upstream_error_per_name(self):
+        """Ошибка соединения с источником по одному названию не мешает остальным"""
+        async def analyze(name, deadline=None):
+            if name == "груша":
+                raise httpx.ConnectError("connection refused")
+            return self.NUTRITION
+
+        with patch("src.api.api.analyze_food_json", side_effect=analyze):
+            response = client.post("/search/batch", json={"food_names": ["яблоко", "груша", "слива"]})
+        assert response.status_code == 200
+        assert [item["status"] for item in response.json()["results"]] == ["success", "error", "success"]
+
+    def test_cached_names_not_fetched(self):
+        with patch("src.api.api.analyze_food_json", new_callable=AsyncMock) as mock_analyze:
+            mock_analyze.return_value = self.NUTRITION
+            client.get("/search/", params={"food_name": "яблоко"})
+            client.post("/search/batch", json={"food_names": ["Яблоко", "груша"]})
+        assert [call.args[0] for call in mock_analyze.await_args_list] == ["яблоко", "груша"]
+
+    def test_bounded_concurrency(self):
+        """Запросы к источнику идут параллельно, но не больше SEARCH_BATCH_CONCURRENCY"""
+        active, peak = 0, 0
+
+        async def analyze(name, deadline=None):
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.1)
+            active -= 1
+            return self.NUTRITION
+
+        names = [f"продукт {number}" for number in range(6)]
+        with patch("src.api.api.SEARCH_BATCH_CONCURRENCY", 3), \
+                patch("src.api.api.analyze_food_json", new_callable=AsyncMock) as mock_analyze:
+            mock_analyze.side_effect = analyze
+            started = time.perf_counter()
+            results = client.post("/search/batch", json={"food_names": names}).json()["results"]
+            elapsed = time.perf_counter() - started
+        assert all(item["status"] == "success" for item in results)
+        assert peak == 3
+        assert elapsed < 0.5
+
+    def test_upstream_timeout_per_name(self):
+        """Ошибка одного названия не мешает остальным"""
+        async def analyze(name, deadline=None):
+            if name == "вода":
+                raise httpx.ReadTimeout("timeout")
+            return self.NUTRITION
+
+        with patch("src.api.api.analyze_food_json", new_callable=AsyncMock) as mock_analyze:
+            mock_analyze.side_effect = analyze
+            results = client.post("/search/batch", json={"food_names": ["вода", "яблоко"]}).json()["results"]
+        assert [item["status"] for item in results] == ["error", "success"]
+
+    @pytest.mark.parametrize("body", [{}, {"food_names": []}, {"food_names": [""]}, {"food_names": ["яблоко"] * 51}])
+    def test_invalid_body(self, body):
+        assert client.post("/search/batch", json=body).status_code == 422
+
+
+class TestSuggestEndpoint:
+    """Тестирование эндпоинта /search/suggest"""
+
+    @pytest.fixture(autouse=True)
+    def clear_suggestions(self):
+        search_cache.clear()
+        suggest_index.clear()
+        yield
+        search_cache.clear()
+        suggest_index.clear()
+
+    def test_suggest(self):
+        """Подсказки по началу слова с КБЖУ и заголовком кеширования"""
+        nutrition = {"calories": 110.0, "proteins": 4.2, "fats": 1.1, "carbohydrates": 21.3, "weight": 100.0}
+        suggest_index.add_many([("Гречка отварная", nutrition), ("Гранат", None)])
+        response = client.get("/search/suggest", params={"prefix": "гр", "limit": 5})
+        assert response.status_code == 200
+        assert response.headers["cache-control"] == "max-age=60"
+        assert response.json() == {"prefix": "гр", "suggestions": [
+            {"food_name": "Гранат", "nutrition": None},
+            {"food_name": "Гречка отварная", "nutrition": nutrition}
+        ]}
+
+    def test_search_hit_raises_suggestion(self):
+        """Успешный поиск поднимает найденное название в подсказках"""
+        nutrition = {"calories": 110.0, "proteins": 4.2, "fats": 1.1, "carbohydrates": 21.3, "weight": 100.0}
+        suggest_index.add_many([("Гранат", None), ("Гречка отварная", None)])
+        with patch("src.api.api.analyze_food_json", new_callable=AsyncMock) as mock_analyze:
+            mock_analyze.return_value = {**nutrition, "matched_name": "Гречка отварная", "score": 0.74}
+            client.get("/search/", params={"food_name": "гречка варёная"})
+        data = client.get("/search/suggest", params={"prefix": "гр"}).json()
+        assert data["suggestions"][0] == {"food_name": "Гречка отварная", "nutrition": nutrition}
+
+    def test_search_variant_not_duplicated(self):
+        """Запрос без matched_name с другим порядком слов поднимает известное название, а не добавляет дубль"""
+        nutrition = {"calories": 110.0, "proteins": 4.2, "fats": 1.1, "carbohydrates": 21.3, "weight": 100.0}
+        suggest_index.add_many([("Гранат", None), ("Гречка отварная", None)])
+        with patch("src.api.api.analyze_food_json", new_callable=AsyncMock) as mock_analyze:
+            mock_analyze.return_value = nutrition
+            client.get("/search/", params={"food_name": "отварная гречка"})
+        assert len(suggest_index) == 2
+        data = client.get("/search/suggest", params={"prefix": "гр"}).json()
+        assert data["suggestions"][0] == {"food_name": "Гречка отварная", "nutrition": nutrition}
+
+    @pytest.mark.parametrize("params", [{}, {"prefix": ""}, {"prefix": "гр", "limit": 0}, {"prefix": "гр", "limit": 100}])
+    def test_invalid_params(self, params):
+        assert client.get("/search/suggest", params=params).status_code == 422
+
+
+class TestAdminEndpoints:
+    """Тестирование служебных эндпоинтов"""
+
+    def test_models_state(self):
+        """Состояние моделей и очереди анализа"""
+        response = client.get("/admin/models")
+        assert response.status_code == 200
+        data = response.json()
+        assert isinstance(data["models"], list)
+        assert {"active", "queued", "capacity"} <= data["analyze_queue"].keys()
+        for model in data["models"]:
+            assert {"name", "available", "latency_ewma", "error_rate", "quota_exhausted_for"} <= model.keys()
+
+    def test_admin_token(self):
+        """С заданным ADMIN_TOKEN без токена доступ запрещён"""
+        with patch("src.api.api.ADMIN_TOKEN", "secret"):
+            assert client.get("/admin/models").status_code == 403
+            assert client.get("/admin/models", headers={"X-Admin-Token": "secret"}).status_code == 200
+
+
+@pytest.mark.usefixtures("clear_analyze_state")
+class TestMetricsEndpoint:
+    """Тестирование эндпоинта /metrics"""
+
+    def test_stage_metrics_after_analyze(self):
+        """После анализа в метриках есть этапы, статус и длительность маршрута"""
+        result = {"status": "not_found", "message": "Нет еды"}
+        with patch("src.api.api.analyze_food_image", new_callable=AsyncMock, return_value=result):
+            response = client.post("/analyze/", files={"file": ("a.jpg", create_test_image(), "image/jpeg")})
+        assert response.status_code == 200
+
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        text = response.text
+        for stage in ("read", "header", "preprocess", "queue", "analyze", "validate"):
+            assert f'food_api_stage_duration_seconds_count{{endpoint="analyze",stage="{stage}"}}' in text
+        assert 'food_api_analyze_results_total{status="not_found"}' in text
+        assert 'food_api_http_request_duration_seconds_count{method="POST",route="/analyze/",status="200"}' in text
+        assert 'food_api_in_flight{operation="analyze"} 0' in text
+
+    def test_route_template_label(self):
+        """В метке маршрута шаблон пути, а не идентификатор задачи"""
+        client.get("/analyze/jobs/unknown-id")
+        text = client.get("/metrics").text
+        assert 'route="/analyze/jobs/{job_id}",status="404"' in text
+        assert "unknown-id" not in text
+
+    def test_admin_token(self):
+        """С заданным ADMIN_TOKEN метрики доступны только с токеном"""
+        with patch("src.api.api.ADMIN_TOKEN", "secret"):
+            assert client.get("/metrics").status_code == 403
+            assert client.get("/metrics", headers={"X-Admin-Token": "secret"}).status_code == 200
+
+
+
 class TestLoggingMiddleware:
     """Тестирование логирования"""
 
+    @staticmethod
+    def access_calls(mock_logger) -> list:
+        return [call for call in mock_logger.log.call_args_list if call[0][1] == "Outgoing response"]
+
     @pytest.mark.asyncio
     async def test_successful_request_logging(self):
-        """Проверяет логирование успешного запроса."""
+        """Проверяет логирование успешного запроса: одна запись с полями запроса."""
         with patch("src.api.api.logger") as mock_logger:
             response = client.get("/health")
             assert response.status_code == 200
 
-            mock_logger.info.assert_any_call(
-                "Incoming request | Method: GET | URL: /health | Client: testclient"
-            )
+            calls = self.access_calls(mock_logger)
+            assert len(calls) == 1
+            level, _ = calls[0][0]
+            fields = calls[0][1]["extra"]
+            assert level == logging.INFO
+            assert fields["status"] == 200
+            assert fields["method"] == "GET"
+            assert fields["path"] == "/health"
+            assert fields["client"] == "testclient"
+            assert fields["duration_ms"] >= 0
+            mock_logger.info.assert_not_called()
 
-            # Проверка исходящего лога
-            outgoing_calls = [
-                call for call in mock_logger.info.call_args_list
-                if call[0][0].startswith("Outgoing response")
-            ]
-            assert len(outgoing_calls) == 1
-            log_msg = outgoing_calls[0][0][0]
-            assert "Status: 200" in log_msg
-            assert "Method: GET" in log_msg
-            assert "URL: /health" in log_msg
-            assert "Duration:" in log_msg
-            assert "Client: testclient" in log_msg
+    def test_request_id_header(self):
+        """Идентификатор запроса из заголовка возвращается, некорректный заменяется"""
+        response = client.get("/health", headers={"X-Request-ID": "abc-123"})
+        assert response.headers["X-Request-ID"] == "abc-123"
+
+        response = client.get("/health", headers={"X-Request-ID": "bad id\u0000"})
+        request_id = response.headers["X-Request-ID"]
+        assert request_id != "bad id\u0000"
+        assert len(request_id) == 32
+
+        assert client.get("/health").headers["X-Request-ID"] != request_id
+
+    def test_access_log_sampling(self):
+        """Успешные запросы отбираются по доле, ошибки логируются всегда"""
+        with patch("src.api.api.LOG_ACCESS_SAMPLE_RATE", 0.0), patch("src.api.api.logger") as mock_logger:
+            client.get("/health")
+            assert self.access_calls(mock_logger) == []
+
+            client.get("/nonexistent")
+            calls = self.access_calls(mock_logger)
+            assert len(calls) == 1
+            assert calls[0][1]["extra"]["status"] == 404
 
     @pytest.mark.asyncio
     async def test_middleware_logs_exception_when_call_next_fails(self):
@@ -358,10 +1169,10 @@ class TestLoggingMiddleware:
             with pytest.raises(ValueError, match="Ошибка внутри call_next"):
                 await log_requests(request, failing_call_next)
             mock_logger.error.assert_called_once()
-            log_msg = mock_logger.error.call_args[0][0]
-            assert "Request failed" in log_msg
-            assert "Method: GET" in log_msg
-            assert "URL: /test" in log_msg
-            assert "Client: 127.0.0.1" in log_msg
-            assert "Ошибка внутри call_next" in log_msg
-            assert "Duration:" in log_msg
+            args, kwargs = mock_logger.error.call_args
+            assert (args[0] % args[1:]).startswith("Request failed: Ошибка внутри call_next")
+            fields = kwargs["extra"]
+            assert fields["method"] == "GET"
+            assert fields["path"] == "/test"
+            assert fields["client"] == "127.0.0.1"
+            assert "duration_ms" in fields
@@ -0,0 +1,108 @@
+from fastapi.testclient import TestClient
+import random
+import pytest
+import httpx
+import json
+
+from bench.fakes import Latency, create_gemini_app, create_health_diet_app, fake_foods, SUCCESS_ANSWER
+from bench.run import percentile, summarize, compare, outcome_of
+from src.api.nutrition_db import parse_food_info
+from src.api.cache import normalize_query
+
+GENERATE_URL = "/v1beta/models/gemini-2.5-flash:generateContent"
+
+
+class TestFakeGemini:
+    """Тестирование заглушки Gemini"""
+
+    def test_success(self):
+        """Ответ в формате generateContent с JSON анализа"""
+        client = TestClient(create_gemini_app(seed=1))
+        response = client.post(GENERATE_URL, json={})
+        assert response.status_code == 200
+        text = response.json()["candidates"][0]["content"]["parts"][0]["text"]
+        assert json.loads(text) == SUCCESS_ANSWER
+
+    def test_quota(self):
+        """При доле 429, равной 1, все ответы RESOURCE_EXHAUSTED"""
+        client = TestClient(create_gemini_app(quota_rate=1.0))
+        response = client.post(GENERATE_URL, json={})
+        assert response.status_code == 429
+        assert response.json()["error"]["status"] == "RESOURCE_EXHAUSTED"
+
+    def test_malformed(self):
+        """Битый ответ не разбирается как JSON"""
+        client = TestClient(create_gemini_app(malformed_rate=1.0))
+        text = client.post(GENERATE_URL, json={}).json()["candidates"][0]["content"]["parts"][0]["text"]
+        with pytest.raises(ValueError):
+            json.loads(text)
+
+    def test_stream(self):
+        """Потоковый ответ: события SSE с частями текста, вместе дающими JSON анализа"""
+        client = TestClient(create_gemini_app(stream_parts=3))
+        response = client.post("/v1beta/models/gemini-2.5-flash:streamGenerateContent?alt=sse", json={})
+        assert response.status_code == 200
+        chunks = [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+        assert len(chunks) == 3
+        text = "".join(chunk["candidates"][0]["content"]["parts"][0]["text"] for chunk in chunks)
+        assert json.loads(text) == SUCCESS_ANSWER
+
+    def test_unknown_action(self):
+        client = TestClient(create_gemini_app())
+        assert client.post("/v1beta/models/gemini-2.5-flash:countTokens", json={}).status_code == 404
+
+    def test_latency(self):
+        """Задержка логнормальная с заданной медианой"""
+        rng = random.Random(1)
+        samples = sorted(Latency(100, 0.5).sample(rng) for _ in range(2001))
+        assert 0.08 < samples[1000] < 0.12
+        assert Latency().sample(rng) == 0.0
+
+
+class TestFakeHealthDiet:
+    """Тестирование заглушки health-diet.ru"""
+
+    def test_food_search(self):
+        """Продукты с названием запроса разбираются парсером приложения"""
+        client = TestClient(create_health_diet_app())
+        foods = client.post("/api3/Food/FoodSearch", data={"query": "яблоко"}).json()["result"]["foods"]
+        assert foods == fake_foods("яблоко")
+        matching = [food for food in foods if normalize_query(food["name"]) == "яблоко"]
+        assert len(matching) == 5
+        assert parse_food_info(matching[0]["info"])["calories"] > 0
+
+    def test_not_found(self):
+        client = TestClient(create_health_diet_app(not_found_rate=1.0))
+        assert client.post("/api3/Food/FoodSearch", data={"query": "яблоко"}).json() == {"result": {"foods": []}}
+
+
+class TestReport:
+    """Тестирование отчёта нагрузочного теста"""
+
+    def test_percentile(self):
+        values = [float(v) for v in range(1, 101)]
+        assert percentile(values, 50) == 50.5
+        assert percentile(values, 99) == 99.01
+        assert percentile([], 95) == 0.0
+
+    def test_summarize(self):
+        """Пропускная способность, перцентили и доля ошибок"""
+        samples = [(0.1, "200:success")] * 8 + [(0.5, "400"), (1.0, "200:error")]
+        result = summarize(samples, 2.0)
+        assert result["requests"] == 10
+        assert result["throughput_rps"] == 5.0
+        assert result["error_rate"] == 0.2
+        assert result["latency_ms"]["p50"] == 100.0
+        assert result["latency_ms"]["max"] == 1000.0
+        assert result["outcomes"] == {"200:error": 1, "200:success": 8, "400": 1}
+
+    def test_outcome(self):
+        assert outcome_of(httpx.Response(200, json={"status": "not_found"})) == "200:not_found"
+        assert outcome_of(httpx.Response(429)) == "429"
+
+    def test_compare(self):
+        """Изменение относительно прошлого запуска в процентах"""
+        before = {"results": {"search": summarize([(0.1, "200:success")] * 10, 1.0)}}
+        after = {"results": {"search": summarize([(0.2, "200:success")] * 20, 1.0)}}
+        table = compare(after, before)
+        assert "throughput_rps" in table and "+100.0%" in table
@@ -0,0 +1,192 @@
+from PIL import Image, ImageDraw
+from pathlib import Path
+from io import BytesIO
+import asyncio
+import time
+import pytest
+
+from src.api.cache import (
+    ImageResultCache, SearchCache, content_hash, perceptual_hash, hamming_distance, normalize_query
+)
+
+IMAGE_DIR = Path(__file__).parent / "../src/image"
+
+
+def recompress(image: Image.Image, quality: int) -> Image.Image:
+    """Пересжимает изображение в JPEG с заданным качеством"""
+    buf = BytesIO()
+    image.convert("RGB").save(buf, format="JPEG", quality=quality)
+    buf.seek(0)
+    return Image.open(buf)
+
+
+class TestHashes:
+    """Тестирование хешей изображений"""
+
+    def test_content_hash(self):
+        """SHA-256 зависит только от содержимого"""
+        assert content_hash(b"abc") == content_hash(b"abc")
+        assert content_hash(b"abc") != content_hash(b"abd")
+        assert len(content_hash(b"")) == 64
+
+    def test_perceptual_hash_similar(self):
+        """Пересжатое и уменьшенное фото даёт близкий dHash"""
+        with Image.open((IMAGE_DIR / "1.jpg").resolve()) as image:
+            original = perceptual_hash(image)
+            smaller = image.resize((image.width // 2, image.height // 2))
+            assert hamming_distance(original, perceptual_hash(recompress(smaller, 40))) <= 4
+
+    def test_perceptual_hash_different(self):
+        """Разные фото дают далёкие dHash"""
+        with Image.open((IMAGE_DIR / "1.jpg").resolve()) as first, \
+                Image.open((IMAGE_DIR / "2.jpg").resolve()) as second:
+            assert hamming_distance(perceptual_hash(first), perceptual_hash(second)) > 10
+
+    def test_hash_size(self):
+        """dHash умещается в 64 бита"""
+        image = Image.new("RGB", (200, 200))
+        ImageDraw.Draw(image).rectangle((0, 0, 100, 200), fill=(255, 255, 255))
+        assert 0 <= perceptual_hash(image) < 2 ** 64
+
+    @pytest.mark.parametrize("first, second, distance", [(0, 0, 0), (0b1011, 0b0001, 2), (2 ** 64 - 1, 0, 64)])
+    def test_hamming_distance(self, first, second, distance):
+        assert hamming_distance(first, second) == distance
+
+
+class TestImageResultCache:
+    """Тестирование кеша результатов анализа"""
+    RESULT = {"status": "not_found", "message": "Нет еды"}
+
+    def test_exact_hit(self):
+        cache = ImageResultCache(maxsize=10, ttl=60, max_distance=4)
+        cache.set("sha", 0b1111, self.RESULT)
+        assert cache.get("sha") == (self.RESULT, "exact")
+
+    def test_similar_hit(self):
+        """Попадание по dHash в пределах порога"""
+        cache = ImageResultCache(maxsize=10, ttl=60, max_distance=2)
+        cache.set("sha", 0b1111, self.RESULT)
+        assert cache.get("other", 0b1100) == (self.RESULT, "similar")
+        assert cache.get("other", 0b0000) == (None, None)
+
+    def test_similar_disabled(self):
+        """Отрицательный порог отключает поиск по dHash"""
+        cache = ImageResultCache(maxsize=10, ttl=60, max_distance=-1)
+        cache.set("sha", 0b1111, self.RESULT)
+        assert cache.get("other", 0b1111) == (None, None)
+
+    def test_entry_without_hash(self):
+        """Запись файла, отправленного без декодирования, находится только по точному хешу"""
+        cache = ImageResultCache(maxsize=10, ttl=60, max_distance=4)
+        cache.set("raw", None, self.RESULT)
+        assert cache.get("raw") == (self.RESULT, "exact")
+        assert cache.get("other", 0b1111) == (None, None)
+
+    def test_lru_eviction(self):
+        """При переполнении вытесняется давно не использованная запись"""
+        cache = ImageResultCache(maxsize=2, ttl=60, max_distance=0)
+        cache.set("a", 1, {"status": "a"})
+        cache.set("b", 2, {"status": "b"})
+        cache.get("a")
+        cache.set("c", 4, {"status": "c"})
+        assert cache.get("a")[0] == {"status": "a"}
+        assert cache.get("b") == (None, None)
+        assert len(cache) == 2
+
+    def test_ttl(self):
+        """Записи устаревают по времени"""
+        cache = ImageResultCache(maxsize=10, ttl=0.05, max_distance=4)
+        cache.set("sha", 1, self.RESULT)
+        time.sleep(0.1)
+        assert cache.get("sha", 1) == (None, None)
+
+
+class CountingFetch:
+    """Источник поиска, считающий обращения"""
+
+    def __init__(self, result, delay: float = 0.0, error: Exception = None):
+        self.result = result
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self, name: str):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class TestSearchCache:
+    """Тестирование кеша поиска"""
+    RESULT = {"calories": 47.0, "proteins": 0.4, "fats": 0.4, "carbohydrates": 9.8, "weight": 100.0}
+
+    @pytest.mark.parametrize("first, second", [("Яблоко", "яблоко"), ("свиной шашлык", "Шашлык  Свиной")])
+    def test_normalize_query(self, first, second):
+        assert normalize_query(first) == normalize_query(second)
+
+    @pytest.mark.asyncio
+    async def test_hit(self):
+        cache = SearchCache(maxsize=10, ttl=60, stale_ttl=60, negative_ttl=60)
+        fetch = CountingFetch(self.RESULT)
+        assert await cache.get_or_fetch("яблоко", fetch) == self.RESULT
+        assert await cache.get_or_fetch("Яблоко", fetch) == self.RESULT
+        assert fetch.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_single_flight(self):
+        """Одновременные одинаковые запросы дают один запрос к источнику"""
+        cache = SearchCache(maxsize=10, ttl=60, stale_ttl=60, negative_ttl=60)
+        fetch = CountingFetch(self.RESULT, delay=0.05)
+        results = await asyncio.gather(*(cache.get_or_fetch("яблоко", fetch) for _ in range(20)))
+        assert all(result == self.RESULT for result in results)
+        assert fetch.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_negative_ttl(self):
+        """"Не найдено" хранится в течение negative_ttl"""
+        cache = SearchCache(maxsize=10, ttl=60, stale_ttl=0, negative_ttl=0.05)
+        fetch = CountingFetch(False)
+        assert await cache.get_or_fetch("бррр", fetch) is False
+        assert await cache.get_or_fetch("бррр", fetch) is False
+        assert fetch.calls == 1
+        await asyncio.sleep(0.1)
+        await cache.get_or_fetch("бррр", fetch)
+        assert fetch.calls == 2
+
+    @pytest.mark.asyncio
+    async def test_stale_while_revalidate(self):
+        """Устаревшая запись отдаётся сразу и обновляется в фоне"""
+        cache = SearchCache(maxsize=10, ttl=0.05, stale_ttl=60, negative_ttl=0.05)
+        fetch = CountingFetch(self.RESULT)
+        await cache.get_or_fetch("яблоко", fetch)
+        await asyncio.sleep(0.1)
+        assert cache.peek("яблоко") == (self.RESULT, False)
+
+        fetch.result = {**self.RESULT, "calories": 50.0}
+        assert await cache.get_or_fetch("яблоко", fetch) == self.RESULT
+        await asyncio.sleep(0.01)
+        assert fetch.calls == 2
+        assert cache.peek("яблоко") == (fetch.result, True)
+
+    @pytest.mark.asyncio
+    async def test_error_not_cached(self):
+        """Ошибка источника передаётся всем ожидающим и не кешируется"""
+        cache = SearchCache(maxsize=10, ttl=60, stale_ttl=60, negative_ttl=60)
+        fetch = CountingFetch(self.RESULT, delay=0.01, error=RuntimeError("upstream"))
+        results = await asyncio.gather(*(cache.get_or_fetch("яблоко", fetch) for _ in range(3)),
+                                       return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert fetch.calls == 1
+        assert len(cache) == 0
+
+    @pytest.mark.asyncio
+    async def test_waiter_cancel_keeps_fetch(self):
+        """Отмена одного ожидающего не отменяет общий запрос"""
+        cache = SearchCache(maxsize=10, ttl=60, stale_ttl=60, negative_ttl=60)
+        fetch = CountingFetch(self.RESULT, delay=0.05)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(cache.get_or_fetch("яблоко", fetch), timeout=0.01)
+        assert await cache.get_or_fetch("яблоко", fetch) == self.RESULT
+        assert fetch.calls == 1
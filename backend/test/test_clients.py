@@ -0,0 +1,99 @@
+from unittest.mock import MagicMock, AsyncMock, patch
+from fastapi.testclient import TestClient
+import httpx
+import pytest
+
+from src.api import clients
+from src.api.api import app
+
+
+class TestHttpClient:
+    """Тестирование общего HTTP-клиента"""
+
+    @pytest.mark.asyncio
+    async def test_client_reused(self):
+        """Повторные обращения возвращают один и тот же клиент"""
+        first = clients.get_http_client()
+        second = clients.get_http_client()
+        assert first is second
+        await clients.close_http_client()
+
+    @pytest.mark.asyncio
+    async def test_limits_and_timeouts(self):
+        """Клиент создаётся с настроенными таймаутами по фазам"""
+        client = clients.create_http_client()
+        try:
+            assert client.timeout.connect == clients.HTTP_CONNECT_TIMEOUT
+            assert client.timeout.read == clients.HTTP_READ_TIMEOUT
+            assert client.timeout.write == clients.HTTP_WRITE_TIMEOUT
+            assert client.timeout.pool == clients.HTTP_POOL_TIMEOUT
+        finally:
+            await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_start_and_close(self):
+        """Клиент открывается и закрывается явно"""
+        client = await clients.start_http_client()
+        assert clients.get_http_client() is client
+        await clients.close_http_client()
+        assert client.is_closed
+        assert clients._http_client is None
+
+    @pytest.mark.asyncio
+    async def test_recreated_after_close(self):
+        """После закрытия клиент создаётся заново"""
+        client = await clients.start_http_client()
+        await client.aclose()
+        new_client = clients.get_http_client()
+        assert new_client is not client
+        assert isinstance(new_client, httpx.AsyncClient)
+        await clients.close_http_client()
+
+    def test_lifespan(self):
+        """Клиент живёт на протяжении lifespan приложения"""
+        with TestClient(app) as test_client:
+            assert clients._http_client is not None
+            client = clients._http_client
+            assert test_client.get("/health").status_code == 200
+        assert client.is_closed
+        assert clients._http_client is None
+
+
+class TestGeminiClients:
+    """Тестирование реестра клиентов Gemini"""
+
+    @pytest.mark.asyncio
+    async def test_client_per_key(self):
+        """На каждый API-ключ создаётся один клиент"""
+        with patch("google.genai.Client", side_effect=lambda api_key: MagicMock(api_key=api_key)) as factory:
+            first = clients.get_gemini_client("key-1")
+            assert clients.get_gemini_client("key-1") is first
+            other = clients.get_gemini_client("key-2")
+            assert other is not first
+            assert factory.call_count == 2
+            clients._gemini_clients.clear()
+
+    def test_invalid_key(self):
+        """Ошибка создания клиента пробрасывается и не кешируется"""
+        with pytest.raises(ValueError):
+            clients.get_gemini_client("")
+        assert "" not in clients._gemini_clients
+
+    @pytest.mark.asyncio
+    async def test_start_and_close(self):
+        """Клиенты создаются при старте и закрываются при остановке"""
+        client = MagicMock()
+        client.aio.aclose = AsyncMock()
+
+        def factory(api_key: str) -> MagicMock:
+            if not api_key:
+                raise ValueError("Missing key")
+            return client
+
+        with patch("google.genai.Client", side_effect=factory):
+            await clients.start_gemini_clients(["key", ""])
+            assert clients.get_gemini_client("key") is client
+            await clients.close_gemini_clients()
+        client.aio.aclose.assert_awaited_once()
+        client.close.assert_called_once()
+        assert clients._gemini_clients == {}
@@ -0,0 +1,52 @@
+import asyncio
+import pytest
+
+from src.api.deadline import Deadline
+
+
+class TestDeadline:
+    """Тестирование бюджета времени запроса"""
+
+    @pytest.mark.parametrize("value, budget", [
+        (None, 15.0), ("", 15.0), ("2.5", 2.5), ("60", 15.0), ("abc", 15.0), ("-1", 15.0), ("0", 15.0), ("nan", 15.0),
+    ])
+    def test_from_header(self, value, budget):
+        """Клиент может только сократить бюджет; некорректное значение игнорируется"""
+        assert Deadline.from_header(value, 15.0).budget == budget
+
+    def test_remaining(self):
+        deadline = Deadline(10.0)
+        assert 9.9 < deadline.remaining() <= 10.0
+        assert not deadline.expired
+        assert Deadline(0.0).expired and Deadline(0.0).remaining() == 0.0
+
+    def test_limit(self):
+        """Срок этапа не выходит за срок запроса"""
+        deadline = Deadline(10.0)
+        assert deadline.limit(1.0).budget == 1.0
+        assert 9.9 < deadline.limit(60.0).budget <= 10.0
+
+    def test_limit_capped(self):
+        """capped — срок этапа короче общего срока запроса"""
+        deadline = Deadline(10.0)
+        assert deadline.limit(1.0).capped
+        assert not deadline.limit(60.0).capped
+        assert not deadline.capped
+        assert deadline.limit(60.0).expires_at == deadline.expires_at
+
+    @pytest.mark.asyncio
+    async def test_run_cancels(self):
+        """По истечении срока ожидание прерывается, а сама операция отменяется"""
+        cancelled = asyncio.Event()
+
+        async def slow():
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        with pytest.raises(asyncio.TimeoutError):
+            await Deadline(0.05).run(slow())
+        assert cancelled.is_set()
+        assert await Deadline(1.0).run(asyncio.sleep(0, result="ok")) == "ok"
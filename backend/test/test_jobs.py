@@ -0,0 +1,139 @@
+import asyncio
+import pytest
+
+from src.api.jobs import JobQueue
+from src.api.limits import QueueFull
+
+
+class TestJobQueue:
+    """Тестирование очереди фоновых задач"""
+
+    @pytest.mark.asyncio
+    async def test_result(self):
+        queue = JobQueue(workers=2, max_queue=10, retention=60)
+        queue.start()
+        try:
+            async def handler():
+                return {"status": "not_found", "message": "Нет еды"}
+
+            job = queue.submit(handler)
+            assert queue.get(job.id) is job
+            assert await queue.wait(job, timeout=1)
+            assert job.status == "done"
+            assert job.result == {"status": "not_found", "message": "Нет еды"}
+            assert queue.get(job.id) is job
+        finally:
+            await queue.stop()
+
+    @pytest.mark.asyncio
+    async def test_worker_limit(self):
+        """Одновременно выполняется не больше задач, чем обработчиков"""
+        queue = JobQueue(workers=2, max_queue=10, retention=60)
+        queue.start()
+        state = {"active": 0, "max": 0}
+
+        async def handler():
+            state["active"] += 1
+            state["max"] = max(state["max"], state["active"])
+            await asyncio.sleep(0.02)
+            state["active"] -= 1
+            return {}
+
+        try:
+            jobs = [queue.submit(handler) for _ in range(6)]
+            for job in jobs:
+                assert await queue.wait(job, timeout=1)
+            assert state["max"] == 2
+        finally:
+            await queue.stop()
+
+    @pytest.mark.asyncio
+    async def test_queue_full(self):
+        queue = JobQueue(workers=1, max_queue=1, retention=60)
+        queue.start()
+        event = asyncio.Event()
+
+        async def handler():
+            await event.wait()
+            return {}
+
+        try:
+            queue.submit(handler)
+            await asyncio.sleep(0)
+            queue.submit(handler)
+            with pytest.raises(QueueFull):
+                queue.submit(handler)
+            event.set()
+        finally:
+            await queue.stop()
+
+    @pytest.mark.asyncio
+    async def test_queue_bytes(self):
+        """Общий размер данных задач ограничен; место освобождается по завершении задачи"""
+        queue = JobQueue(workers=1, max_queue=10, retention=60, max_bytes=100)
+        queue.start()
+        event = asyncio.Event()
+
+        async def handler():
+            await event.wait()
+            return {}
+
+        try:
+            first = queue.submit(handler, size=60)
+            queue.submit(handler, size=40)
+            with pytest.raises(QueueFull):
+                queue.submit(handler, size=1)
+            assert queue.stats()["bytes"] == 100
+            event.set()
+            assert await queue.wait(first, timeout=1)
+            await queue._queue.join()
+            assert queue.stats()["bytes"] == 0
+            queue.submit(handler, size=100)
+        finally:
+            await queue.stop()
+
+    @pytest.mark.asyncio
+    async def test_failed_handler(self):
+        """Исключение обработчика превращается в результат с ошибкой"""
+        queue = JobQueue(workers=1, max_queue=10, retention=60)
+
+        async def handler():
+            raise RuntimeError("boom")
+
+        try:
+            job = queue.submit(handler)
+            assert await queue.wait(job, timeout=1)
+            assert job.result["status"] == "error"
+        finally:
+            await queue.stop()
+
+    @pytest.mark.asyncio
+    async def test_retention(self):
+        """Готовый результат удаляется по истечении retention"""
+        queue = JobQueue(workers=1, max_queue=10, retention=0.05)
+
+        async def handler():
+            return {}
+
+        try:
+            job = queue.submit(handler)
+            await queue.wait(job, timeout=1)
+            assert queue.get(job.id) is job
+            await asyncio.sleep(0.1)
+            assert queue.get(job.id) is None
+        finally:
+            await queue.stop()
+
+    @pytest.mark.asyncio
+    async def test_wait_timeout(self):
+        queue = JobQueue(workers=1, max_queue=10, retention=60)
+
+        async def handler():
+            await asyncio.sleep(1)
+            return {}
+
+        try:
+            job = queue.submit(handler)
+            assert not await queue.wait(job, timeout=0.01)
+        finally:
+            await queue.stop()
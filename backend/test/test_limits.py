@@ -0,0 +1,214 @@
+from fastapi import Request
+from unittest.mock import patch
+import asyncio
+import pytest
+
+from src.api import limits
+from src.api.limits import TokenBucketLimiter, FairScheduler, QueueFull, client_key
+
+
+def make_request(headers: dict = None, host: str = "10.0.0.1") -> Request:
+    """Запрос с заданными заголовками и адресом клиента"""
+    return Request({
+        "type": "http",
+        "method": "POST",
+        "path": "/analyze/",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in (headers or {}).items()],
+        "client": (host, 5000),
+    })
+
+
+class TestClientKey:
+    """Тестирование определения ключа клиента"""
+
+    def test_ip(self):
+        assert client_key(make_request()) == "ip:10.0.0.1"
+
+    def test_device_id_ignored_by_default(self):
+        """Идентификатор устройства от клиента не заменяет IP: иначе лимиты обходятся сменой заголовка"""
+        with patch.object(limits, "TRUST_CLIENT_ID", False):
+            assert client_key(make_request({"X-Device-Id": "abc"})) == "ip:10.0.0.1"
+
+    def test_device_id_trusted(self):
+        with patch.object(limits, "TRUST_CLIENT_ID", True):
+            assert client_key(make_request({"X-Device-Id": "abc"})) == "device:abc"
+
+    def test_forwarded_for_ignored_by_default(self):
+        with patch.object(limits, "TRUST_FORWARDED_FOR", False):
+            assert client_key(make_request({"X-Forwarded-For": "1.2.3.4"})) == "ip:10.0.0.1"
+
+    def test_forwarded_for_trusted(self):
+        with patch.object(limits, "TRUST_FORWARDED_FOR", True):
+            assert client_key(make_request({"X-Forwarded-For": "1.2.3.4"})) == "ip:1.2.3.4"
+
+    def test_forwarded_for_spoofed_prefix(self):
+        """Адреса, которые клиент дописал в начало заголовка, не меняют ключ"""
+        with patch.object(limits, "TRUST_FORWARDED_FOR", True):
+            keys = {client_key(make_request({"X-Forwarded-For": f"evil-{number}, 203.0.113.7"})) for number in range(3)}
+        assert keys == {"ip:203.0.113.7"}
+
+    def test_forwarded_for_hops(self):
+        """За двумя прокси адрес клиента — второй с конца"""
+        with patch.object(limits, "TRUST_FORWARDED_FOR", True), patch.object(limits, "FORWARDED_FOR_HOPS", 2):
+            assert client_key(make_request({"X-Forwarded-For": "evil, 203.0.113.7, 10.0.0.2"})) == "ip:203.0.113.7"
+            # цепочка короче числа прокси — заголовок пришёл не через них
+            assert client_key(make_request({"X-Forwarded-For": "203.0.113.7"})) == "ip:10.0.0.1"
+
+
+class TestTokenBucketLimiter:
+    """Тестирование ограничения частоты"""
+
+    def test_burst(self):
+        limiter = TokenBucketLimiter(rate=1.0, burst=3)
+        assert [limiter.acquire("a") for _ in range(3)] == [0.0, 0.0, 0.0]
+        assert limiter.acquire("a") == pytest.approx(1.0, abs=0.05)
+
+    def test_keys_independent(self):
+        limiter = TokenBucketLimiter(rate=1.0, burst=1)
+        assert limiter.acquire("a") == 0.0
+        assert limiter.acquire("b") == 0.0
+        assert limiter.acquire("a") > 0
+
+    def test_refill(self):
+        limiter = TokenBucketLimiter(rate=100.0, burst=1)
+        assert limiter.acquire("a") == 0.0
+        assert limiter.acquire("a") > 0
+        asyncio.run(asyncio.sleep(0.03))
+        assert limiter.acquire("a") == 0.0
+
+    def test_retry_after(self):
+        limiter = TokenBucketLimiter(rate=0.5, burst=1)
+        limiter.acquire("a")
+        assert limiter.acquire("a") == pytest.approx(2.0, abs=0.05)
+
+
+class TestFairScheduler:
+    """Тестирование честной очереди"""
+
+    @pytest.mark.asyncio
+    async def test_capacity(self):
+        scheduler = FairScheduler(capacity=2, max_queue=100, max_queue_per_client=100)
+        state = {"active": 0, "max": 0}
+
+        async def job(key):
+            async with scheduler.slot(key):
+                state["active"] += 1
+                state["max"] = max(state["max"], state["active"])
+                await asyncio.sleep(0.01)
+                state["active"] -= 1
+
+        await asyncio.gather(*(job(f"c{i % 3}") for i in range(10)))
+        assert state["max"] == 2
+        assert scheduler.stats() == {"active": 0, "queued": 0, "capacity": 2}
+
+    @pytest.mark.asyncio
+    async def test_fair_order(self):
+        """Клиент с длинной очередью не задерживает запрос другого клиента"""
+        scheduler = FairScheduler(capacity=1, max_queue=100, max_queue_per_client=100)
+        order = []
+
+        async def job(key, index):
+            async with scheduler.slot(key):
+                order.append(f"{key}{index}")
+                await asyncio.sleep(0.01)
+
+        tasks = [asyncio.create_task(job("a", i)) for i in range(4)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(job("b", 0)))
+        await asyncio.gather(*tasks)
+        assert order.index("b0") <= 2
+
+    @pytest.mark.asyncio
+    async def test_weights(self):
+        """Клиент с большим весом обслуживается чаще"""
+        scheduler = FairScheduler(capacity=1, max_queue=100, max_queue_per_client=100)
+        order = []
+
+        async def job(key, weight):
+            async with scheduler.slot(key, weight=weight):
+                order.append(key)
+                await asyncio.sleep(0.001)
+
+        async with scheduler.slot("blocker"):
+            tasks = [asyncio.create_task(job("heavy", 2.0)) for _ in range(4)]
+            tasks += [asyncio.create_task(job("light", 1.0)) for _ in range(4)]
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        assert order[:3].count("heavy") >= 2
+
+    @pytest.mark.asyncio
+    async def test_queue_limits(self):
+        scheduler = FairScheduler(capacity=1, max_queue=3, max_queue_per_client=2)
+        async with scheduler.slot("a"):
+            tasks = [asyncio.create_task(scheduler.slot("b").__aenter__()) for _ in range(2)]
+            await asyncio.sleep(0)
+            with pytest.raises(QueueFull):
+                await scheduler.slot("b").__aenter__()
+            tasks.append(asyncio.create_task(scheduler.slot("c").__aenter__()))
+            await asyncio.sleep(0)
+            with pytest.raises(QueueFull):
+                await scheduler.slot("d").__aenter__()
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    @pytest.mark.asyncio
+    async def test_unlimited_waiters(self):
+        """limited=False — ожидание без лимитов очереди"""
+        scheduler = FairScheduler(capacity=1, max_queue=1, max_queue_per_client=1)
+        done = []
+
+        async def job(index):
+            async with scheduler.slot("a", limited=False):
+                done.append(index)
+
+        async with scheduler.slot("a"):
+            tasks = [asyncio.create_task(job(index)) for index in range(3)]
+            await asyncio.sleep(0)
+            assert scheduler.queued == 3
+            with pytest.raises(QueueFull):
+                await scheduler.slot("b").__aenter__()
+        await asyncio.gather(*tasks)
+        assert done == [0, 1, 2]
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter(self):
+        """Отменённый ожидающий не занимает слот"""
+        scheduler = FairScheduler(capacity=1, max_queue=10, max_queue_per_client=10)
+        async with scheduler.slot("a"):
+            waiter = asyncio.create_task(scheduler.slot("b").__aenter__())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+        assert scheduler.stats() == {"active": 0, "queued": 0, "capacity": 1}
+        async with scheduler.slot("c"):
+            assert scheduler.active == 1
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_leaves_queue(self):
+        """Отменённый ожидающий сразу освобождает место в очереди клиента"""
+        scheduler = FairScheduler(capacity=1, max_queue=10, max_queue_per_client=1)
+        async with scheduler.slot("a"):
+            waiter = asyncio.create_task(scheduler.slot("b").__aenter__())
+            await asyncio.sleep(0)
+            assert scheduler.queued == 1
+            waiter.cancel()
+            await asyncio.gather(waiter, return_exceptions=True)
+            assert scheduler.queued == 0
+            with pytest.raises(asyncio.TimeoutError):
+                async with scheduler.slot("b", timeout=0.01):
+                    pass
+            assert scheduler.queued == 0 and not scheduler._heap
+
+    @pytest.mark.asyncio
+    async def test_slot_timeout(self):
+        """Ожидание слота дольше timeout прерывается, ожидающий покидает очередь"""
+        scheduler = FairScheduler(capacity=1, max_queue=10, max_queue_per_client=10)
+        async with scheduler.slot("a"):
+            with pytest.raises(asyncio.TimeoutError):
+                async with scheduler.slot("b", timeout=0.05):
+                    pass
+        async with scheduler.slot("c", timeout=0.05):
+            assert scheduler.active == 1
+        assert scheduler.stats() == {"active": 0, "queued": 0, "capacity": 1}
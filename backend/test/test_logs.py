@@ -0,0 +1,78 @@
+import logging
+import json
+
+from src.api.logs import JsonFormatter, RequestIdFilter, request_id_var, setup_logging, stop_logging
+
+
+def make_record(msg: str, *args, **extra) -> logging.LogRecord:
+    record = logging.LogRecord("api.test", logging.INFO, __file__, 1, msg, args, None)
+    for key, value in extra.items():
+        setattr(record, key, value)
+    return record
+
+
+class TestJsonFormatter:
+    """Тестирование форматирования записей в JSON"""
+
+    def test_fields(self):
+        """Сообщение собирается из аргументов, поля extra и идентификатор запроса попадают в JSON"""
+        record = make_record("Модель %s: %d", "lite", 3, status=200, request_id="abc")
+        data = json.loads(JsonFormatter().format(record))
+        assert data["message"] == "Модель lite: 3"
+        assert data["level"] == "INFO"
+        assert data["logger"] == "api.test"
+        assert data["request_id"] == "abc"
+        assert data["status"] == 200
+        assert "args" not in data and "msg" not in data
+
+    def test_exception(self):
+        """Трассировка исключения выводится отдельным полем"""
+        try:
+            raise ValueError("сбой")
+        except ValueError:
+            record = logging.LogRecord("api", logging.ERROR, __file__, 1, "ошибка", None, __import__("sys").exc_info())
+        data = json.loads(JsonFormatter().format(record))
+        assert "ValueError: сбой" in data["exc_info"]
+
+
+class TestRequestIdFilter:
+    """Тестирование идентификатора запроса"""
+
+    def test_context(self):
+        """Идентификатор берётся из контекста, по умолчанию — прочерк"""
+        record = make_record("x")
+        RequestIdFilter().filter(record)
+        assert record.request_id == "-"
+
+        token = request_id_var.set("req-1")
+        try:
+            RequestIdFilter().filter(record)
+        finally:
+            request_id_var.reset(token)
+        assert record.request_id == "req-1"
+
+
+class TestSetupLogging:
+    """Тестирование очереди логов и фоновой записи"""
+
+    def test_writes_json_lines(self, tmp_path):
+        """Записи пишутся в файл фоновым потоком строками JSON с идентификатором запроса"""
+        path = tmp_path / "api.log"
+        try:
+            setup_logging("INFO", str(path), "json")
+            token = request_id_var.set("req-42")
+            try:
+                logging.getLogger("api.test").info("готово %s", "ok", extra={"duration_ms": 1.5})
+                logging.getLogger("api.test").debug("не попадёт %s", "в лог")
+            finally:
+                request_id_var.reset(token)
+        finally:
+            stop_logging()
+            setup_logging()
+
+        lines = path.read_text(encoding="utf-8").splitlines()
+        assert len(lines) == 1
+        data = json.loads(lines[0])
+        assert data["message"] == "готово ok"
+        assert data["request_id"] == "req-42"
+        assert data["duration_ms"] == 1.5
@@ -0,0 +1,80 @@
+from unittest.mock import patch
+import pytest
+
+from src.api import matching
+from src.api.matching import NameMatcher, Match, normalize_text, stem, name_tokens, trigrams, best_match
+
+NAMES = [
+    "Гречка отварная", "Гречка с молоком", "Гречка", "Гречневая каша", "Каша гречневая на воде",
+    "Рис отварной", "Яблоко печёное", "Сок яблочный", "Курица жареная", "Куриная грудка запеченная",
+]
+
+
+class TestNormalization:
+    """Тестирование нормализации названий"""
+
+    def test_normalize_text(self):
+        assert normalize_text("Яблоко, печёное (с мёдом)!") == "яблоко печеное с медом"
+
+    @pytest.mark.parametrize("word, expected", [
+        ("гречка", "гречк"), ("варёная", "варён"), ("яблоки", "яблок"), ("сок", "сок"), ("рис", "рис")
+    ])
+    def test_stem(self, word, expected):
+        assert stem(word) == expected
+
+    def test_tokens(self):
+        """Приставки и суффиксы причастий отбрасываются, служебные слова пропускаются"""
+        assert name_tokens("Гречка варёная") == name_tokens("гречка отварная") == ["гречк", "вар"]
+        assert name_tokens("Гречка с молоком") == ["гречк", "молок"]
+        assert name_tokens("!!!") == []
+
+    def test_trigrams(self):
+        assert trigrams(["сок"]) == [" со", "ок ", "сок"]
+
+
+class TestNameMatcher:
+    """Тестирование ранжирования названий"""
+
+    @pytest.fixture(params=["numpy", "python"])
+    def matcher(self, request):
+        """Одинаковые результаты с numpy и без него"""
+        if request.param == "python":
+            with patch.object(matching, "np", None):
+                yield NameMatcher(NAMES)
+        else:
+            yield NameMatcher(NAMES)
+
+    def test_exact(self, matcher):
+        assert matcher.rank("каша гречневая")[0] == Match("Гречневая каша", 1.0)
+        assert matcher.rank("яблоко печеное")[0] == Match("Яблоко печёное", 1.0)
+
+    @pytest.mark.parametrize("query, expected", [
+        ("гречка варёная", "Гречка отварная"),
+        ("куриная грудка печёная", "Куриная грудка запеченная"),
+        ("курица", "Курица жареная"),
+    ])
+    def test_word_forms(self, matcher, query, expected):
+        assert matcher.rank(query)[0].name == expected
+
+    def test_order_and_limit(self, matcher):
+        matches = matcher.rank("гречка", limit=3, threshold=0)
+        assert [match.name for match in matches][0] == "Гречка"
+        assert len(matches) == 3
+        assert matches == sorted(matches, key=lambda match: -match.score)
+
+    def test_threshold(self, matcher):
+        assert matcher.rank("курица", threshold=0.99) == []
+        assert matcher.rank("шоколад") == []
+        assert matcher.rank("") == []
+
+    def test_add(self, matcher):
+        assert not matcher.add("Гречка")
+        assert not matcher.add("...")
+        assert matcher.add("Шоколад горький")
+        assert matcher.rank("горький шоколад")[0] == Match("Шоколад горький", 1.0)
+        assert len(matcher) == len(NAMES) + 1 and "Шоколад горький" in matcher
+
+
+def test_best_match():
+    assert best_match("рис отварной", NAMES) == Match("Рис отварной", 1.0)
+    assert best_match("шоколад", NAMES) is None
@@ -0,0 +1,92 @@
+import pytest
+
+from src.api.metrics import Counter, Gauge, Histogram, Registry
+
+
+class TestCounter:
+    """Тестирование счётчика"""
+
+    def test_inc_and_render(self):
+        """Значения по меткам суммируются и выводятся в формате Prometheus"""
+        counter = Counter("requests_total", "Запросы", ("status",))
+        counter.inc("ok")
+        counter.inc("ok", amount=2)
+        counter.inc("error")
+        assert counter.value("ok") == 3
+        lines = counter.render()
+        assert lines[0] == "# HELP requests_total Запросы"
+        assert lines[1] == "# TYPE requests_total counter"
+        assert 'requests_total{status="ok"} 3' in lines
+        assert 'requests_total{status="error"} 1' in lines
+
+    def test_wrong_labels(self):
+        """Неверное число меток — ошибка"""
+        counter = Counter("requests_total", "Запросы", ("status",))
+        with pytest.raises(ValueError):
+            counter.inc()
+
+    def test_label_escaping(self):
+        """Кавычки и переводы строк в метках экранируются"""
+        counter = Counter("c", "c", ("name",))
+        counter.inc('a"b\nc')
+        assert 'c{name="a\\"b\\nc"} 1' in counter.render()
+
+
+class TestGauge:
+    """Тестирование датчика"""
+
+    def test_track(self):
+        """track увеличивает значение на время блока и возвращает его обратно"""
+        gauge = Gauge("in_flight", "В работе", ("operation",))
+        with gauge.track("gemini"):
+            assert gauge.value("gemini") == 1
+            with gauge.track("gemini"):
+                assert gauge.value("gemini") == 2
+        assert gauge.value("gemini") == 0
+
+    def test_track_on_exception(self):
+        """Значение возвращается и при исключении"""
+        gauge = Gauge("in_flight", "В работе", ("operation",))
+        with pytest.raises(RuntimeError):
+            with gauge.track("gemini"):
+                raise RuntimeError()
+        assert gauge.value("gemini") == 0
+        assert "# TYPE in_flight gauge" in gauge.render()
+
+
+class TestHistogram:
+    """Тестирование гистограммы"""
+
+    def test_buckets_are_cumulative(self):
+        """Корзины накопительные, +Inf равна количеству наблюдений"""
+        histogram = Histogram("latency_seconds", "Задержка", ("stage",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe("read", value=value)
+        lines = histogram.render()
+        assert 'latency_seconds_bucket{stage="read",le="0.1"} 2' in lines
+        assert 'latency_seconds_bucket{stage="read",le="1"} 3' in lines
+        assert 'latency_seconds_bucket{stage="read",le="+Inf"} 4' in lines
+        assert 'latency_seconds_sum{stage="read"} 3.65' in lines
+        assert 'latency_seconds_count{stage="read"} 4' in lines
+
+    def test_time(self):
+        """time записывает одно наблюдение за блок"""
+        histogram = Histogram("latency_seconds", "Задержка")
+        with histogram.time():
+            pass
+        assert histogram.count() == 1
+        assert "latency_seconds_count 1" in histogram.render()
+
+
+class TestRegistry:
+    """Тестирование реестра"""
+
+    def test_render(self):
+        """Реестр выводит все метрики, текст заканчивается переводом строки"""
+        registry = Registry()
+        registry.register(Counter("a_total", "A")).inc()
+        registry.register(Gauge("b", "B")).set(value=5)
+        text = registry.render()
+        assert "a_total 1\n" in text
+        assert "b 5\n" in text
+        assert text.endswith("\n")
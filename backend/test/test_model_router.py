@@ -0,0 +1,121 @@
+from unittest.mock import patch
+import pytest
+
+from src.api.model_router import ModelRouter, classify_error
+
+
+class FakeAPIError(Exception):
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class TestClassifyError:
+    """Тестирование классификации ошибок Gemini"""
+
+    @pytest.mark.parametrize("err, kind", [
+        (FakeAPIError(429, "RESOURCE_EXHAUSTED"), "quota"),
+        (Exception("429 RESOURCE_EXHAUSTED. quota exceeded"), "quota"),
+        (FakeAPIError(400, "INVALID_ARGUMENT"), "invalid"),
+        (Exception("400 INVALID_ARGUMENT"), "invalid"),
+        (FakeAPIError(503, "UNAVAILABLE"), "error"),
+        (RuntimeError("connection reset"), "error"),
+    ])
+    def test_classify(self, err, kind):
+        assert classify_error(err) == kind
+
+
+class TestModelRouter:
+    """Тестирование маршрутизации по моделям"""
+
+    @pytest.fixture
+    def router(self):
+        return ModelRouter(["main", "lite", "spare"], failure_threshold=2, open_seconds=30,
+                           quota_cooldown=60, alpha=0.5, error_rate_threshold=0.6)
+
+    def test_priority_order(self, router):
+        assert router.candidates() == ["main", "lite", "spare"]
+
+    def test_quota_skips_model(self, router):
+        """Модель с исчерпанной квотой пропускается до конца паузы"""
+        router.record_failure("main", "quota", 0.1)
+        assert router.candidates() == ["lite", "spare"]
+        assert not router.quota_exhausted()
+        with patch("src.api.model_router.time.monotonic", return_value=10 ** 9):
+            assert router.candidates()[0] == "main"
+
+    def test_all_quota_exhausted(self, router):
+        for model in ("main", "lite", "spare"):
+            router.record_failure(model, "quota", 0.1)
+        assert router.candidates() == []
+        assert router.quota_exhausted()
+
+    def test_circuit_opens_after_failures(self, router):
+        router.record_failure("main", "error", 1.0)
+        assert "main" in router.candidates()
+        router.record_failure("main", "error", 1.0)
+        assert "main" not in router.candidates()
+
+    def test_invalid_request_ignored(self, router):
+        """Неверный запрос не считается ошибкой модели"""
+        for _ in range(3):
+            assert not router.record_failure("main", "invalid", 0.1)
+        assert router.candidates() == ["main", "lite", "spare"]
+        state = {item["name"]: item for item in router.snapshot()}["main"]
+        assert (state["failures"], state["error_rate"], state["last_error"]) == (0, 0.0, "invalid")
+
+    def test_half_open(self, router):
+        """После паузы разрешается пробный запрос: ошибка снова размыкает цепь, успех замыкает"""
+        router.record_failure("main", "error", 1.0)
+        router.record_failure("main", "error", 1.0)
+        with patch("src.api.model_router.time.monotonic", return_value=10 ** 9):
+            assert "main" in router.candidates()
+            router.record_failure("main", "error", 1.0)
+            assert "main" not in router.candidates()
+        with patch("src.api.model_router.time.monotonic", return_value=10 ** 10):
+            router.record_success("main", 1.0)
+            router.record_failure("main", "error", 1.0)
+            assert "main" in router.candidates()
+
+    def test_single_probe(self, router):
+        """Полуоткрытая модель отдаёт только один пробный запрос, пока он не завершится"""
+        router.record_failure("main", "error", 1.0)
+        router.record_failure("main", "error", 1.0)
+        with patch("src.api.model_router.time.monotonic", return_value=10 ** 9):
+            assert router.acquire("main")
+            assert not router.acquire("main")
+            assert "main" not in router.candidates()
+            router.release("main")
+            assert router.acquire("main")
+            router.record_success("main", 1.0)
+            assert router.acquire("main") and router.acquire("main")
+
+    def test_error_rate_demotes(self, router):
+        """Модель с высокой долей ошибок пробуется последней"""
+        router.record_failure("main", "error", 1.0)
+        router.record_success("main", 1.0)
+        router.record_failure("main", "error", 1.0)
+        router.record_success("main", 1.0)
+        router.record_failure("main", "error", 1.0)
+        assert router.candidates() == ["lite", "spare", "main"]
+
+    def test_latency_ewma(self, router):
+        router.record_success("lite", 2.0)
+        router.record_success("lite", 4.0)
+        state = {item["name"]: item for item in router.snapshot()}["lite"]
+        assert state["latency_ewma"] == pytest.approx(3.0)
+        assert state["requests"] == 2
+        assert state["error_rate"] == 0.0
+
+    def test_snapshot(self, router):
+        router.record_failure("spare", "quota", 0.5)
+        snapshot = router.snapshot()
+        assert [item["name"] for item in snapshot] == ["main", "lite", "spare"]
+        assert snapshot[2]["available"] is False
+        assert snapshot[2]["quota_exhausted_for"] > 0
+        assert snapshot[2]["last_error"] == "quota"
+
+    def test_reset(self, router):
+        router.record_failure("main", "quota", 0.1)
+        router.reset()
+        assert router.candidates() == ["main", "lite", "spare"]
@@ -0,0 +1,110 @@
+import json
+import pytest
+
+from src.api.nutrition_db import NutritionIndex, parse_food_info, median_nutrients, main
+
+
+class TestParsing:
+    """Тестирование разбора строки info"""
+
+    @pytest.mark.parametrize("info, result", [
+        ("47 ккал, Б 0.4, Ж 0.4, У 9.8", {"calories": 47.0, "proteins": 0.4, "fats": 0.4, "carbohydrates": 9.8}),
+        ("315 ккал, Б 20, Ж 25", {"calories": 315.0, "proteins": 20.0, "fats": 25.0, "carbohydrates": 0.0}),
+        ("", {"calories": 0.0, "proteins": 0.0, "fats": 0.0, "carbohydrates": 0.0}),
+    ])
+    def test_parse_food_info(self, info, result):
+        assert parse_food_info(info) == result
+
+    def test_parse_invalid(self):
+        with pytest.raises(ValueError):
+            parse_food_info("много ккал")
+
+    def test_median(self):
+        samples = [
+            {"calories": 40.0, "proteins": 0.2, "fats": 0.1, "carbohydrates": 9.0},
+            {"calories": 55.0, "proteins": 0.6, "fats": 0.7, "carbohydrates": 10.6},
+        ]
+        assert median_nutrients(samples) == {
+            "calories": 47.5, "proteins": 0.4, "fats": 0.4, "carbohydrates": 9.8, "weight": 100.0
+        }
+        assert median_nutrients([]) is None
+
+
+class TestNutritionIndex:
+    """Тестирование локального индекса"""
+
+    @pytest.fixture
+    def index(self, tmp_path):
+        index = NutritionIndex(str(tmp_path / "nutrition.db"))
+        yield index
+        index.close()
+
+    def test_lookup_by_word_set(self, index):
+        """Поиск не зависит от регистра и порядка слов"""
+        index.add_foods([("Шашлык свиной", "315 ккал, Б 20, Ж 25, У 1.5")])
+        assert index.lookup("свиной шашлык") == {
+            "calories": 315.0, "proteins": 20.0, "fats": 25.0, "carbohydrates": 1.5, "weight": 100.0
+        }
+        assert index.lookup("шашлык") is None
+
+    def test_match(self, index):
+        """Нечёткий поиск находит формы слов и написание через "ё" """
+        index.add_foods([("Гречка отварная", "110 ккал, Б 4.2, Ж 1.1, У 21.3"), ("Рис", "116 ккал, Б 2.2, Ж 0.5, У 24.9")])
+        result = index.match("гречка варёная", threshold=0.6)
+        assert result["matched_name"] == "Гречка отварная"
+        assert result["calories"] == 110.0 and 0.6 <= result["score"] < 1
+        assert index.match("курица") is None
+
+    def test_match_sees_new_foods(self, index):
+        """Добавленные после первого поиска продукты тоже находятся"""
+        assert index.match("печёное яблоко") is None
+        index.add_foods([("Яблоко печеное", "66 ккал, Б 0.5, Ж 0.4, У 14.7")])
+        assert index.match("печёное яблоко")["matched_name"] == "Яблоко печеное"
+
+    def test_names(self, index):
+        """Одно название и медианные КБЖУ на каждый набор слов"""
+        index.add_foods([("Вода", "0 ккал, У 0"), ("вода", "10 ккал, У 2.5"), ("Рис", "116 ккал")])
+        assert sorted(index.names()) == [
+            ("Вода", {"calories": 5.0, "proteins": 0.0, "fats": 0.0, "carbohydrates": 1.25, "weight": 100.0}),
+            ("Рис", {"calories": 116.0, "proteins": 0.0, "fats": 0.0, "carbohydrates": 0.0, "weight": 100.0}),
+        ]
+
+    def test_duplicates_ignored(self, index):
+        assert index.add_foods([("Вода", "0 ккал"), ("Вода", "0 ккал")]) == 1
+        assert index.add_foods([("Вода", "0 ккал")]) == 0
+
+    def test_medians_updated(self, index):
+        """Медиана пересчитывается при добавлении продуктов"""
+        index.add_foods([("Вода", "0 ккал, У 0")])
+        index.add_foods([("вода", "10 ккал, У 2.5")])
+        assert index.lookup("вода")["calories"] == 5.0
+        assert index.lookup("вода")["carbohydrates"] == 1.25
+
+    def test_bad_rows_skipped(self, index):
+        assert index.add_foods([("", "1 ккал"), ("Сок", ""), ("Чай", "x ккал")]) == 0
+        assert len(index) == 0
+
+    def test_import_files(self, index, tmp_path):
+        """Импорт выгрузок CSV и JSONL"""
+        csv_path = tmp_path / "foods.csv"
+        csv_path.write_text('name,info\nЯблоко,"47 ккал, Б 0.4, Ж 0.4, У 9.8"\n', encoding="utf-8")
+        jsonl_path = tmp_path / "foods.jsonl"
+        jsonl_path.write_text(
+            json.dumps({"name": "Груша", "info": "42 ккал, Б 0.4, Ж 0.3, У 10.3"}, ensure_ascii=False) + "\n",
+            encoding="utf-8"
+        )
+        assert index.import_file(str(csv_path)) == 1
+        assert index.import_file(str(jsonl_path)) == 1
+        assert index.lookup("яблоко")["calories"] == 47.0
+        assert index.lookup("груша")["carbohydrates"] == 10.3
+
+    def test_cli_import(self, tmp_path, capsys):
+        """Импорт через командную строку"""
+        csv_path = tmp_path / "foods.csv"
+        csv_path.write_text('name,info\nЯблоко,"47 ккал, Б 0.4, Ж 0.4, У 9.8"\n', encoding="utf-8")
+        db_path = tmp_path / "cli.db"
+        main(["import", str(csv_path), "--db", str(db_path)])
+        assert "Названий в индексе: 1" in capsys.readouterr().out
+        index = NutritionIndex(str(db_path))
+        assert index.lookup("яблоко") is not None
+        index.close()
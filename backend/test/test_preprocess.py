@@ -0,0 +1,230 @@
+from PIL import Image, UnidentifiedImageError
+from pathlib import Path
+from unittest.mock import patch
+from io import BytesIO
+import pytest
+
+from src.api import preprocess
+from src.api.preprocess import (
+    PreparedImage, ImageSizeError, preprocess_image, run_preprocess, read_image_header, passthrough_image
+)
+
+IMAGE_DIR = Path(__file__).parent / "../src/image"
+
+
+def encode(image: Image.Image, format_: str = "JPEG", **params) -> bytes:
+    """Кодирует изображение в байты"""
+    buf = BytesIO()
+    image.save(buf, format=format_, **params)
+    return buf.getvalue()
+
+
+class TestPreprocessImage:
+    """Тестирование предобработки изображения"""
+
+    def test_downscale(self):
+        """Длинная сторона уменьшается до max_edge, исходный размер сохраняется"""
+        contents = encode(Image.new("RGB", (2000, 1000), color=(10, 200, 30)))
+        prepared = preprocess_image(contents, max_edge=512, image_format="JPEG", quality=80)
+        assert prepared.size == (2000, 1000)
+        assert prepared.mime_type == "image/jpeg"
+        with Image.open(BytesIO(prepared.data)) as result:
+            assert result.format == "JPEG"
+            assert max(result.size) == 512
+        assert len(prepared.data) < len(contents)
+
+    def test_small_image_not_upscaled(self):
+        prepared = preprocess_image(encode(Image.new("RGB", (300, 200))), max_edge=1024)
+        with Image.open(BytesIO(prepared.data)) as result:
+            assert result.size == (300, 200)
+
+    def test_exif_orientation(self):
+        """Изображение поворачивается согласно EXIF"""
+        image = Image.new("RGB", (400, 200))
+        exif = Image.Exif()
+        exif[0x0112] = 6  # поворот на 90°
+        prepared = preprocess_image(encode(image, exif=exif), max_edge=1024)
+        with Image.open(BytesIO(prepared.data)) as result:
+            assert result.size == (200, 400)
+
+    @pytest.mark.parametrize("mode", ["RGBA", "P", "L"])
+    def test_modes_converted(self, mode):
+        """Изображения с прозрачностью и палитрой перекодируются в RGB"""
+        image = Image.new("RGB", (200, 200), color=(100, 150, 200)).convert(mode)
+        prepared = preprocess_image(encode(image, "PNG"), max_edge=1024, image_format="JPEG")
+        with Image.open(BytesIO(prepared.data)) as result:
+            assert result.mode == "RGB"
+
+    def test_webp_output(self):
+        prepared = preprocess_image(encode(Image.new("RGB", (200, 200))), image_format="WEBP")
+        assert prepared.mime_type == "image/webp"
+        with Image.open(BytesIO(prepared.data)) as result:
+            assert result.format == "WEBP"
+
+    def test_timings(self):
+        prepared = preprocess_image((IMAGE_DIR / "1.jpg").resolve().read_bytes())
+        assert set(prepared.timings) == {"decode", "resize", "encode"}
+        assert all(value >= 0 for value in prepared.timings.values())
+
+    def test_corrupted(self):
+        with pytest.raises(UnidentifiedImageError):
+            preprocess_image(b"not an image")
+
+    @pytest.mark.parametrize("size, message", [
+        ((3000, 200), "Изображение слишком длинное или слишком широкое"),
+        ((200, 50), "Изображение слишком короткое или слишком узкое"),
+    ])
+    def test_size_checked_before_decode(self, size, message):
+        """Недопустимые размеры отклоняются по заголовку, изображение не декодируется"""
+        contents = encode(Image.new("RGB", size))
+        with patch.object(Image.Image, "load") as load, pytest.raises(ImageSizeError, match=message):
+            preprocess_image(contents)
+        load.assert_not_called()
+
+    def test_to_part(self):
+        prepared = preprocess_image(encode(Image.new("RGB", (200, 200))))
+        part = prepared.to_part()
+        assert part.inline_data.data == prepared.data
+        assert part.inline_data.mime_type == "image/jpeg"
+
+
+def exif(orientation: int) -> bytes:
+    """Блок EXIF с тегом Orientation"""
+    data = Image.Exif()
+    data[0x0112] = orientation
+    return data.tobytes()
+
+
+class TestImageHeader:
+    """Тестирование чтения размеров из заголовка файла"""
+    IMAGE = Image.new("RGB", (321, 123), color=(10, 200, 30))
+
+    @pytest.mark.parametrize("format_, params, mime_type", [
+        ("JPEG", {}, "image/jpeg"),
+        ("JPEG", {"progressive": True}, "image/jpeg"),
+        ("JPEG", {"exif": exif(1)}, "image/jpeg"),
+        ("PNG", {}, "image/png"),
+        ("WEBP", {}, "image/webp"),
+        ("WEBP", {"lossless": True}, "image/webp"),
+    ])
+    def test_size(self, format_, params, mime_type):
+        header = read_image_header(encode(self.IMAGE, format_, **params))
+        assert header == (mime_type, 321, 123, False)
+
+    def test_webp_extended(self):
+        """WebP с прозрачностью (VP8X)"""
+        assert read_image_header(encode(self.IMAGE.convert("RGBA"), "WEBP")) == ("image/webp", 321, 123, False)
+
+    def test_sample_images(self):
+        sizes = {name: read_image_header((IMAGE_DIR / name).resolve().read_bytes())[1:3] for name in ("1.jpg", "3.webp")}
+        assert sizes == {"1.jpg": (960, 1280), "3.webp": (1280, 720)}
+
+    @pytest.mark.parametrize("contents", [
+        encode(IMAGE, "JPEG", exif=exif(6)),
+        encode(IMAGE, "WEBP", exif=exif(6)),
+        encode(IMAGE.convert("CMYK"), "JPEG"),
+        encode(IMAGE, "WEBP", save_all=True, append_images=[Image.new("RGB", (321, 123))], duration=100),
+    ])
+    def test_needs_decode(self, contents):
+        """Поворот по EXIF, CMYK и анимация требуют декодирования"""
+        assert read_image_header(contents).needs_decode
+
+    @pytest.mark.parametrize("contents", [b"", b"\xff\xd8\xff", b"RIFF\x00\x00\x00\x00WEBP", b"GIF89a", b"not an image"])
+    def test_unknown(self, contents):
+        assert read_image_header(contents) is None
+
+
+class TestPassthrough:
+    """Тестирование отправки файла без декодирования"""
+
+    def test_passthrough(self):
+        contents = encode(Image.new("RGB", (300, 200)), "PNG")
+        prepared = passthrough_image(contents, max_edge=512)
+        assert prepared.data == contents
+        assert (prepared.mime_type, prepared.size, prepared.dhash) == ("image/png", (300, 200), None)
+        assert set(prepared.timings) == {"header", "verify"}
+
+    @pytest.mark.parametrize("size, max_size", [((600, 200), 10 ** 6), ((300, 200), 100), ((300, 200), 0)])
+    def test_limits(self, size, max_size):
+        """Файл больше max_edge или max_size предобрабатывается, max_size=0 отключает отправку как есть"""
+        assert passthrough_image(encode(Image.new("RGB", size), "PNG"), max_edge=512, max_size=max_size) is None
+
+    @pytest.mark.parametrize("format_, zero_filled_detected", [("JPEG", True), ("PNG", True), ("WEBP", False)])
+    def test_corrupted(self, format_, zero_filled_detected):
+        """Обрезанный файл с верным заголовком не отправляется как есть; затёртый нулями —
+        если это видно по структуре (EOI у JPEG, CRC у PNG; у WebP контрольных сумм нет)"""
+        image = Image.linear_gradient("L").resize((300, 200)).convert("RGB")
+        contents = encode(image, format_)
+        assert passthrough_image(contents, max_edge=512) is not None
+        truncated = contents[:len(contents) // 2]
+        assert read_image_header(truncated) is not None
+        assert passthrough_image(truncated, max_edge=512) is None
+        zero_filled = truncated + bytes(len(contents) - len(truncated))
+        assert (passthrough_image(zero_filled, max_edge=512) is None) == zero_filled_detected
+
+    def test_not_decoded(self):
+        """Проверка целостности не декодирует изображение"""
+        contents = (IMAGE_DIR / "2.jpg").resolve().read_bytes()
+        with patch.object(Image, "open") as image_open:
+            assert passthrough_image(contents, max_size=len(contents)) is not None
+        image_open.assert_not_called()
+
+    def test_rotated(self):
+        assert passthrough_image(encode(Image.new("RGB", (300, 200)), exif=exif(6)), max_edge=512) is None
+
+
+class TestRunPreprocess:
+    """Тестирование выполнения предобработки вне event loop"""
+
+    @pytest.mark.asyncio
+    async def test_thread_fallback(self):
+        """Без пула процессов используется пул потоков"""
+        preprocess.stop_preprocess_pool()
+        prepared = await run_preprocess(encode(Image.new("RGB", (2000, 200))))
+        assert isinstance(prepared, PreparedImage)
+        assert {"decode", "preprocess"} <= set(prepared.timings)
+
+    @pytest.mark.asyncio
+    async def test_process_pool(self):
+        """Предобработка в пуле процессов"""
+        preprocess.start_preprocess_pool(workers=1)
+        try:
+            prepared = await run_preprocess((IMAGE_DIR / "1.jpg").resolve().read_bytes())
+            assert max(Image.open(BytesIO(prepared.data)).size) <= preprocess.IMAGE_MAX_EDGE
+        finally:
+            preprocess.stop_preprocess_pool()
+
+    @pytest.mark.asyncio
+    async def test_passthrough(self):
+        """Файл в пределах ограничений не передаётся в пул"""
+        contents = (IMAGE_DIR / "2.jpg").resolve().read_bytes()
+        prepared = await run_preprocess(contents)
+        assert prepared.data == contents
+        assert set(prepared.timings) == {"header", "verify", "preprocess"}
+
+    @pytest.mark.asyncio
+    async def test_corrupted_payload(self):
+        """Обрезанный файл с верным заголовком уходит в предобработку, и та сообщает об ошибке"""
+        contents = (IMAGE_DIR / "2.jpg").resolve().read_bytes()
+        with pytest.raises(OSError):
+            await run_preprocess(contents[:len(contents) // 2])
+
+    @pytest.mark.asyncio
+    async def test_process_pool_error(self):
+        """Ошибка декодирования в дочернем процессе передаётся вызывающему"""
+        preprocess.start_preprocess_pool(workers=1)
+        try:
+            with pytest.raises(UnidentifiedImageError):
+                await run_preprocess(b"not an image")
+        finally:
+            preprocess.stop_preprocess_pool()
+
+    @pytest.mark.asyncio
+    async def test_warm_pool(self):
+        """Прогрев запускает процессы пула до первого запроса"""
+        preprocess.start_preprocess_pool(workers=2)
+        try:
+            await preprocess.warm_preprocess_pool(workers=2)
+            assert len(preprocess._executor._processes) == 2
+        finally:
+            preprocess.stop_preprocess_pool()
@@ -0,0 +1,33 @@
+from unittest.mock import patch
+import json
+
+from src.api.responses import FastJSONResponse
+from src.api.schemas import NotFoundResponse, FoodResponseSearch, NutritionSearch
+
+
+class TestFastJSONResponse:
+    """Тестирование быстрого JSON-ответа"""
+
+    def test_model(self):
+        """Модель сериализуется без промежуточного словаря"""
+        model = FoodResponseSearch(food_name="яблоко", nutrition=NutritionSearch(
+            calories=47.0, proteins=0.4, fats=0.4, carbohydrates=9.8
+        ))
+        response = FastJSONResponse(model, headers={"X-Cache": "HIT"})
+        assert response.media_type == "application/json"
+        assert response.headers["X-Cache"] == "HIT"
+        assert json.loads(response.body) == model.model_dump(mode="json")
+
+    def test_enum_status(self):
+        assert json.loads(FastJSONResponse(NotFoundResponse(message="Нет")).body) == {
+            "status": "not_found", "message": "Нет"
+        }
+
+    def test_dict(self):
+        assert json.loads(FastJSONResponse({"a": [1, 2], "b": "текст"}).body) == {"a": [1, 2], "b": "текст"}
+
+    def test_without_orjson(self):
+        """Без orjson используется стандартный json"""
+        with patch("src.api.responses.orjson", None):
+            body = FastJSONResponse({"b": "текст", 1: 2}).body
+        assert body.decode("utf-8") == '{"b":"текст","1":2}'
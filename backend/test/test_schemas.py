@@ -238,6 +238,23 @@ class TestFoodResponseUnion:
         assert isinstance(obj, DangerResponse)
 
 
+class TestFoodBatchResponse:
+    """Тестирование FoodBatchResponse"""
+
+    def test_mixed_results(self):
+        response = FoodBatchResponse(results=[
+            NotFoundResponse(message="Нет еды"),
+            ErrorResponse(message="Ошибка"),
+            {"status": "success", "food_items": {}},
+        ])
+        assert isinstance(response.results[0], NotFoundResponse)
+        assert isinstance(response.results[1], ErrorResponse)
+        assert isinstance(response.results[2], FoodSuccessResponse)
+
+    def test_empty(self):
+        assert FoodBatchResponse(results=[]).results == []
+
+
 class TestNutritionSearch:
     """Тестирование NutritionSearch"""
     DATA = {
@@ -432,3 +449,40 @@ class TestFoodAPIResponseSearchUnion:
     def test_error_instance(self):
         obj = ErrorFoundResponseSearch()
         assert isinstance(obj, ErrorFoundResponseSearch)
+
+
+class TestResponseAdapters:
+    """Тестирование валидаторов ответов с выбором варианта по status"""
+
+    def test_variant_by_status(self):
+        """Вариант выбирается по status, а не первым подходящим"""
+        assert isinstance(food_response_adapter.validate_python({"status": "error", "message": "x"}), ErrorResponse)
+        assert isinstance(food_response_adapter.validate_python({"status": "not_found", "message": "x"}),
+                          NotFoundResponse)
+        danger = food_response_adapter.validate_python({"status": "danger", "message": "x", "food_items": {}})
+        assert isinstance(danger, DangerResponse)
+        assert danger.status == StatusEnum.danger
+
+    def test_json(self):
+        """Ответ разбирается прямо из JSON"""
+        data = b'{"status": "success", "food_items": {"\xd1\x87\xd0\xb0\xd0\xb9": {"proteins": 0, "fats": 0, ' \
+               b'"carbohydrates": 0, "water": 200, "weight": 200, "benefit_score": 3}}}'
+        result = food_response_adapter.validate_json(data)
+        assert isinstance(result, FoodSuccessResponse)
+        assert result.food_items["чай"].weight == 200
+
+    @pytest.mark.parametrize("data", [
+        {"message": "x"},
+        {"status": "unknown", "message": "x"},
+        {"status": "success", "message": "x"},
+    ])
+    def test_invalid(self, data):
+        """Без status, с неизвестным status или без полей своего варианта — ошибка"""
+        with pytest.raises(ValidationError):
+            food_response_adapter.validate_python(data)
+
+    def test_search(self):
+        result = search_response_adapter.validate_python({"status": "not_found"})
+        assert isinstance(result, NotFoundResponseSearch)
+        with pytest.raises(ValidationError):
+            search_response_adapter.validate_python({"status": "success", "message": "x"})
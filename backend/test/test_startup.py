@@ -0,0 +1,121 @@
+from unittest.mock import patch, MagicMock, AsyncMock
+import pytest
+import httpx
+
+from src.api import startup
+from src.api.startup import StartupProfile, warm_up, open_connections, import_profile
+
+
+class TestStartupProfile:
+    """Тестирование профиля запуска"""
+
+    def test_stage(self):
+        """Длительность этапа записывается, ошибка не прерывает прогрев"""
+        profile = StartupProfile()
+        with profile.stage("ok"):
+            pass
+        with profile.stage("broken"):
+            raise RuntimeError("нет сети")
+        report = profile.report()
+        assert set(report["stages_ms"]) == {"ok", "broken"}
+        assert report["errors"] == {"broken": "нет сети"}
+        assert report["ready"] is False
+
+    def test_reset(self):
+        profile = StartupProfile()
+        profile.record("imports", 1.0)
+        profile.ready = True
+        profile.reset()
+        assert profile.report() == {"ready": False, "stages_ms": {}, "errors": {}}
+
+
+class TestWarmUp:
+    """Тестирование прогрева воркера"""
+
+    @pytest.mark.asyncio
+    async def test_ready_after_warm_up(self):
+        """После прогрева воркер готов, клиенты созданы, этапы замерены"""
+        profile = StartupProfile()
+        with patch("src.api.startup.start_gemini_clients", new=AsyncMock()) as start_clients:
+            await warm_up(["key"], connections=False, profile=profile)
+        start_clients.assert_awaited_once_with(["key"])
+        assert profile.ready
+        assert profile.errors == {}
+        assert {"imports", "gemini_clients", "validators", "preprocess_pool", "warm_up"} <= set(profile.stages)
+        assert "connections" not in profile.stages
+
+    @pytest.mark.asyncio
+    async def test_failed_stage(self):
+        """Ошибка этапа попадает в отчёт, но воркер всё равно становится готовым"""
+        profile = StartupProfile()
+        with patch("src.api.startup.start_gemini_clients", new=AsyncMock()), \
+                patch("src.api.startup.warm_preprocess_pool", new=AsyncMock(side_effect=OSError("fork"))):
+            await warm_up(["key"], connections=False, profile=profile)
+        assert profile.ready
+        assert profile.errors == {"preprocess_pool": "fork"}
+
+
+class TestOpenConnections:
+    """Тестирование открытия соединений при прогреве"""
+
+    @staticmethod
+    def gemini_client(error: Exception) -> MagicMock:
+        client = MagicMock()
+        client.aio.models.get = AsyncMock(side_effect=error)
+        return client
+
+    @pytest.mark.asyncio
+    async def test_api_errors_count_as_opened(self):
+        """Ответ с ошибкой от сервера означает, что соединение открыто"""
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(405)))
+        gemini = self.gemini_client(ValueError("404 model not found"))
+        with patch("src.api.startup.get_http_client", return_value=http_client), \
+                patch("src.api.startup.get_gemini_client", return_value=gemini):
+            assert await open_connections(["key"]) == 2
+        gemini.aio.models.get.assert_awaited_once()
+        await http_client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_connection_failed(self):
+        def refuse(request):
+            raise httpx.ConnectError("refused", request=request)
+
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(refuse))
+        gemini = self.gemini_client(httpx.ConnectError("refused"))
+        with patch("src.api.startup.get_http_client", return_value=http_client), \
+                patch("src.api.startup.get_gemini_client", return_value=gemini):
+            assert await open_connections(["key"]) == 0
+        await http_client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_no_models(self):
+        """Без доступных моделей открывается только соединение с health-diet.ru"""
+        http_client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200)))
+        with patch("src.api.startup.get_http_client", return_value=http_client), \
+                patch.object(startup.model_router, "candidates", return_value=[]), \
+                patch("src.api.startup.get_gemini_client") as get_client:
+            assert await open_connections(["key"]) == 1
+        get_client.assert_not_called()
+        await http_client.aclose()
+
+
+class TestImportProfile:
+    """Тестирование профиля импорта"""
+
+    def test_import_profile(self):
+        total, modules = import_profile("src.api.config")
+        assert total > 0
+        names = [name for name, _ in modules]
+        assert "src.api.config" in names
+        assert [time for _, time in modules] == sorted((time for _, time in modules), reverse=True)
+
+    def test_import_error(self):
+        with pytest.raises(RuntimeError):
+            import_profile("src.api.missing_module")
+
+    def test_lazy_imports(self):
+        """Импорт приложения не загружает google.genai и numpy"""
+        _, modules = import_profile("src.api.api")
+        names = {name for name, _ in modules}
+        assert "google.genai" not in names
+        assert "numpy" not in names
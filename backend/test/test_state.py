@@ -0,0 +1,242 @@
+from contextlib import asynccontextmanager
+import asyncio
+import pytest
+
+from bench.fake_redis import start_fake_redis
+from src.api.state import SQLiteBackend, RedisBackend, StateBackend, create_state_backend, take_tokens, iter_bands
+from src.api.limits import TokenBucketLimiter
+from src.api.model_router import ModelRouter
+from src.api.cache import ImageResultCache, SearchCache
+from src.api.jobs import JobQueue
+from src.api.schemas import FoodSuccessResponse
+
+BACKENDS = ["sqlite", "redis"]
+
+
+@asynccontextmanager
+async def open_backend(kind: str, path):
+    """Хранилище заданного типа: файл SQLite во временной папке или локальный сервер Redis"""
+    if kind == "sqlite":
+        backend = SQLiteBackend(str(path / "state.db"), prefix="test:")
+        try:
+            yield backend
+        finally:
+            await backend.close()
+        return
+    server = await start_fake_redis()
+    port = server.sockets[0].getsockname()[1]
+    backend = RedisBackend(f"redis://127.0.0.1:{port}/0", prefix="test:")
+    try:
+        yield backend
+    finally:
+        await backend.close()
+        server.close()
+        await server.wait_closed()
+
+
+class BrokenBackend(StateBackend):
+    """Хранилище, которое всегда недоступно"""
+
+    async def get_many(self, keys):
+        raise ConnectionError("down")
+
+    async def set(self, key, value, ttl):
+        raise ConnectionError("down")
+
+    async def take_tokens(self, key, rate, burst, tokens=1.0):
+        raise ConnectionError("down")
+
+
+class TestHelpers:
+    """Тестирование вспомогательных функций"""
+
+    def test_take_tokens(self):
+        wait, bucket = take_tokens(None, 100.0, rate=1.0, burst=2, tokens=1)
+        assert wait == 0 and bucket == (1.0, 100.0)
+        wait, bucket = take_tokens(bucket, 100.0, rate=1.0, burst=2, tokens=2)
+        assert wait == pytest.approx(1.0) and bucket == (1.0, 100.0)
+        wait, bucket = take_tokens(bucket, 110.0, rate=1.0, burst=2, tokens=2)
+        assert wait == 0 and bucket == (0.0, 110.0)
+
+    def test_bands_cover_close_hashes(self):
+        """Хеши с расстоянием меньше числа частей совпадают хотя бы в одной части"""
+        value = 0x0123456789ABCDEF
+        other = value ^ (1 << 3) ^ (1 << 40) ^ (1 << 63)
+        assert set(iter_bands(value, 4)) & set(iter_bands(other, 4))
+        assert sum(1 for _ in iter_bands(value, 5)) == 5
+
+    def test_create_memory(self):
+        assert create_state_backend("memory") is None
+        with pytest.raises(ValueError):
+            create_state_backend("unknown")
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+class TestBackends:
+    """Тестирование общих хранилищ"""
+
+    @pytest.mark.asyncio
+    async def test_values(self, kind, tmp_path):
+        async with open_backend(kind, tmp_path) as backend:
+            await backend.set("a", b"1", 60)
+            assert await backend.get_many(["a", "b"]) == [b"1", None]
+            await backend.delete("a")
+            assert await backend.get("a") is None
+
+    @pytest.mark.asyncio
+    async def test_expiry(self, kind, tmp_path):
+        async with open_backend(kind, tmp_path) as backend:
+            await backend.set("a", b"1", 0.05)
+            await backend.add_member("s", "x", 0.05)
+            await asyncio.sleep(0.1)
+            assert await backend.get("a") is None
+            assert await backend.members_many(["s"]) == [set()]
+
+    @pytest.mark.asyncio
+    async def test_members(self, kind, tmp_path):
+        async with open_backend(kind, tmp_path) as backend:
+            await backend.add_member("s", "x", 60)
+            await backend.add_member("s", "y", 60)
+            assert await backend.members_many(["s", "t"]) == [{"x", "y"}, set()]
+
+    @pytest.mark.asyncio
+    async def test_take_tokens_concurrent(self, kind, tmp_path):
+        """Одновременные списания не превышают ёмкость корзины"""
+        async with open_backend(kind, tmp_path) as backend:
+            waits = await asyncio.gather(*(backend.take_tokens("bucket", 0.01, 3) for _ in range(8)))
+            assert sum(1 for wait in waits if wait == 0) == 3
+
+    @pytest.mark.asyncio
+    async def test_clear(self, kind, tmp_path):
+        async with open_backend(kind, tmp_path) as backend:
+            await backend.set("a", b"1", 60)
+            await backend.add_member("s", "x", 60)
+            await backend.clear()
+            assert await backend.get("a") is None
+            assert await backend.members_many(["s"]) == [set()]
+
+
+@pytest.mark.parametrize("kind", BACKENDS)
+class TestSharedComponents:
+    """Два воркера с общим хранилищем видят состояние друг друга"""
+
+    @pytest.mark.asyncio
+    async def test_rate_limit(self, kind, tmp_path):
+        async with open_backend(kind, tmp_path) as backend:
+            first, second = TokenBucketLimiter(rate=0.01, burst=2), TokenBucketLimiter(rate=0.01, burst=2)
+            first.backend = second.backend = backend
+            assert await first.aacquire("ip:1") == 0
+            assert await second.aacquire("ip:1") == 0
+            assert await first.aacquire("ip:1") > 0
+            assert await second.aacquire("ip:2") == 0
+
+    @pytest.mark.asyncio
+    async def test_model_quota(self, kind, tmp_path):
+        async with open_backend(kind, tmp_path) as backend:
+            first, second = ModelRouter(["main", "lite"]), ModelRouter(["main", "lite"])
+            first.backend = second.backend = backend
+            assert first.record_failure("main", "quota", 0.1)
+            await first.push("main")
+            await second.pull()
+            assert second.candidates() == ["lite"]
+
+    @pytest.mark.asyncio
+    async def test_model_circuit_closed(self, kind, tmp_path):
+        """Успешный ответ после размыкания замыкает цепь и в общем состоянии"""
+        async with open_backend(kind, tmp_path) as backend:
+            first = ModelRouter(["main", "lite"], failure_threshold=1)
+            first.backend = backend
+            assert first.record_failure("main", "error", 0.1)
+            await first.push("main")
+            assert first.record_success("main", 0.1)
+            await first.push("main")
+            second = ModelRouter(["main", "lite"])
+            second.backend = backend
+            await second.pull()
+            assert second.candidates() == ["main", "lite"]
+
+    @pytest.mark.asyncio
+    async def test_image_cache(self, kind, tmp_path):
+        async with open_backend(kind, tmp_path) as backend:
+            first, second = ImageResultCache(max_distance=4), ImageResultCache(max_distance=4)
+            first.backend = second.backend = backend
+            result = FoodSuccessResponse(food_items={})
+            await first.store("sha-a", 0b1011, result)
+
+            found, hit = await second.lookup("sha-a")
+            assert hit == "exact" and found == result
+            assert len(second) == 1
+
+            third = ImageResultCache(max_distance=4)
+            third.backend = backend
+            found, hit = await third.lookup("sha-b", 0b1001)
+            assert hit == "similar" and found == result
+            assert await third.lookup("sha-c", 0xFFFF0000) == (None, None)
+
+    @pytest.mark.asyncio
+    async def test_search_cache(self, kind, tmp_path):
+        async with open_backend(kind, tmp_path) as backend:
+            first, second = SearchCache(), SearchCache()
+            first.backend = second.backend = backend
+            calls = []
+
+            async def fetch(name):
+                calls.append(name)
+                return {"status": "success", "name": name}
+
+            assert await first.get_or_fetch("Яблоко", fetch) == {"status": "success", "name": "Яблоко"}
+            assert await second.get_or_fetch("яблоко", fetch) == {"status": "success", "name": "Яблоко"}
+            assert calls == ["Яблоко"]
+            assert second.peek("яблоко")[1] is True
+
+    @pytest.mark.asyncio
+    async def test_jobs(self, kind, tmp_path):
+        async with open_backend(kind, tmp_path) as backend:
+            first = JobQueue(workers=1, max_queue=10, retention=60)
+            second = JobQueue(workers=1, max_queue=10, retention=60, poll_interval=0.01)
+            first.backend = second.backend = backend
+            first.start()
+            event = asyncio.Event()
+
+            async def handler():
+                await event.wait()
+                return {"status": "not_found", "message": "Нет еды"}
+
+            try:
+                job = first.submit(handler)
+                await asyncio.sleep(0.05)
+                remote = await second.find(job.id)
+                assert remote is not None and remote.remote and remote.status == "running"
+                assert not await second.wait(remote, timeout=0.05)
+                event.set()
+                assert await second.wait(remote, timeout=2)
+                assert remote.result == {"status": "not_found", "message": "Нет еды"}
+                assert await second.find("missing") is None
+            finally:
+                await first.stop()
+
+
+class TestUnavailableBackend:
+    """При недоступном хранилище компоненты работают на локальном состоянии"""
+
+    @pytest.mark.asyncio
+    async def test_fallback(self):
+        limiter = TokenBucketLimiter(rate=0.01, burst=1)
+        limiter.backend = BrokenBackend()
+        assert await limiter.aacquire("ip:1") == 0
+        assert await limiter.aacquire("ip:1") > 0
+
+        cache = SearchCache()
+        cache.backend = BrokenBackend()
+
+        async def fetch(name):
+            return False
+
+        assert await cache.get_or_fetch("яблоко", fetch) is False
+
+        router = ModelRouter(["main"])
+        router.backend = BrokenBackend()
+        router.record_failure("main", "quota", 0.1)
+        await router.push("main")
+        await router.pull()
+        assert router.candidates() == []
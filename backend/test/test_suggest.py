@@ -0,0 +1,92 @@
+from src.api.suggest import SuggestIndex, Suggestion, load_suggestions, SHORT_PREFIX, MAX_SUGGESTIONS
+
+NUTRITION = {"calories": 110.0, "proteins": 4.2, "fats": 1.1, "carbohydrates": 21.3, "weight": 100.0}
+
+
+def names(suggestions):
+    return [item.name for item in suggestions]
+
+
+class TestSuggestIndex:
+    """Тестирование префиксного индекса подсказок"""
+
+    def test_prefix_of_any_word(self):
+        """Префикс подходит к началу любого слова названия"""
+        index = SuggestIndex()
+        index.add_many([("Гречка отварная", NUTRITION), ("Гречневая каша", None), ("Рис отварной", None)])
+        assert names(index.suggest("греч")) == ["Гречневая каша", "Гречка отварная"]
+        assert names(index.suggest("отвар")) == ["Рис отварной", "Гречка отварная"]
+        assert index.suggest("гречка")[0].nutrition == NUTRITION
+        assert index.suggest("курица") == []
+
+    def test_normalized(self):
+        """Регистр, ё и пунктуация не влияют на подсказки"""
+        index = SuggestIndex()
+        index.add("Свёкла, варёная")
+        assert names(index.suggest("СВЕКЛА В")) == ["Свёкла, варёная"]
+        assert names(index.suggest("варе")) == ["Свёкла, варёная"]
+        assert index.suggest("  ") == []
+
+    def test_popular_first(self):
+        """Успешные поиски поднимают название выше коротких"""
+        index = SuggestIndex()
+        index.add_many([("Яблоко", None), ("Яблоко печёное", None), ("Яблочный сок", None)])
+        assert names(index.suggest("ябл")) == ["Яблоко", "Яблочный сок", "Яблоко печёное"]
+        index.record_hit("яблоко печёное", NUTRITION)
+        index.record_hit("Яблочный пирог")
+        assert names(index.suggest("ябл"))[:2] == ["Яблоко печёное", "Яблочный пирог"]
+        assert names(index.suggest("яблочн")) == ["Яблочный пирог", "Яблочный сок"]
+        assert index.suggest("яблоко печ")[0].nutrition == NUTRITION
+
+    def test_query_variants_merged(self):
+        """Варианты запроса с другим порядком слов поднимают уже известное название, а не дублируют его"""
+        index = SuggestIndex()
+        index.add("Яблоко печёное")
+        index.record_hit("печеное  яблоко")
+        index.record_hit("ЯБЛОКО, печёное", NUTRITION)
+        assert len(index) == 1
+        assert index.suggest("печ")[0] == Suggestion("Яблоко печёное", NUTRITION, 2)
+
+    def test_short_and_long_prefix_agree(self):
+        """Заранее выбранные лучшие записи для коротких префиксов совпадают с полным перебором"""
+        index = SuggestIndex()
+        index.add_many((f"Сыр {number}", None) for number in range(300))
+        popular = range(0, 300, 7)
+        for number in popular:
+            index.record_hit(f"сыр {number}")
+
+        def expected(prefix):
+            found = [number for number in range(300) if f"сыр {number}".startswith(prefix)]
+            found.sort(key=lambda number: (number not in popular, len(str(number)), number))
+            return [f"Сыр {number}" for number in found[:MAX_SUGGESTIONS]]
+
+        assert len("сыр") <= SHORT_PREFIX < len("сыр 14")
+        assert names(index.suggest("сыр", limit=MAX_SUGGESTIONS)) == expected("сыр")
+        assert names(index.suggest("сыр 14", limit=MAX_SUGGESTIONS)) == expected("сыр 14")
+
+    def test_limits(self):
+        index = SuggestIndex(max_entries=2)
+        assert index.add("Груша") and index.add("груша")
+        assert index.add("Гранат")
+        assert not index.add("Грейпфрут")
+        assert len(index) == 2
+        assert len(index.suggest("гр", limit=1)) == 1
+        assert index.suggest("гр", limit=0) == []
+
+    def test_load_in_batches(self):
+        index = SuggestIndex()
+        assert load_suggestions(index, ((f"Продукт {number}", None) for number in range(25)), batch_size=10) == 25
+        assert len(index.suggest("продукт", limit=MAX_SUGGESTIONS)) == MAX_SUGGESTIONS
+        index.clear()
+        assert len(index) == 0 and index.suggest("прод") == []
+
+    def test_merge_keeps_order(self):
+        """Новые ключи вливаются в отсортированный массив: и вставкой немногих, и слиянием многих"""
+        index = SuggestIndex()
+        index.add_many((f"Продукт {number}", None) for number in range(1000))
+        index.add_many([("Гречка отварная", NUTRITION), ("Ячмень", None)])
+        index.add_many((f"Каша {number}", None) for number in range(500))
+        assert index._keys == sorted(index._keys)
+        assert names(index.suggest("отварная")) == ["Гречка отварная"]
+        assert names(index.suggest("ячмен")) == ["Ячмень"]
+        assert len(index.suggest("каша 4", limit=MAX_SUGGESTIONS)) == MAX_SUGGESTIONS
@@ -0,0 +1,133 @@
+from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi.testclient import TestClient
+from starlette.datastructures import Headers
+from io import BytesIO
+import pytest
+
+from src.api.uploads import UploadLimitMiddleware, read_upload, sniff_image_type, size_error_message
+
+JPEG_HEADER = b"\xff\xd8\xff\xe0" + b"\x00" * 16
+PNG_HEADER = b"\x89PNG\r\n\x1a\n" + b"\x00" * 16
+WEBP_HEADER = b"RIFF\x24\x00\x00\x00WEBPVP8 " + b"\x00" * 16
+
+
+def make_upload(data: bytes, content_type: str = "image/jpeg", size: int = None) -> UploadFile:
+    """UploadFile с заданным содержимым"""
+    return UploadFile(
+        file=BytesIO(data),
+        size=len(data) if size is None else size,
+        filename="test",
+        headers=Headers({"content-type": content_type})
+    )
+
+
+class TestSniff:
+    """Тестирование определения формата по сигнатуре"""
+
+    @pytest.mark.parametrize("header, mime_type", [
+        (JPEG_HEADER, "image/jpeg"),
+        (PNG_HEADER, "image/png"),
+        (WEBP_HEADER, "image/webp"),
+        (b"RIFF\x24\x00\x00\x00WAVEfmt ", None),
+        (b"GIF89a", None),
+        (b"", None),
+    ])
+    def test_sniff(self, header, mime_type):
+        assert sniff_image_type(header) == mime_type
+
+
+class TestReadUpload:
+    """Тестирование чтения загрузки"""
+
+    @pytest.mark.asyncio
+    async def test_read(self):
+        data = JPEG_HEADER + b"x" * 200_000
+        assert await read_upload(make_upload(data), max_size=1024 * 1024) == data
+
+    @pytest.mark.asyncio
+    async def test_content_type_checked_first(self):
+        upload = make_upload(JPEG_HEADER, content_type="text/plain")
+        with pytest.raises(HTTPException, match="Поддерживаются только JPEG, PNG и WebP"):
+            await read_upload(upload)
+        assert upload.file.tell() == 0
+
+    @pytest.mark.asyncio
+    async def test_known_size_rejected_before_read(self):
+        upload = make_upload(JPEG_HEADER + b"x" * 100, size=2 * 1024 * 1024)
+        with pytest.raises(HTTPException) as err:
+            await read_upload(upload, max_size=1024 * 1024)
+        assert err.value.detail == size_error_message(1024 * 1024)
+        assert upload.file.tell() == 0
+
+    @pytest.mark.asyncio
+    async def test_running_size_limit(self):
+        """Без известного размера чтение прерывается по превышении лимита"""
+        upload = make_upload(JPEG_HEADER + b"x" * (2 * 1024 * 1024))
+        upload.size = None
+        with pytest.raises(HTTPException) as err:
+            await read_upload(upload, max_size=1024 * 1024)
+        assert err.value.detail == size_error_message(1024 * 1024)
+        assert upload.file.tell() < 2 * 1024 * 1024
+
+    @pytest.mark.asyncio
+    async def test_signature_mismatch(self):
+        with pytest.raises(HTTPException, match="Невозможно обработать изображение"):
+            await read_upload(make_upload(b"not an image"))
+
+
+class TestUploadLimitMiddleware:
+    """Тестирование ограничения размера тела запроса"""
+    MAX_SIZE = 1024 * 1024
+
+    @pytest.fixture
+    def client(self):
+        app = FastAPI()
+        app.state.calls = 0
+
+        @app.post("/upload/")
+        async def upload(file: UploadFile = File(...)):
+            app.state.calls += 1
+            return {"size": len(await file.read())}
+
+        @app.post("/other/")
+        async def other(file: UploadFile = File(...)):
+            return {"size": len(await file.read())}
+
+        app.add_middleware(UploadLimitMiddleware, limits={"/upload/": self.MAX_SIZE})
+        client = TestClient(app)
+        client.app_state = app.state
+        return client
+
+    def test_within_limit(self, client):
+        response = client.post("/upload/", files={"file": ("a.jpg", b"x" * 1000, "image/jpeg")})
+        assert response.status_code == 200
+        assert response.json() == {"size": 1000}
+
+    def test_content_length_rejected(self, client):
+        """Слишком большой Content-Length отклоняется до вызова обработчика"""
+        response = client.post("/upload/", files={"file": ("a.jpg", b"x" * (2 * self.MAX_SIZE), "image/jpeg")})
+        assert response.status_code == 400
+        assert response.json()["detail"] == size_error_message(self.MAX_SIZE)
+        assert client.app_state.calls == 0
+
+    def test_chunked_body_rejected(self, client):
+        """Тело без Content-Length прерывается по превышении лимита"""
+        def body():
+            yield b"--boundary\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a.jpg\"\r\n"
+            yield b"Content-Type: image/jpeg\r\n\r\n"
+            for _ in range(40):
+                yield b"x" * 64 * 1024
+            yield b"\r\n--boundary--\r\n"
+
+        response = client.post(
+            "/upload/",
+            content=body(),
+            headers={"Content-Type": "multipart/form-data; boundary=boundary"}
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"] == size_error_message(self.MAX_SIZE)
+        assert client.app_state.calls == 0
+
+    def test_other_paths_unlimited(self, client):
+        response = client.post("/other/", files={"file": ("a.jpg", b"x" * (2 * self.MAX_SIZE), "image/jpeg")})
+        assert response.status_code == 200